@@ -41,4 +41,6 @@ MODULES
     ifcupdate
         Update attributes, properties and geometry of IFC objects. Preserves the GUID
         of the initial object
+    telemetry
+        Per-stage timers, counters and profiling of batch jobs as JSON lines records
 """
@@ -31,6 +31,16 @@ To create the IFC objects, you need an IFC file. Use ifcfile / IfcModelBuilder c
 create it. 
 
 MODULES / ClASSES
+    bulkbuilder / BulkElementBuilder
+        Create many IfcWall, IfcDoor and IfcColumn objects at once from arrays of
+        ordered corner points or dimensions and poses. Placements are computed
+        vectorized, entities are created without the IfcOpenShell API and each
+        batch shares one containment, material and property set relationship.
+        Doors are matched to their host walls with an R-tree of the wall boxes
+    geometry
+        Analytic box vertices of generated elements from their stored placement
+        matrix and dimensions, batched with NumPy. Tessellation is the fallback for
+        edited or non box-style geometry
     ifcolumn / IfcColumn
         Create IfcColumn objects with round or square profile
     ifcdoor / IfcDoor
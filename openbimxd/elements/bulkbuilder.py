@@ -0,0 +1,543 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+import numpy as np
+
+import ifcopenshell
+import ifcopenshell.guid
+from ifcopenshell.util import placement, unit
+from rtree import index as rtree_index
+
+from openbimxd.elements import geometry
+from openbimxd.ifcupdate.batchupdate import BatchUpdateIfcObjects
+
+
+class BulkElementBuilder:
+    """
+    A class to create many walls, doors and columns of an IfcModelBuilder at once
+    from arrays of reconstructed boxes. Placements and dimensions are computed
+    vectorized, entities are created directly instead of through the IfcOpenShell
+    API. Each batch is assigned to its building storeys, its material and property
+    set with one relationship each. Doors find their host wall through an R-tree
+    over the walls, see insert_doors().
+
+    Boxes are given either as ordered corner points like pystruct3d bbox objects,
+    shape (n, 8, 3), or as origins of the first corner, dimensions (length, width,
+    height) and angles around the Z axis. All values are in SI units.
+
+    Attributes:
+        ifc_model : IfcModelBuilder object
+        ifc_material: optional, IfcMaterial assigned to walls and columns
+    """
+
+    def __init__(self, ifc_model, ifc_material=None) -> None:
+        """Initialize BulkElementBuilder object.
+
+        Args:
+            ifc_model (IfcModelBuilder): The IFC file the elements will be added to
+            ifc_material (IfcMaterial, optional): material of walls and columns.
+                Defaults to None.
+        """
+        self.ifc_model = ifc_model
+        self.ifc_material = ifc_material
+        model = ifc_model.model
+        self.unit_scale = unit.calculate_unit_scale(model)
+        owner_histories = model.by_type("IfcOwnerHistory")
+        self.owner_history = owner_histories[0] if owner_histories else None
+        # reuses directions and profile positions, points of placements are unique
+        self.pool = ifc_model.pool
+        # host id -> world matrix of the host placement in m
+        self.host_matrices = {}
+        # walls registered as door hosts with inverse world matrix and dimensions
+        # in m, the R-tree over their AABBs is built on the next find_hosts()
+        self.hosts = []
+        self.host_inverses = np.empty((0, 4, 4))
+        self.host_dims = np.empty((0, 3))
+        self.host_tree = None
+
+    @staticmethod
+    def boxes_from_corners(corners: np.ndarray) -> tuple:
+        """Compute origins, dimensions and angles of boxes from ordered corner points.
+        Corners 0, 1, 2, 3 are the bottom face counter-clockwise, 4 is above 0.
+
+        Args:
+            corners (np.ndarray): ordered corner points, shape (n, 8, 3)
+
+        Returns:
+            np.ndarray: origins i.e., first corner points, shape (n, 3)
+            np.ndarray: length, width and height, shape (n, 3)
+            np.ndarray: angles in degrees, counter-clockwise is positive, shape (n, )
+        """
+        corners = np.asarray(corners, dtype=float).reshape((-1, 8, 3))
+        origins = corners[:, 0]
+        length_vectors = corners[:, 1] - origins
+        dims = np.column_stack(
+            (
+                np.linalg.norm(length_vectors, axis=1),
+                np.linalg.norm(corners[:, 3] - origins, axis=1),
+                np.linalg.norm(corners[:, 4] - origins, axis=1),
+            )
+        )
+        angles = np.rad2deg(np.arctan2(length_vectors[:, 1], length_vectors[:, 0]))
+        return origins, dims, angles
+
+    def get_boxes(self, corners, origins, dims, angles) -> tuple:
+        """Get origins, dimensions and angles from corners or the given arrays"""
+        if corners is not None:
+            return self.boxes_from_corners(corners)
+        origins = np.asarray(origins, dtype=float).reshape((-1, 3))
+        dims = np.asarray(dims, dtype=float).reshape((-1, 3))
+        if angles is None:
+            angles = np.zeros(origins.shape[0])
+        return origins, dims, np.asarray(angles, dtype=float).reshape(-1)
+
+    def create_placements(self, origins, angles, relative_to=None) -> list:
+        """Create IfcLocalPlacements, coordinates are converted to project units.
+
+        Args:
+            origins (np.ndarray): origins in m, shape (n, 3)
+            angles (np.ndarray): angles in degrees, shape (n, )
+            relative_to (list, optional): IfcLocalPlacement per placement, origins
+                and angles are relative to it. Defaults to None, world coordinates.
+
+        Returns:
+            list: IfcLocalPlacement
+        """
+        model = self.ifc_model.model
+        points = (np.asarray(origins) / self.unit_scale).tolist()
+        radians = np.deg2rad(angles)
+        directions = np.column_stack(
+            (np.cos(radians), np.sin(radians), np.zeros(radians.shape[0]))
+        ).tolist()
+        if relative_to is None:
+            relative_to = [None] * len(points)
+        z_axis = self.pool.direction((0.0, 0.0, 1.0))
+        return [
+            model.createIfcLocalPlacement(
+                rel_to,
+                model.createIfcAxis2Placement3D(
+                    model.createIfcCartesianPoint(point),
+                    z_axis,
+                    self.pool.direction(direction),
+                ),
+            )
+            for point, direction, rel_to in zip(points, directions, relative_to)
+        ]
+
+    def create_extrusions(self, dims, shape_type: str, centered=False) -> list:
+        """Create box-style body representations, extruded rectangles. With
+        instancing enabled in the IfcModelBuilder, boxes of the same quantized
+        dimensions share their geometry.
+
+        Args:
+            dims (np.ndarray): length, width and height in m, shape (n, 3)
+            shape_type (str): kind of shape e.g., IfcWall, used for instancing
+            centered (bool, optional): center the rectangle on the placement like
+                columns. Defaults to False, starts at the placement like walls.
+
+        Returns:
+            list: IfcProductDefinitionShape
+        """
+        model = self.ifc_model.model
+        z_axis = self.pool.direction((0.0, 0.0, 1.0))
+        identity = self.pool.axis2placement3d((0.0, 0.0, 0.0))
+
+        def create_representation(box_dims):
+            length, width, height = (np.asarray(box_dims) / self.unit_scale).tolist()
+            center = (0.0, 0.0) if centered else (length / 2, width / 2)
+            position = self.pool.axis2placement2d(center)
+            profile = model.createIfcRectangleProfileDef(
+                "AREA", None, position, length, width
+            )
+            solid = model.createIfcExtrudedAreaSolid(profile, identity, z_axis, height)
+            return model.createIfcShapeRepresentation(
+                self.ifc_model.body, "Body", "SweptSolid", [solid]
+            )
+
+        shapes = []
+        for box_dims in np.asarray(dims):
+            representation = self.ifc_model.body_representation(
+                shape_type, box_dims, create_representation
+            )
+            shapes.append(
+                model.createIfcProductDefinitionShape(None, None, [representation])
+            )
+        return shapes
+
+    def create_products(self, ifc_class, placements, shapes, uids=None) -> list:
+        """Create products with placement and representation.
+
+        Args:
+            ifc_class (str): IFC class e.g., IfcWall
+            placements (list): IfcLocalPlacement per product
+            shapes (list): IfcProductDefinitionShape per product
+            uids (list, optional): GlobalIds according to reference data.
+                Defaults to None, new GlobalIds.
+
+        Returns:
+            list: IFC products
+        """
+        model = self.ifc_model.model
+        if uids is None:
+            uids = [ifcopenshell.guid.new() for _ in placements]
+        return [
+            model.create_entity(
+                ifc_class,
+                GlobalId=uid,
+                OwnerHistory=self.owner_history,
+                ObjectPlacement=object_placement,
+                Representation=shape,
+            )
+            for uid, object_placement, shape in zip(uids, placements, shapes)
+        ]
+
+    def assign_container(self, products, z_min=None) -> None:
+        """Assign products to the building storeys by their lowest z coordinate,
+        with one relationship per storey. In deferred mode, the products are
+        registered with the IfcModelBuilder.
+
+        Args:
+            products (list): IFC products
+            z_min (np.ndarray, optional): lowest z coordinate per product in m.
+                Defaults to None, all products to the storey of the builder.
+        """
+        if z_min is None:
+            groups = {0: (self.ifc_model.storey, list(products))}
+        else:
+            storeys = self.ifc_model.storeys
+            # binary search on the sorted elevations, see IfcModelBuilder.storey_at()
+            indices = np.searchsorted(
+                self.ifc_model.elevations, np.asarray(z_min) + 0.05, "right"
+            )
+            indices = np.maximum(indices - 1, 0)
+            groups = {}
+            for index, product in zip(indices.tolist(), products):
+                groups.setdefault(index, (storeys[index], []))[1].append(product)
+        model = self.ifc_model.model
+        for storey, storey_products in groups.values():
+            if self.ifc_model.deferred:
+                self.ifc_model.assign_container(storey_products, storey)
+                continue
+            if len(storey.ContainsElements) > 0:
+                rel = storey.ContainsElements[0]
+                rel.RelatedElements = list(rel.RelatedElements) + storey_products
+                continue
+            model.createIfcRelContainedInSpatialStructure(
+                ifcopenshell.guid.new(),
+                self.owner_history,
+                None,
+                None,
+                storey_products,
+                storey,
+            )
+
+    def assign_material(self, products) -> None:
+        """Assign the material to products with one relationship"""
+        if self.ifc_material is None:
+            return
+        self.ifc_model.model.createIfcRelAssociatesMaterial(
+            ifcopenshell.guid.new(),
+            self.owner_history,
+            None,
+            None,
+            products,
+            self.ifc_material,
+        )
+
+    def assign_pset(self, products, name: str, properties: dict) -> None:
+        """Assign one property set shared by all products of a batch. In deferred
+        mode, the products are registered with the IfcModelBuilder.
+
+        Args:
+            products (list): IFC products
+            name (str): name of the property set
+            properties (dict): property values, str, bool, int or float
+        """
+        if self.ifc_model.deferred:
+            self.ifc_model.assign_pset(products, name, properties)
+            return
+        model = self.ifc_model.model
+        types = {str: "IfcLabel", bool: "IfcBoolean", int: "IfcInteger"}
+        single_values = [
+            model.createIfcPropertySingleValue(
+                key, None, model.create_entity(types.get(type(value), "IfcReal"), value)
+            )
+            for key, value in properties.items()
+        ]
+        pset = model.createIfcPropertySet(
+            ifcopenshell.guid.new(), self.owner_history, name, None, single_values
+        )
+        model.createIfcRelDefinesByProperties(
+            ifcopenshell.guid.new(), self.owner_history, None, None, products, pset
+        )
+
+    def add_walls(
+        self, corners=None, origins=None, dims=None, angles=None, uids=None
+    ) -> list:
+        """Create walls from boxes, see IfcWall.create_wall().
+
+        Args:
+            corners (np.ndarray, optional): ordered corner points, shape (n, 8, 3)
+            origins (np.ndarray, optional): first corner points, shape (n, 3)
+            dims (np.ndarray, optional): length, width, height, shape (n, 3)
+            angles (np.ndarray, optional): angles in degrees, shape (n, )
+            uids (list, optional): GlobalIds. Defaults to None, new GlobalIds.
+
+        Returns:
+            list: IfcWall
+        """
+        origins, dims, angles = self.get_boxes(corners, origins, dims, angles)
+        walls = self.create_products(
+            "IfcWall",
+            self.create_placements(origins, angles),
+            self.create_extrusions(dims, "IfcWall"),
+            uids,
+        )
+        self.assign_material(walls)
+        self.assign_pset(
+            walls, "Pset_WallCommon", {"FireRating": "F60", "LoadBearing": True}
+        )
+        self.assign_container(walls, origins[:, 2])
+        self.add_hosts(
+            walls, BatchUpdateIfcObjects.placement_matrices(origins, angles), dims
+        )
+        print(f"Created {len(walls)} walls")
+        return walls
+
+    def add_columns(
+        self, corners=None, origins=None, dims=None, angles=None, uids=None
+    ) -> list:
+        """Create square columns from boxes, placed at the center of the bottom
+        face, see IfcColumn.create(). Arguments are the same as for add_walls().
+
+        Returns:
+            list: IfcColumn
+        """
+        origins, dims, angles = self.get_boxes(corners, origins, dims, angles)
+        radians = np.deg2rad(angles)
+        # first corner to center of the bottom face
+        half_length = dims[:, 0] / 2
+        half_width = dims[:, 1] / 2
+        centers = origins.copy()
+        centers[:, 0] += half_length * np.cos(radians) - half_width * np.sin(radians)
+        centers[:, 1] += half_length * np.sin(radians) + half_width * np.cos(radians)
+        columns = self.create_products(
+            "IfcColumn",
+            self.create_placements(centers, angles),
+            self.create_extrusions(dims, "IfcColumn/square", centered=True),
+            uids,
+        )
+        self.assign_material(columns)
+        self.assign_container(columns, origins[:, 2])
+        print(f"Created {len(columns)} columns")
+        return columns
+
+    def add_hosts(self, walls, matrices=None, dims=None) -> None:
+        """Register walls as hosts for find_hosts(), walls created by add_walls()
+        are registered automatically.
+
+        Args:
+            walls (list): IFC walls, or IfcWall objects if matrices is None
+            matrices (np.ndarray, optional): world placement matrices in m, shape
+                (n, 4, 4). Defaults to None, the matrices of the IfcWall objects.
+            dims (np.ndarray, optional): length, width and height in m, shape
+                (n, 3). Defaults to None, the dims of the IfcWall objects.
+        """
+        if matrices is None:
+            matrices = [wall.matrix for wall in walls]
+            dims = [wall.dims for wall in walls]
+            walls = [wall.product for wall in walls]
+        matrices = np.asarray(matrices, dtype=float).reshape((-1, 4, 4))
+        self.hosts.extend(walls)
+        self.host_inverses = np.concatenate(
+            (self.host_inverses, np.linalg.inv(matrices))
+        )
+        self.host_dims = np.concatenate(
+            (self.host_dims, np.asarray(dims, dtype=float).reshape((-1, 3)))
+        )
+        self.host_tree = None
+
+    def find_hosts(self, origins, dims, angles, tolerance=0.05) -> list:
+        """Find the host wall of each door. Candidates are the walls whose AABB
+        intersects the AABB of the door, the host is the candidate containing the
+        largest fraction of the door, computed in the wall's oriented frame.
+
+        Args:
+            origins (np.ndarray): first corner points of the doors in m, shape (n, 3)
+            dims (np.ndarray): length, width, height of the doors in m, shape (n, 3)
+            angles (np.ndarray): angles in degrees, shape (n, )
+            tolerance (float, optional): the boxes are grown by this distance in m,
+                for doors touching their wall. Defaults to 0.05.
+
+        Returns:
+            list: host IFC wall per door, None if no wall overlaps the door
+        """
+        hosts = [None] * len(origins)
+        if len(self.hosts) == 0:
+            return hosts
+        if self.host_tree is None:
+            # bulk loading packs the tree much better than inserting one by one
+            corners = geometry.box_verts(
+                np.linalg.inv(self.host_inverses), self.host_dims
+            )
+            aabbs = np.hstack((corners.min(axis=1), corners.max(axis=1)))
+            properties = rtree_index.Property()
+            properties.dimension = 3
+            self.host_tree = rtree_index.Index(
+                ((i, tuple(bx), None) for i, bx in enumerate(aabbs.tolist())),
+                properties=properties,
+            )
+        door_corners = geometry.box_verts(
+            BatchUpdateIfcObjects.placement_matrices(origins, angles), dims
+        )
+        door_aabbs = np.hstack(
+            (door_corners.min(axis=1) - tolerance, door_corners.max(axis=1) + tolerance)
+        )
+        for i, corners in enumerate(door_corners):
+            rows = np.fromiter(
+                self.host_tree.intersection(tuple(door_aabbs[i])), dtype=np.int64
+            )
+            if rows.size == 0:
+                continue
+            # door corners in the frames of the candidate walls
+            inverses = self.host_inverses[rows]
+            local = (
+                np.einsum("kij,nj->kni", inverses[:, :3, :3], corners)
+                + inverses[:, np.newaxis, :3, 3]
+            )
+            local_min = local.min(axis=1)
+            local_max = local.max(axis=1)
+            overlap = np.minimum(
+                local_max, self.host_dims[rows] + tolerance
+            ) - np.maximum(local_min, -tolerance)
+            # fraction of the door box in the wall frame, walls crossing the door
+            # at an angle score lower than the wall aligned with it
+            fractions = np.prod(np.clip(overlap, 0.0, None), axis=1) / np.prod(
+                np.maximum(local_max - local_min, 1e-9), axis=1
+            )
+            best = np.argmax(fractions)
+            if fractions[best] > 0.0:
+                hosts[i] = self.hosts[rows[best]]
+        return hosts
+
+    def insert_doors(
+        self,
+        corners=None,
+        origins=None,
+        dims=None,
+        angles=None,
+        uids=None,
+        tolerance=0.05,
+    ) -> tuple:
+        """Create doors in their host walls found with find_hosts(), each with an
+        opening voiding its host, see add_doors(). Doors without host are created
+        without opening and reported.
+
+        Args:
+            corners, origins, dims, angles, uids: see add_walls()
+            tolerance (float, optional): see find_hosts(). Defaults to 0.05.
+
+        Returns:
+            list: IfcDoor
+            list: indices of the doors without host wall
+        """
+        origins, dims, angles = self.get_boxes(corners, origins, dims, angles)
+        hosts = self.find_hosts(origins, dims, angles, tolerance)
+        doors = self.add_doors(
+            hosts, origins=origins, dims=dims, angles=angles, uids=uids
+        )
+        unmatched = [i for i, host in enumerate(hosts) if host is None]
+        if len(unmatched) > 0:
+            print(f"No host wall found for {len(unmatched)} doors: {unmatched}")
+        return doors, unmatched
+
+    def host_matrix(self, host) -> np.ndarray:
+        """World matrix of a host placement in m, computed once per host"""
+        matrix = self.host_matrices.get(host.id())
+        if matrix is None:
+            matrix = placement.get_local_placement(host.ObjectPlacement)
+            matrix[:3, 3] *= self.unit_scale
+            self.host_matrices[host.id()] = matrix
+        return matrix
+
+    def add_doors(
+        self, hosts, corners=None, origins=None, dims=None, angles=None, uids=None
+    ) -> list:
+        """Create doors from boxes, each with an opening voiding its host wall, see
+        IfcDoor.create_door(). The door and its opening share the box-style
+        representation.
+
+        Args:
+            hosts (list): IfcWall per door, None for doors without host
+            corners, origins, dims, angles, uids: see add_walls()
+
+        Returns:
+            list: IfcDoor
+        """
+        model = self.ifc_model.model
+        origins, dims, angles = self.get_boxes(corners, origins, dims, angles)
+        shapes = self.create_extrusions(dims, "IfcDoor")
+        doors = self.create_products(
+            "IfcDoor", self.create_placements(origins, angles), shapes, uids
+        )
+        hosted = [i for i, host in enumerate(hosts) if host is not None]
+        if len(hosted) > 0:
+            # opening placements relative to their host
+            worlds = BatchUpdateIfcObjects.placement_matrices(
+                origins[hosted], angles[hosted]
+            )
+            host_matrices = np.asarray([self.host_matrix(hosts[i]) for i in hosted])
+            relative = np.linalg.inv(host_matrices) @ worlds
+            relative_angles = np.rad2deg(
+                np.arctan2(relative[:, 1, 0], relative[:, 0, 0])
+            )
+            openings = self.create_products(
+                "IfcOpeningElement",
+                self.create_placements(
+                    relative[:, :3, 3],
+                    relative_angles,
+                    [hosts[i].ObjectPlacement for i in hosted],
+                ),
+                [shapes[i] for i in hosted],
+            )
+            for i, opening in zip(hosted, openings):
+                model.createIfcRelVoidsElement(
+                    ifcopenshell.guid.new(),
+                    self.owner_history,
+                    None,
+                    None,
+                    hosts[i],
+                    opening,
+                )
+                model.createIfcRelFillsElement(
+                    ifcopenshell.guid.new(),
+                    self.owner_history,
+                    None,
+                    None,
+                    opening,
+                    doors[i],
+                )
+        self.assign_container(doors, origins[:, 2])
+        print(f"Created {len(doors)} doors, {len(hosted)} in host walls")
+        return doors
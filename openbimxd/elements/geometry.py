@@ -0,0 +1,140 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+import numpy as np
+
+import ifcopenshell.geom
+from ifcopenshell.util import placement, unit
+
+# corners of a unit box, in the order of pystruct3d bbox corner points
+UNIT_BOX = np.array(
+    [
+        [0.0, 0.0, 0.0],
+        [1.0, 0.0, 0.0],
+        [1.0, 1.0, 0.0],
+        [0.0, 1.0, 0.0],
+        [0.0, 0.0, 1.0],
+        [1.0, 0.0, 1.0],
+        [1.0, 1.0, 1.0],
+        [0.0, 1.0, 1.0],
+    ]
+)
+
+
+def box_verts(matrices: np.ndarray, dims: np.ndarray, centered=False) -> np.ndarray:
+    """Compute the corner points of boxes from their placement and dimensions.
+
+    Args:
+        matrices (np.ndarray): world placement matrices in m, shape (n, 4, 4)
+        dims (np.ndarray): length, width and height in m, shape (n, 3)
+        centered (bool, optional): boxes are centered on the placement in plan like
+            columns. Defaults to False, start at the placement like walls.
+
+    Returns:
+        np.ndarray: ordered corner points in m, shape (n, 8, 3)
+    """
+    matrices = np.asarray(matrices, dtype=float).reshape((-1, 4, 4))
+    dims = np.asarray(dims, dtype=float).reshape((-1, 3))
+    corners = UNIT_BOX[np.newaxis] * dims[:, np.newaxis, :]
+    if centered:
+        corners[:, :, :2] -= dims[:, np.newaxis, :2] / 2
+    return (
+        np.einsum("nij,nkj->nki", matrices[:, :3, :3], corners)
+        + matrices[:, np.newaxis, :3, 3]
+    )
+
+
+def tessellate(product) -> np.ndarray:
+    """Get the vertices of a product by tessellating its representation.
+
+    Args:
+        product (IfcProduct): product with representation
+
+    Returns:
+        np.ndarray: vertices in world coordinates in m, shape (3n, )
+    """
+    # ifc geom settings for ifc box visualization
+    settings = ifcopenshell.geom.settings()
+    settings.set(settings.USE_WORLD_COORDS, True)
+    # retrieve shape
+    shape = ifcopenshell.geom.create_shape(settings, product)
+    return np.asarray(shape.geometry.verts)
+
+
+def is_unchanged(element, unit_scale: float) -> bool:
+    """Check whether an element still has the placement and representation it was
+    created with, so its vertices can be computed analytically.
+
+    Args:
+        element (IfcWall | IfcDoor | IfcColumn): openbimxd element
+        unit_scale (float): project length unit in m
+
+    Returns:
+        bool: True if the analytic vertices are valid
+    """
+    product = element.product
+    if element.dims is None or product.Representation != element.representation:
+        return False
+    # in relocate() mode, the placement is set later from the stored matrix
+    if product.ObjectPlacement is None:
+        return True
+    matrix = placement.get_local_placement(product.ObjectPlacement)
+    matrix[:3, 3] *= unit_scale
+    return np.allclose(matrix, element.matrix, atol=1e-6)
+
+
+def get_verts(elements) -> list:
+    """Get the vertices of many elements. Unchanged box-style elements are computed
+    analytically in one batch, edited or other geometry is tessellated. Analytic
+    vertices are the 8 box corners, openings are not subtracted.
+
+    Args:
+        elements (list): IfcWall, IfcDoor or IfcColumn objects
+
+    Returns:
+        list: vertices in world coordinates in m per element, shape (3n, )
+    """
+    verts = [None] * len(elements)
+    if len(elements) == 0:
+        return verts
+    unit_scale = unit.calculate_unit_scale(elements[0].ifc_model.model)
+    for centered in (False, True):
+        batch = [
+            i
+            for i, element in enumerate(elements)
+            if element.centered == centered and is_unchanged(element, unit_scale)
+        ]
+        if len(batch) == 0:
+            continue
+        corners = box_verts(
+            np.asarray([elements[i].matrix for i in batch]),
+            np.asarray([elements[i].dims for i in batch]),
+            centered,
+        )
+        for i, element_corners in zip(batch, corners):
+            verts[i] = element_corners.reshape(-1)
+    for i, element in enumerate(elements):
+        if verts[i] is None:
+            verts[i] = tessellate(element.product)
+    return verts
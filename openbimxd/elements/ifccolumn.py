@@ -24,11 +24,11 @@
 
 
 import numpy as np
-import ifcopenshell
-import ifcopenshell.geom
 from ifcopenshell.api import run
 from ifcopenshell import util
 
+from openbimxd.elements import geometry
+
 
 class IfcColumn:
     """
@@ -53,6 +53,12 @@ class IfcColumn:
         """
         self.ifc_model = ifc_model
         self.column = run("root.create_entity", ifc_model.model, ifc_class="IfcColumn")
+        self.matrix = np.eye(4)
+        # length, width and height in m and the representation they were used for,
+        # round columns are tessellated
+        self.dims = None
+        self.representation = None
+        self.centered = True
 
         pass
 
@@ -71,38 +77,45 @@ class IfcColumn:
         # apply transformation
         matrix[:, 3][0:3] = np.mean(bx.corner_points[:4], axis=0)
         print("Column centroid:", np.mean(bx.corner_points[:4], axis=0))
-        run(
-            "geometry.edit_object_placement",
-            self.ifc_model.model,
-            product=self.column,
-            matrix=matrix,
-            is_si=True,
-        )
+        self.ifc_model.edit_object_placement(self.column, matrix)
+        self.matrix = matrix
         if shape == "square":
-            profile = self.ifc_model.model.create_entity(
-                "IfcRectangleProfileDef",
-                ProfileName="AwesomeProfile",
-                ProfileType="AREA",
-                XDim=1000 * bx.length(),
-                YDim=1000 * bx.width(),
-            )
+            dims = np.asarray([bx.length(), bx.width(), bx.height()])
         elif shape == "round":
-            profile = self.ifc_model.model.create_entity(
-                "IfcCircleProfileDef",
-                ProfileName="AwesomeProfile",
-                ProfileType="AREA",
-                Radius=1000 * kwargs.get("radius", 0.3),
-            )
+            radius = kwargs.get("radius", 0.3)
+            dims = np.asarray([radius, radius, bx.height()])
         else:
             print("Unknown column shape, passing ...")
+            return
+
+        def create_representation(dims):
+            if shape == "square":
+                profile = self.ifc_model.model.create_entity(
+                    "IfcRectangleProfileDef",
+                    ProfileName="AwesomeProfile",
+                    ProfileType="AREA",
+                    XDim=float(1000 * dims[0]),
+                    YDim=float(1000 * dims[1]),
+                )
+            else:
+                profile = self.ifc_model.model.create_entity(
+                    "IfcCircleProfileDef",
+                    ProfileName="AwesomeProfile",
+                    ProfileType="AREA",
+                    Radius=float(1000 * dims[0]),
+                )
+            # Add a new wall-like body geometry with bounding box dimensions
+            return run(
+                "geometry.add_profile_representation",
+                self.ifc_model.model,
+                context=self.ifc_model.body,
+                profile=profile,
+                depth=float(dims[2]),
+            )
 
-        # Add a new wall-like body geometry with bounding box dimensions
-        representation = run(
-            "geometry.add_profile_representation",
-            self.ifc_model.model,
-            context=self.ifc_model.body,
-            profile=profile,
-            depth=bx.height(),
+        # columns of the same size share their geometry if instancing is enabled
+        representation = self.ifc_model.body_representation(
+            f"IfcColumn/{shape}", dims, create_representation
         )
         # Assign our new body geometry back to our wall
         run(
@@ -111,26 +124,25 @@ class IfcColumn:
             product=self.column,
             representation=representation,
         )
+        if shape == "square":
+            self.dims = dims
+        self.representation = self.column.Representation
 
-        # Place our wall in the ground floor
-        run(
-            "spatial.assign_container",
-            self.ifc_model.model,
-            relating_structure=self.ifc_model.storey,
-            product=self.column,
-        )
+        # Place our column in the storey of its lowest point
+        storey = self.ifc_model.storey_at(np.min(bx.corner_points[:, 2]))
+        self.ifc_model.assign_container([self.column], storey)
+
+    @property
+    def product(self):
+        """The IFC product of the column"""
+        return self.column
 
     def get_verts(self) -> np.ndarray:
-        """Get the vertices i.e., all corner points of the geometry representation
+        """Get the vertices i.e., all corner points of the geometry representation.
+        Computed from the stored placement and dimensions, the representation is
+        only tessellated if it was edited or is not box-style.
 
         Returns:
-            verts: np.ndarray
+            verts: np.ndarray, shape (3n, )
         """
-        # ifc geom settings for ifc box visualization
-        settings = ifcopenshell.geom.settings()
-        settings.set(settings.USE_WORLD_COORDS, True)
-        # retrieve shape
-        shape = ifcopenshell.geom.create_shape(settings, self.column)
-        verts = np.asarray(shape.geometry.verts)
-
-        return verts
+        return geometry.get_verts([self])[0]
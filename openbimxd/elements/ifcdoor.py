@@ -26,7 +26,8 @@
 import numpy as np
 from ifcopenshell.api import run
 from ifcopenshell import util
-import ifcopenshell.geom
+
+from openbimxd.elements import geometry
 
 
 class IfcDoor:
@@ -53,6 +54,11 @@ class IfcDoor:
         """
         self.door = run("root.create_entity", ifc_model.model, ifc_class="IfcDoor")
         self.ifc_model = ifc_model
+        self.matrix = np.eye(4)
+        # length, width and height in m and the representation they were used for
+        self.dims = None
+        self.representation = None
+        self.centered = False
 
     def create_door(self, wall, bx, uid=None) -> None:
         """Create door placement, representation and opening and assign door to
@@ -72,24 +78,26 @@ class IfcDoor:
         # points are ordered, try to use 1st corner vector
         door_matrix[:, 3][0:3] += bx.corner_points[0] - wall.matrix[:, 3][0:3]
         # Set our door's Object Placement using our matrix.
-        # `is_si=True` states that we are using SI units instead of project units.
-        run(
-            "geometry.edit_object_placement",
-            self.ifc_model.model,
-            product=self.door,
-            matrix=door_matrix,
-            is_si=True,
-        )
+        # The matrix is in SI units, in relocate() mode the placement is set on exit.
+        self.ifc_model.edit_object_placement(self.door, door_matrix)
+        self.matrix = door_matrix
 
         # Add a new wall-like body geometry with bounding box dimensions
         # representation is used for opening and door
-        opening_representation = run(
-            "geometry.add_wall_representation",
-            self.ifc_model.model,
-            context=self.ifc_model.body,
-            length=float(bx.length()),
-            height=float(bx.height()),
-            thickness=float(bx.width()),
+        def create_representation(dims):
+            return run(
+                "geometry.add_wall_representation",
+                self.ifc_model.model,
+                context=self.ifc_model.body,
+                length=float(dims[0]),
+                height=float(dims[2]),
+                thickness=float(dims[1]),
+            )
+
+        # doors of the same size share their geometry if instancing is enabled
+        dims = np.asarray([bx.length(), bx.width(), bx.height()], dtype=float)
+        opening_representation = self.ifc_model.body_representation(
+            "IfcDoor", dims, create_representation
         )
         # TODO: fix door representation, add generic door-style one
         # door_representation = run(
@@ -116,36 +124,28 @@ class IfcDoor:
             product=self.door,
             representation=opening_representation,
         )
+        self.dims = dims
+        self.representation = self.door.Representation
         run(
             "void.add_opening", self.ifc_model.model, opening=opening, element=wall.wall
         )
-        run(
-            "geometry.edit_object_placement",
-            self.ifc_model.model,
-            product=opening,
-            matrix=door_matrix,
-            is_si=True,
-        )
+        self.ifc_model.edit_object_placement(opening, door_matrix)
 
-        # Place our wall in the ground floor
-        run(
-            "spatial.assign_container",
-            self.ifc_model.model,
-            relating_structure=self.ifc_model.storey,
-            product=self.door,
-        )
+        # Place our door in the storey of its lowest point
+        storey = self.ifc_model.storey_at(np.min(bx.corner_points[:, 2]))
+        self.ifc_model.assign_container([self.door], storey)
+
+    @property
+    def product(self):
+        """The IFC product of the door"""
+        return self.door
 
     def get_verts(self) -> np.ndarray:
-        """Get the vertices i.e., all corner points of the geometry representation
+        """Get the vertices i.e., all corner points of the geometry representation.
+        Computed from the stored placement and dimensions, the representation is
+        only tessellated if it was edited or is not box-style.
 
         Returns:
-            verts: np.ndarray
+            verts: np.ndarray, shape (3n, )
         """
-        # ifc geom settings for ifc box visualization
-        settings = ifcopenshell.geom.settings()
-        settings.set(settings.USE_WORLD_COORDS, True)
-        # retrieve shape
-        shape = ifcopenshell.geom.create_shape(settings, self.door)
-        verts = np.asarray(shape.geometry.verts)
-
-        return verts
+        return geometry.get_verts([self])[0]
@@ -25,7 +25,8 @@
 import numpy as np
 from ifcopenshell.api import run
 from ifcopenshell import util
-import ifcopenshell.geom
+
+from openbimxd.elements import geometry
 
 
 class IfcWall:
@@ -54,6 +55,10 @@ class IfcWall:
         self.ifc_model = ifc_model
         self.ifc_material = ifc_material
         self.matrix = np.eye(4)
+        # length, width and height in m and the representation they were used for
+        self.dims = None
+        self.representation = None
+        self.centered = False
 
     def create_wall(self, bx, uid=None) -> None:
         """Creates IfcWalls from a bounding box
@@ -76,24 +81,25 @@ class IfcWall:
         matrix[:, 3][0:3] = bx.corner_points[0]
 
         # Set our wall's Object Placement using our matrix.
-        # `is_si=True` states that we are using SI units instead of project units.
-        run(
-            "geometry.edit_object_placement",
-            self.ifc_model.model,
-            product=self.wall,
-            matrix=matrix,
-            is_si=True,
-        )
+        # The matrix is in SI units, in relocate() mode the placement is set on exit.
+        self.ifc_model.edit_object_placement(self.wall, matrix)
         self.matrix = matrix
 
         # Add a new wall-like body geometry with bounding box dimensions
-        representation = run(
-            "geometry.add_wall_representation",
-            self.ifc_model.model,
-            context=self.ifc_model.body,
-            length=float(bx.length()),
-            height=float(bx.height()),
-            thickness=float(bx.width()),
+        def create_representation(dims):
+            return run(
+                "geometry.add_wall_representation",
+                self.ifc_model.model,
+                context=self.ifc_model.body,
+                length=float(dims[0]),
+                height=float(dims[2]),
+                thickness=float(dims[1]),
+            )
+
+        # walls of the same size share their geometry if instancing is enabled
+        dims = np.asarray([bx.length(), bx.width(), bx.height()], dtype=float)
+        representation = self.ifc_model.body_representation(
+            "IfcWall", dims, create_representation
         )
         # Assign our new body geometry back to our wall
         run(
@@ -102,6 +108,8 @@ class IfcWall:
             product=self.wall,
             representation=representation,
         )
+        self.dims = dims
+        self.representation = self.wall.Representation
 
         # assign material
         if self.ifc_material is not None:
@@ -112,39 +120,26 @@ class IfcWall:
                 type="IfcMaterial",
                 material=self.ifc_material,
             )
-        # assign property set
-        pset = run(
-            "pset.add_pset",
-            self.ifc_model.model,
-            product=self.wall,
-            name="Pset_WallCommon",
-        )
-        run(
-            "pset.edit_pset",
-            self.ifc_model.model,
-            pset=pset,
-            properties={"FireRating": "F60", "LoadBearing": True},
+        # assign property set, shared by all walls in deferred mode
+        self.ifc_model.assign_pset(
+            [self.wall], "Pset_WallCommon", {"FireRating": "F60", "LoadBearing": True}
         )
 
-        # Place our wall in the ground floor
-        run(
-            "spatial.assign_container",
-            self.ifc_model.model,
-            relating_structure=self.ifc_model.storey,
-            product=self.wall,
-        )
+        # Place our wall in the storey of its lowest point
+        storey = self.ifc_model.storey_at(np.min(bx.corner_points[:, 2]))
+        self.ifc_model.assign_container([self.wall], storey)
+
+    @property
+    def product(self):
+        """The IFC product of the wall"""
+        return self.wall
 
     def get_verts(self) -> np.ndarray:
-        """Get the vertices i.e., all corner points of the geometry representation
+        """Get the vertices i.e., all corner points of the geometry representation.
+        Computed from the stored placement and dimensions, the representation is
+        only tessellated if it was edited or is not box-style.
 
         Returns:
-            verts: np.ndarray
+            verts: np.ndarray, shape (3n, )
         """
-        # ifc geom settings for ifc box visualization
-        settings = ifcopenshell.geom.settings()
-        settings.set(settings.USE_WORLD_COORDS, True)
-        # retrieve shape
-        shape = ifcopenshell.geom.create_shape(settings, self.wall)
-        verts = np.asarray(shape.geometry.verts)
-
-        return verts
+        return geometry.get_verts([self])[0]
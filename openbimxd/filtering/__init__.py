@@ -28,24 +28,39 @@ Filter objects based on their IFC class, attributes, semantic and spatial relati
 CLASSES
     objectFilter
         class objects are used to open an IFC file, filter objects and export the IFC file
+    spatialfilter / SpatialIndex
+        R-tree of the elements' world-space bounding boxes, built once per model to
+        query elements in a box, a sphere or a building storey
 FUNCTIONS
-    __init__(self, ifc_model_path: str, filtered_model_path: str) -> None
+    __init__(self, ifc_model_path: str, filtered_model_path: str, telemetry=None) -> None
         Initialize the objectFilter object
+    copy_spatial_hierarchy(self, prj) -> dict
+        Copies the spatial hierarchy following the IfcRelAggregates decomposition once.
+        Returns a map of original to copied spatial elements, stored in spatial_map
     filter_objects(self, search_str: str)
         Filter objects with a given search string. Uses the IfcOpenShell selector 
         syntax: https://blenderbim.org/docs-python/ifcopenshell-python/selector_syntax.html
-    create_materials(self):
-        Gets all materials from original file and adds them to the filtered file
+    filter_region(self, search_str=None, box=None, center=None, radius=None, storey=None)
+        Filter objects inside a box, a sphere or a building storey. Can be combined with
+        a search string.
+    remap_materials(self) -> dict
+        Copies all materials, layer sets, profile sets, constituent sets and material
+        lists once, keyed by entity id. Used by export_model()
+    associate_materials(self, object_map, material_map)
+        Assigns the remapped materials to the filtered objects. Objects sharing a
+        material share one IfcRelAssociatesMaterial
     assign_container(self, obj, new_obj)
         Assigns the spatioal container e.g., the building storey of an object
     assign_opening(self, obj, new_obj)
         Gets and assigns all openings of a parent object. Only the openings, no elements 
         inside the opening such as windows, doors, etc.
-    assign_material(self, obj, new_obj, new_mats, new_mat_sets)
-        Assigns the materials created in create_materials() to the filtered objects
     assign_psets(self, obj, new_obj)
         Gets and assigns property sets. This is sensitive to IFC schema versions, so be 
         careful!
-    export_model(self)
-        Executes the filtering and assignments and saves the filtered model. 
+    export_model(self, stream=False)
+        Executes the filtering and assignments and saves the filtered model. Stage
+        timers are collected in the telemetry object. 
+    stream_model(self)
+        Writes the filtered objects directly from the original file to disk without
+        building the filtered model in memory. Supports compressed .ifczip files.
 """
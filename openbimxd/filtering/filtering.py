@@ -24,12 +24,26 @@
 
 
 import ifcopenshell
+import ifcopenshell.guid
 from ifcopenshell import file
 import ifcopenshell.util as util
 from ifcopenshell.api import run
-from ifcopenshell.api import material
 import ifcopenshell.util.selector
 import time
+from collections import deque
+
+from openbimxd.filtering.spatialfilter import SpatialIndex
+from openbimxd.ifcfile.ifcwriter import StreamingIfcWriter
+from openbimxd.telemetry.telemetry import Telemetry
+
+# material definitions copied by remap_materials(), usages are copied on demand
+MATERIAL_CLASSES = [
+    "IfcMaterial",
+    "IfcMaterialLayerSet",
+    "IfcMaterialProfileSet",
+    "IfcMaterialConstituentSet",
+    "IfcMaterialList",
+]
 
 
 class objectFilter:
@@ -37,72 +51,123 @@ class objectFilter:
     A class to filter objects based on their IFC class, attributes, semantic and spatial relationships.
 
     Methods
-        __init__(self, ifc_model_path: str, filtered_model_path: str) -> None
+        __init__(self, ifc_model_path: str, filtered_model_path: str, telemetry=None) -> None
             Initialize the objectFilter object
+        copy_spatial_hierarchy(self, prj) -> dict
+            Copies the spatial hierarchy once, returns the map of original to copied
+            spatial elements
         filter_objects(self, search_str: str)
             Filter objects with a given search string. Uses the IfcOpenShell selector
             syntax: https://blenderbim.org/docs-python/ifcopenshell-python/selector_syntax.html
-        create_materials(self):
-            Gets all materials from original file and adds them to the filtered file
+        filter_region(self, search_str=None, box=None, center=None, radius=None, storey=None)
+            Filter objects inside a box, a sphere or a building storey. Can be combined
+            with a search string.
+        remap_materials(self) -> dict
+            Copies all material definitions once, keyed by entity id
+        associate_materials(self, object_map, material_map)
+            Assigns materials to the filtered objects, one relationship per material
         assign_container(self, obj, new_obj)
             Assigns the spatioal container e.g., the building storey of an object
         assign_opening(self, obj, new_obj)
             Gets and assigns all openings of a parent object. Only the openings, no elements
             inside the opening such as windows, doors, etc.
-        assign_material(self, obj, new_obj, new_mats, new_mat_sets)
-            Assigns the materials created in create_materials() to the filtered objects
         assign_psets(self, obj, new_obj)
             Gets and assigns property sets. This is sensitive to IFC schema versions, so be
             careful!
-        export_model(self)
+        export_model(self, stream=False)
             Executes the filtering and assignments and saves the filtered model.
+        stream_model(self)
+            Writes the filtered objects directly from the original file to disk.
     """
 
-    def __init__(self, ifc_model_path: str, filtered_model_path: str) -> None:
+    def __init__(
+        self, ifc_model_path: str, filtered_model_path: str, telemetry=None
+    ) -> None:
         """Initialize IfcModelBuilder
 
         Args:
             ifc_model_path (str): path to the model file
             filtered_model_path (str): path to the filtered model file
+            telemetry (Telemetry, optional): collects stage timers and counters of
+                the export. Defaults to None, timers are only kept in memory.
         """
+        if telemetry is None:
+            telemetry = Telemetry("objectFilter")
+        self.telemetry = telemetry
         self.ifc_model = ifcopenshell.open(ifc_model_path)
         self.filtered_model_path = filtered_model_path
         self.objects = []
-        self.materials = self.ifc_model.by_type("IfcMaterial")
-        self.material_sets = self.ifc_model.by_type("IfcMaterialLayerSet")
         self.filtered_model = file(schema=self.ifc_model.schema)
         print(f"Set up filtered model with schema: {self.ifc_model.schema}")
         if self.ifc_model.schema == "IFC2X3":
             print(f"Schema version: {self.ifc_model.schema}, no context ...")
         else:
             self.filtered_model.add(self.ifc_model.by_type("IfcContext")[0])
-        prj = self.filtered_model.add(self.ifc_model.by_type("IfcProject")[0])
+        prj = self.ifc_model.by_type("IfcProject")[0]
+        # maps entity ids of the original spatial structure to the filtered copies
+        self.spatial_map = self.copy_spatial_hierarchy(prj)
 
-        for site in self.ifc_model.by_type("IfcSite"):
-            new_site = self.filtered_model.add(site)
-            run(
-                "aggregate.assign_object",
-                self.filtered_model,
-                relating_object=prj,
-                product=new_site,
+    def copy_spatial_hierarchy(self, prj) -> dict:
+        """Copy the spatial hierarchy, e.g. sites, buildings and storeys, into the
+        filtered file. Follows the IfcRelAggregates decomposition of the original
+        file once, so every spatial element and relationship is copied exactly once.
+
+        Args:
+            prj (IfcProject): project of the original file
+
+        Returns:
+            dict: entity id of the original spatial element -> filtered copy
+        """
+        spatial_map = {prj.id(): self.filtered_model.add(prj)}
+        for parent, rel, children in self.iter_spatial_decomposition(prj):
+            for child in children:
+                spatial_map[child.id()] = self.filtered_model.add(child)
+            self.filtered_model.create_entity(
+                "IfcRelAggregates",
+                GlobalId=rel.GlobalId,
+                OwnerHistory=self.add_owner_history(rel),
+                RelatingObject=spatial_map[parent.id()],
+                RelatedObjects=[spatial_map[child.id()] for child in children],
             )
-            for building in self.ifc_model.by_type("IfcBuilding"):
-                new_building = self.filtered_model.add(building)
-                run(
-                    "aggregate.assign_object",
-                    self.filtered_model,
-                    relating_object=new_site,
-                    product=new_building,
-                )
+        print(f"Copied {len(spatial_map)} spatial elements")
+        return spatial_map
 
-                for st in self.ifc_model.by_type("IfcBuildingStorey"):
-                    new_st = self.filtered_model.add(st)
-                    run(
-                        "aggregate.assign_object",
-                        self.filtered_model,
-                        relating_object=new_building,
-                        product=new_st,
-                    )
+    def iter_spatial_decomposition(self, prj):
+        """Walk the IfcRelAggregates decomposition of the spatial structure once,
+        breadth-first starting at the project.
+
+        Args:
+            prj (IfcProject): project of the original file
+
+        Yields:
+            tuple: parent, IfcRelAggregates and its spatial child elements
+        """
+        queue = deque([prj])
+        while queue:
+            parent = queue.popleft()
+            for rel in parent.IsDecomposedBy:
+                children = [
+                    child
+                    for child in rel.RelatedObjects
+                    if child.is_a("IfcSpatialStructureElement")
+                ]
+                if len(children) == 0:
+                    continue
+                yield parent, rel, children
+                queue.extend(children)
+
+    def add_owner_history(self, entity):
+        """Add the owner history of an entity to the filtered file. Mandatory in IFC2X3.
+
+        Args:
+            entity (IfcRoot): entity in the original file
+
+        Returns:
+            IfcOwnerHistory: owner history in the filtered file or None
+        """
+        if entity.OwnerHistory is None:
+            return None
+        return self.filtered_model.add(entity.OwnerHistory)
 
     def filter_objects(self, search_str: str):
         """Filter objects of a specific class and other attributes and properties.
@@ -119,21 +184,131 @@ class objectFilter:
 
         # TODO: useful for getting child elements
 
-    def create_materials(self):
-        """Get all materials from the original file and add them to the filtered file
+    def filter_region(
+        self, search_str=None, box=None, center=None, radius=None, storey=None
+    ):
+        """Filter objects by their location. The criteria given are combined, only
+        objects matching all of them are kept. Uses the cached R-tree of the model's
+        element bounding boxes, which is built on first use.
+        Typical usage: filter_region("IfcWall", center=np.array([1, 2, 0]), radius=2.0)
+
+        Args:
+            search_str (str, optional): selector syntax search string, see filter_objects
+            box (tuple, optional): min and max corner of a box in m, each shape (3,)
+            center (np.ndarray, optional): center of a search sphere in m, shape (3,)
+            radius (float, optional): radius of the search sphere in m
+            storey (str or IfcBuildingStorey, optional): building storey or its name
+
+        Raises:
+            ValueError: if only one of center and radius is given or no storey has
+                the name
+        """
+        if (center is None) != (radius is None):
+            raise ValueError("A search sphere needs a center and a radius")
+        spatial_index = SpatialIndex.from_model(self.ifc_model)
+        results = []
+        if search_str is not None:
+            results.append(util.selector.filter_elements(self.ifc_model, search_str))
+        if box is not None:
+            results.append(spatial_index.query_box(box[0], box[1]))
+        if center is not None:
+            results.append(spatial_index.query_sphere(center, radius))
+        if storey is not None:
+            if isinstance(storey, str):
+                # quoted, names may contain spaces like "Level 0"
+                quoted = storey.replace("\\", "\\\\").replace('"', '\\"')
+                storeys = util.selector.filter_elements(
+                    self.ifc_model, f'IfcBuildingStorey, Name="{quoted}"'
+                )
+                if len(storeys) == 0:
+                    raise ValueError(f"No building storey named {storey!r}")
+                storey = next(iter(storeys))
+            results.append(spatial_index.query_storey(storey))
+
+        if len(results) == 0:
+            print("No filter criteria given, passing ...")
+            return
+        ids = set.intersection(*({e.id() for e in r} for r in results))
+        self.objects = [self.ifc_model.by_id(i) for i in sorted(ids)]
+        print(f"{len(self.objects)} objects filtered")
+
+    def remap_materials(self) -> dict:
+        """Copy all materials, material layer sets, profile sets, constituent sets
+        and material lists to the filtered file, exactly once each. Materials are
+        keyed by entity id, so materials with duplicate names are kept apart.
 
         Returns:
-            dict: new materials and new material sets
+            dict: entity id of the original material -> material in the filtered file
         """
-        new_mats = {}
-        for m in self.materials:
-            new = self.filtered_model.add(m)
-            new_mats[new.Name] = new
-        new_mat_sets = {}
-        for mset in self.material_sets:
-            new_set = self.filtered_model.add(mset)
-            new_mat_sets[new_set.LayerSetName] = new_set
-        return new_mats, new_mat_sets
+        material_map = {}
+        for ifc_class in MATERIAL_CLASSES:
+            try:
+                materials = self.ifc_model.by_type(ifc_class)
+            except RuntimeError:
+                # class does not exist in the schema of the file e.g., IFC2X3
+                continue
+            for m in materials:
+                material_map[m.id()] = self.filtered_model.add(m)
+        print(f"Remapped {len(material_map)} materials")
+        return material_map
+
+    def index_materials(self, object_ids) -> dict:
+        """Get the materials of objects. All material associations are indexed once
+        instead of a lookup per object. Materials inherited from the object's type
+        are resolved with the IfcOpenShell element utils.
+
+        Args:
+            object_ids (iterable): entity ids of objects in the original file
+
+        Returns:
+            dict: entity id -> (material, IfcRelAssociatesMaterial or None if the
+            material is inherited), objects without material are skipped
+        """
+        object_ids = set(object_ids)
+        associations = {}
+        for rel in self.ifc_model.by_type("IfcRelAssociatesMaterial"):
+            for product in rel.RelatedObjects:
+                if product.id() in object_ids:
+                    associations[product.id()] = (rel.RelatingMaterial, rel)
+        for obj_id in object_ids.difference(associations):
+            obj_material = util.element.get_material(self.ifc_model.by_id(obj_id))
+            if obj_material is not None:
+                associations[obj_id] = (obj_material, None)
+        return associations
+
+    def associate_materials(self, object_map: dict, material_map: dict):
+        """Assign the materials of the original objects to the filtered objects.
+        Objects sharing the same material share one IfcRelAssociatesMaterial.
+        Material usages are copied once per usage.
+
+        Args:
+            object_map (dict): entity id of the original object -> filtered object
+            material_map (dict): returned by remap_materials()
+        """
+        groups = {}
+        materials = self.index_materials(object_map)
+        for obj_id, (obj_material, rel) in materials.items():
+            mat_id = obj_material.id()
+            if mat_id not in material_map:
+                # layer set and profile set usages reference their copied sets
+                material_map[mat_id] = self.filtered_model.add(obj_material)
+            groups.setdefault(mat_id, (rel, []))[1].append(object_map[obj_id])
+
+        for mat_id, (rel, new_objs) in groups.items():
+            # mandatory in IFC2X3, inherited materials have no relationship to copy
+            # the owner history from, use the one of the object
+            if rel is None:
+                owner_history = new_objs[0].OwnerHistory
+            else:
+                owner_history = self.add_owner_history(rel)
+            self.filtered_model.create_entity(
+                "IfcRelAssociatesMaterial",
+                GlobalId=ifcopenshell.guid.new(),
+                OwnerHistory=owner_history,
+                RelatedObjects=new_objs,
+                RelatingMaterial=material_map[mat_id],
+            )
+        print(f"Assigned {len(groups)} materials to {len(object_map)} objects")
 
     def assign_container(self, obj, new_obj):
         """Assign spatial container from the old object to the filtered object
@@ -142,17 +317,15 @@ class objectFilter:
             obj (IfcElement): element in the original file
             new_obj (IfcElement): filtered element in the filtered file
         """
-        container_info = util.element.get_container(obj).get_info()
-        new_container = list(
-            util.selector.filter_elements(
-                self.filtered_model,
-                f"{container_info.get('type')}, Name={container_info.get('Name')}",
-            )
-        )
+        container = util.element.get_container(obj)
+        new_container = self.spatial_map.get(container.id())
+        if new_container is None:
+            print(f"Container {container.Name} not in spatial hierarchy, passing")
+            return
         run(
             "spatial.assign_container",
             self.filtered_model,
-            relating_structure=new_container[0],
+            relating_structure=new_container,
             product=new_obj,
         )
 
@@ -174,53 +347,6 @@ class objectFilter:
                     element=new_obj,
                 )
 
-    def assign_material(self, obj, new_obj, new_mats, new_mat_sets):
-        """Assign materials to the filtered elements. Materials or material layer sets
-        are retrieved from the original objects.
-
-        Args:
-            obj (IfcElement): element in the original file
-            new_obj (IfcElement): filtered element in the filtered file
-            new_mats (dict): dictionary with new materials
-            new_mat_sets (dict): dictionary with new material layer sets
-        """
-        # BUG: get material layer sets
-        material = util.element.get_material(obj)
-        try:
-            if material.is_a("IfcMaterial"):
-                # print(f"Assign new material {new_mats.get(material.Name)}")
-                run(
-                    "material.assign_material",
-                    self.filtered_model,
-                    product=new_obj,
-                    material=new_mats.get(material.Name),
-                )
-
-            elif material.is_a("IfcMaterialLayerSetUsage"):
-                # print(
-                #     f"IfcMaterialLayerSetUsage, assign new material layer set {new_mat_sets.get(material[0].LayerSetName)}"
-                # )
-                run(
-                    "material.assign_material",
-                    self.filtered_model,
-                    product=new_obj,
-                    material=new_mat_sets.get(material[0].LayerSetName),
-                )
-            elif material.is_a("IfcMaterialLayerSet"):
-                # print(
-                #     f"IfcMaterialLayerSet, assign new material layer set {new_mat_sets.get(material.LayerSetName)}"
-                # )
-                run(
-                    "material.assign_material",
-                    self.filtered_model,
-                    product=new_obj,
-                    material=new_mat_sets.get(material.LayerSetName),
-                )
-        except TypeError:
-            print("Material is NoneType, passing")
-        except AttributeError:
-            print("Material is NoneType, passing")
-
     def assign_psets(self, obj, new_obj):
         """Add and assign psets
 
@@ -264,24 +390,143 @@ class objectFilter:
                     properties=p_dict,
                 )
 
-    def export_model(self):
-        """Execute filtering and save filtered model to IFC file"""
-        new_mats, new_mat_sets = self.create_materials()
+    def export_model(self, stream=False):
+        """Execute filtering and save filtered model to IFC file
+
+        Args:
+            stream (bool, optional): stream the filtered objects directly from the
+                original file to disk, see stream_model(). Defaults to False.
+        """
+        if stream:
+            self.stream_model()
+            return
+        telemetry = self.telemetry
+        with telemetry.stage("remap_materials"):
+            material_map = self.remap_materials()
+        object_map = {}
         for i, obj in enumerate(self.objects):
             # if obj.is_a("IfcElementAssembly"):
             #     print(util.element.get_decomposition(obj))
-            new_obj = self.filtered_model.add(obj)
-            self.assign_material(obj, new_obj, new_mats, new_mat_sets)
-            self.assign_psets(obj, new_obj)
-            self.assign_opening(obj, new_obj)
-            if util.element.get_container(obj) is not None:
-                self.assign_container(obj, new_obj)
+            with telemetry.stage("add_object"):
+                new_obj = self.filtered_model.add(obj)
+            object_map[obj.id()] = new_obj
+            with telemetry.stage("assign_psets"):
+                self.assign_psets(obj, new_obj)
+            with telemetry.stage("assign_opening"):
+                self.assign_opening(obj, new_obj)
+            with telemetry.stage("assign_container"):
+                if util.element.get_container(obj) is not None:
+                    self.assign_container(obj, new_obj)
+            telemetry.count("objects")
 
             if i % 100 == 0:
                 print(f"{i} / {len(self.objects)} processed")
+                telemetry.progress(i, len(self.objects))
 
+        with telemetry.stage("assign_material"):
+            self.associate_materials(object_map, material_map)
         print(f"Write filtered IFC file: {self.filtered_model_path}")
-        self.filtered_model.write(self.filtered_model_path)
+        with telemetry.stage("write"):
+            self.filtered_model.write(self.filtered_model_path)
+        summary = telemetry.summary()
+        print(f"Export stages in s: {summary.get('stages')}")
+
+    def stream_model(self):
+        """Write the filtered objects directly from the original file to disk with
+        the StreamingIfcWriter, without building the filtered model in memory.
+        Objects and their openings, placements, geometry, property sets and
+        materials are written once each as soon as they are reached.
+        Relationships are written with the filtered objects only. Use a path ending
+        with .ifczip for a compressed file.
+        """
+        telemetry = self.telemetry
+        prj = self.ifc_model.by_type("IfcProject")[0]
+        first_id = max(entity.id() for entity in self.ifc_model) + 1
+        object_ids = {obj.id() for obj in self.objects}
+        print(f"Stream filtered IFC file: {self.filtered_model_path}")
+        with StreamingIfcWriter(
+            self.filtered_model_path, self.ifc_model.schema, first_id
+        ) as writer:
+            # units, contexts and owner history are referenced by the project
+            writer.write_entity(prj)
+            spatial_ids = {prj.id()}
+            for parent, rel, children in self.iter_spatial_decomposition(prj):
+                spatial_ids.update(child.id() for child in children)
+                writer.write_new(
+                    "IfcRelAggregates",
+                    rel.GlobalId,
+                    rel.OwnerHistory,
+                    rel.Name,
+                    rel.Description,
+                    parent,
+                    children,
+                )
+
+            pset_rels = {}
+            containers = {}
+            for i, obj in enumerate(self.objects):
+                with telemetry.stage("write_object"):
+                    writer.write_entity(obj)
+                    for rel in getattr(obj, "HasOpenings", ()):
+                        writer.write_entity(rel)
+                for rel in obj.IsDefinedBy:
+                    if rel.is_a("IfcRelDefinesByProperties"):
+                        pset_rels.setdefault(rel.id(), (rel, []))[1].append(obj)
+                container = util.element.get_container(obj)
+                if container is not None and container.id() in spatial_ids:
+                    containers.setdefault(container.id(), (container, []))[1].append(
+                        obj
+                    )
+                telemetry.count("objects")
+                if i % 100 == 0:
+                    print(f"{i} / {len(self.objects)} processed")
+                    telemetry.progress(i, len(self.objects))
+
+            with telemetry.stage("assign_psets"):
+                for rel, objs in pset_rels.values():
+                    # keep the GlobalId if the relationship is not split
+                    keep = len(objs) == len(rel.RelatedObjects)
+                    writer.write_new(
+                        "IfcRelDefinesByProperties",
+                        rel.GlobalId if keep else ifcopenshell.guid.new(),
+                        rel.OwnerHistory,
+                        rel.Name,
+                        rel.Description,
+                        objs,
+                        rel.RelatingPropertyDefinition,
+                    )
+            with telemetry.stage("assign_material"):
+                groups = {}
+                materials = self.index_materials(object_ids)
+                for obj_id, (obj_material, rel) in materials.items():
+                    group = groups.setdefault(
+                        obj_material.id(), (obj_material, rel, [])
+                    )
+                    group[2].append(self.ifc_model.by_id(obj_id))
+                for obj_material, rel, objs in groups.values():
+                    writer.write_new(
+                        "IfcRelAssociatesMaterial",
+                        ifcopenshell.guid.new(),
+                        # mandatory in IFC2X3, written with the objects
+                        objs[0].OwnerHistory if rel is None else rel.OwnerHistory,
+                        None,
+                        None,
+                        objs,
+                        obj_material,
+                    )
+            with telemetry.stage("assign_container"):
+                for container, objs in containers.values():
+                    writer.write_new(
+                        "IfcRelContainedInSpatialStructure",
+                        ifcopenshell.guid.new(),
+                        prj.OwnerHistory,
+                        None,
+                        None,
+                        objs,
+                        container,
+                    )
+        summary = telemetry.summary()
+        print(f"Export stages in s: {summary.get('stages')}")
 
 
 def main():
@@ -294,7 +539,8 @@ def main():
     # scene = (
     # "/home/kaufmann/Desktop/ifcs_from_hell/SCE-ZBG-BI-9-M211-A0-XXX-00-00-P-0.ifc"
     # )
-    of = objectFilter(scene, f"{scene[:-4]}_filtered.ifc")
+    telemetry = Telemetry(scene, output=f"{scene[:-4]}_telemetry.jsonl")
+    of = objectFilter(scene, f"{scene[:-4]}_filtered.ifc", telemetry=telemetry)
     of.filter_objects("IfcSlab, IfcBeam")
     of.export_model()
     execution_time = time.perf_counter() - start
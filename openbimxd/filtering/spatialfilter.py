@@ -0,0 +1,201 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+
+import multiprocessing
+import time
+import weakref
+
+import numpy as np
+import ifcopenshell
+import ifcopenshell.geom
+import ifcopenshell.util.element
+from rtree import index
+
+# model -> {ifc class: spatial index}, see SpatialIndex.from_model(). Entries are
+# dropped with their model, the indices only hold a weak reference to it.
+_INDEX_CACHE = weakref.WeakKeyDictionary()
+
+
+class SpatialIndex:
+    """
+    A class to query IFC elements by their location. The world-space axis aligned
+    bounding boxes (AABBs) of all elements are computed once and stored in an R-tree.
+
+    Attributes:
+        model (ifcopenshell.file): IFC model the index is built for, weakly referenced
+        ids (np.ndarray): entity ids of the indexed elements, shape (n, )
+        aabbs (np.ndarray): AABBs as min and max corner in m, shape (n, 6)
+    """
+
+    def __init__(self, model: ifcopenshell.file, ifc_class="IfcElement") -> None:
+        """Initialize SpatialIndex. Tessellates all elements of the given class once
+        with the multi-threaded geometry iterator and builds the R-tree from
+        their bounding boxes.
+
+        Args:
+            model (ifcopenshell.file): IFC model
+            ifc_class (str, optional): class of the indexed elements.
+                Defaults to "IfcElement".
+        """
+        self._model = weakref.ref(model)
+        start = time.perf_counter()
+        ids, aabbs = self.compute_aabbs(model, model.by_type(ifc_class))
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.aabbs = np.asarray(aabbs, dtype=float).reshape((-1, 6))
+
+        # bulk loading packs the tree much better than inserting one by one
+        properties = index.Property()
+        properties.dimension = 3
+        self.tree = index.Index(
+            ((i, tuple(bx), None) for i, bx in enumerate(self.aabbs)),
+            properties=properties,
+        )
+        print(
+            f"Indexed {len(self.ids)} elements in {time.perf_counter() - start:.2f} s"
+        )
+
+    @property
+    def model(self) -> ifcopenshell.file:
+        """The IFC model the index is built for"""
+        return self._model()
+
+    @classmethod
+    def from_model(cls, model: ifcopenshell.file, ifc_class="IfcElement"):
+        """Get the cached spatial index of a model, builds it on first use. The
+        index is not updated when the model is edited, call invalidate() after
+        moving, adding or removing elements.
+
+        Args:
+            model (ifcopenshell.file): IFC model
+            ifc_class (str, optional): class of the indexed elements.
+                Defaults to "IfcElement".
+
+        Returns:
+            SpatialIndex: spatial index of the model
+        """
+        indices = _INDEX_CACHE.setdefault(model, {})
+        cached = indices.get(ifc_class)
+        if cached is None:
+            cached = cls(model, ifc_class)
+            indices[ifc_class] = cached
+        return cached
+
+    @staticmethod
+    def invalidate(model: ifcopenshell.file) -> None:
+        """Drop the cached spatial indices of a model after it was edited, the next
+        from_model() rebuilds them.
+
+        Args:
+            model (ifcopenshell.file): IFC model
+        """
+        _INDEX_CACHE.pop(model, None)
+
+    @staticmethod
+    def compute_aabbs(model: ifcopenshell.file, elements) -> tuple[list, list]:
+        """Compute the world-space AABBs of elements with geometry.
+
+        Args:
+            model (ifcopenshell.file): IFC model
+            elements (list): IFC elements
+
+        Returns:
+            list: entity ids of elements with geometry
+            list: AABBs (xmin, ymin, zmin, xmax, ymax, zmax) in m
+        """
+        ids = []
+        aabbs = []
+        elements = [e for e in elements if e.Representation is not None]
+        if len(elements) == 0:
+            return ids, aabbs
+        settings = ifcopenshell.geom.settings()
+        settings.set(settings.USE_WORLD_COORDS, True)
+        # openings do not change the extent of an element
+        settings.set(settings.DISABLE_OPENING_SUBTRACTIONS, True)
+        iterator = ifcopenshell.geom.iterator(
+            settings, model, multiprocessing.cpu_count(), include=elements
+        )
+        if iterator.initialize():
+            while True:
+                shape = iterator.get()
+                verts = np.asarray(shape.geometry.verts).reshape((-1, 3))
+                if verts.shape[0] > 0:
+                    ids.append(shape.id)
+                    aabbs.append(np.hstack((verts.min(axis=0), verts.max(axis=0))))
+                if not iterator.next():
+                    break
+        return ids, aabbs
+
+    def _elements(self, rows) -> list:
+        """Get the IFC elements of index rows, ordered by entity id"""
+        return [self.model.by_id(int(i)) for i in np.sort(self.ids[rows])]
+
+    def query_box(self, min_pt: np.ndarray, max_pt: np.ndarray) -> list:
+        """Get all elements whose AABB intersects the box.
+
+        Args:
+            min_pt (np.ndarray): minimum corner of the box in m, shape (3,)
+            max_pt (np.ndarray): maximum corner of the box in m, shape (3,)
+
+        Returns:
+            list: intersecting IFC elements
+        """
+        coords = tuple(np.hstack((min_pt, max_pt)).astype(float))
+        rows = np.fromiter(self.tree.intersection(coords), dtype=np.int64)
+        return self._elements(rows)
+
+    def query_sphere(self, center: np.ndarray, radius: float) -> list:
+        """Get all elements whose AABB is within a distance to a point.
+
+        Args:
+            center (np.ndarray): center point in m, shape (3,)
+            radius (float): search radius in m
+
+        Returns:
+            list: IFC elements within the radius
+        """
+        center = np.asarray(center, dtype=float)
+        coords = tuple(np.hstack((center - radius, center + radius)))
+        rows = np.fromiter(self.tree.intersection(coords), dtype=np.int64)
+        # exact point to box distance for the R-tree candidates
+        candidates = self.aabbs[rows]
+        closest = np.clip(center, candidates[:, :3], candidates[:, 3:])
+        in_sphere = np.linalg.norm(closest - center, axis=1) <= radius
+        return self._elements(rows[in_sphere])
+
+    def query_storey(self, storey) -> list:
+        """Get all indexed elements contained in a building storey, including
+        elements of nested spatial elements such as spaces.
+
+        Args:
+            storey (IfcBuildingStorey): building storey
+
+        Returns:
+            list: IFC elements of the storey
+        """
+        contained = {
+            e.id() for e in ifcopenshell.util.element.get_decomposition(storey)
+        }
+        rows = np.flatnonzero(np.isin(self.ids, list(contained)))
+        return self._elements(rows)
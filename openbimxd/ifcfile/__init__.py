@@ -30,8 +30,39 @@ CLASSES
     IfcModelBuilder
         Creates an IFC file and odel with a project, site, building, building storey
         in a given IFC schema. 
+    ifcwriter / StreamingIfcWriter
+        Writes an IFC file entity by entity through a temporary file with atomic
+        rename, optionally compressed as ifcZIP.
+    instancer / RepresentationInstancer
+        Shares the geometry of elements with the same quantized dimensions through
+        one IfcRepresentationMap per shape, referenced by IfcMappedItem.
+    entitypool / EntityPool
+        Reuses points, directions and axis placements with equal values within a
+        tolerance, merges the duplicates of the whole model with dedupe().
+    sharding / ShardedModelBuilder
+        Builds shards of elements e.g., per storey or tile, in worker processes with
+        deterministic GlobalIds and merges them into one model sharing the project,
+        site, building, storeys, units, contexts and materials.
 
 FUNCTIONS
+    add_storeys
+        Creates building storeys from a list of elevations
+    storey_at
+        Gets the storey of an element by binary search on the storey elevations
+    assign_container / assign_pset
+        Assigns products to a storey or a property set. In deferred mode, products
+        register and the relationships are emitted once by finalize()
+    finalize
+        Emits one containment per storey and one property set per distinct values
+    body_representation
+        Gets the body representation of an element, instanced if enabled
+    edit_object_placement
+        Sets the placement of a product, gathered in relocate() mode
+    relocate
+        Context manager gathering placement edits, the relative placements are
+        computed once on exit
+    flush
+        In stream mode, writes finished products to disk and releases their geometry
     write
         Writes the IFC model to a file. 
 """
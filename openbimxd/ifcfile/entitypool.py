@@ -0,0 +1,225 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+# classes merged by dedupe(), placements after the points and directions they use
+DEDUPED_CLASSES = (
+    "IfcCartesianPoint",
+    "IfcDirection",
+    "IfcAxis2Placement2D",
+    "IfcAxis2Placement3D",
+)
+
+
+class EntityPool:
+    """
+    A class to reuse geometric primitives with equal values. Points and directions
+    are keyed by their coordinates quantized to a tolerance, axis placements by
+    their point and directions. Pooled entities are shared, edit them through the
+    ifcupdate handles, which replace shared entities before editing in place.
+
+    Attributes:
+        model (ifcopenshell.file): IFC model the entities are created in
+        tolerance (float): quantization step of the coordinates in project units
+        entities (dict): key -> id of the pooled entity
+        ids (set): ids of the pooled entities
+    """
+
+    def __init__(self, model, tolerance=1e-6) -> None:
+        """Initialize EntityPool.
+
+        Args:
+            model (ifcopenshell.file): IFC model the entities are created in
+            tolerance (float, optional): quantization step of the coordinates and
+                direction ratios. Defaults to 1e-6.
+        """
+        self.model = model
+        self.tolerance = tolerance
+        self.entities = {}
+        self.ids = set()
+        self.num_requests = 0
+
+    def quantize(self, values) -> tuple:
+        """Quantize coordinates to integer multiples of the tolerance"""
+        # faster than NumPy for a few values
+        return tuple(round(value / self.tolerance) for value in values)
+
+    def key(self, entity) -> tuple:
+        """Get the pool key of an entity of the DEDUPED_CLASSES.
+
+        Args:
+            entity (entity_instance): point, direction or axis placement
+
+        Returns:
+            tuple: class and quantized values or ids of the referenced entities
+        """
+        if entity.is_a("IfcCartesianPoint"):
+            return ("IfcCartesianPoint", self.quantize(entity.Coordinates))
+        if entity.is_a("IfcDirection"):
+            return ("IfcDirection", self.quantize(entity.DirectionRatios))
+        references = tuple(0 if v is None else v.id() for v in entity)
+        return (entity.is_a(), references)
+
+    def get(self, key: tuple, create):
+        """Get the pooled entity of a key, create it on first use.
+
+        Args:
+            key (tuple): pool key
+            create (callable): creates the entity
+
+        Returns:
+            entity_instance: pooled entity
+        """
+        self.num_requests += 1
+        entity = self.lookup(key)
+        if entity is None:
+            entity = create()
+            self.entities[key] = entity.id()
+            self.ids.add(entity.id())
+        return entity
+
+    def lookup(self, key: tuple):
+        """Get the pooled entity of a key, None if there is none. Pooled entities
+        used once may have been removed or edited in place e.g., by the IfcOpenShell
+        API, they are looked up by id and checked.
+
+        Args:
+            key (tuple): pool key
+
+        Returns:
+            entity_instance: pooled entity
+        """
+        entity_id = self.entities.get(key)
+        if entity_id is None:
+            return None
+        try:
+            entity = self.model.by_id(entity_id)
+        except RuntimeError:
+            entity = None
+        if entity is None or self.key(entity) != key:
+            del self.entities[key]
+            self.ids.discard(entity_id)
+            return None
+        return entity
+
+    def point(self, coordinates):
+        """Get an IfcCartesianPoint, coordinates in project units"""
+        coordinates = [float(c) for c in coordinates]
+        return self.get(
+            ("IfcCartesianPoint", self.quantize(coordinates)),
+            lambda: self.model.createIfcCartesianPoint(coordinates),
+        )
+
+    def direction(self, ratios):
+        """Get an IfcDirection"""
+        ratios = [float(r) for r in ratios]
+        return self.get(
+            ("IfcDirection", self.quantize(ratios)),
+            lambda: self.model.createIfcDirection(ratios),
+        )
+
+    def axis2placement3d(self, location, axis=None, ref_direction=None):
+        """Get an IfcAxis2Placement3D.
+
+        Args:
+            location (list): coordinates in project units
+            axis (list, optional): Z axis direction. Defaults to None.
+            ref_direction (list, optional): X axis direction. Defaults to None.
+
+        Returns:
+            IfcAxis2Placement3D: pooled placement
+        """
+        values = [self.point(location)]
+        values.append(None if axis is None else self.direction(axis))
+        values.append(None if ref_direction is None else self.direction(ref_direction))
+        references = tuple(0 if v is None else v.id() for v in values)
+        return self.get(
+            ("IfcAxis2Placement3D", references),
+            lambda: self.model.createIfcAxis2Placement3D(*values),
+        )
+
+    def axis2placement2d(self, location, ref_direction=None):
+        """Get an IfcAxis2Placement2D, location in project units"""
+        values = [self.point(location)]
+        values.append(None if ref_direction is None else self.direction(ref_direction))
+        references = tuple(0 if v is None else v.id() for v in values)
+        return self.get(
+            ("IfcAxis2Placement2D", references),
+            lambda: self.model.createIfcAxis2Placement2D(*values),
+        )
+
+    def dedupe(self) -> int:
+        """Merge equal points, directions and axis placements of the whole model,
+        e.g. created by the IfcOpenShell API. References to duplicates are
+        relinked to the pooled entity and the duplicates are removed.
+
+        Returns:
+            int: number of removed entities
+        """
+        duplicates = []
+        for ifc_class in DEDUPED_CLASSES:
+            for entity in self.model.by_type(ifc_class, include_subtypes=False):
+                key = self.key(entity)
+                pooled = self.lookup(key)
+                if pooled is None:
+                    self.entities[key] = entity.id()
+                    self.ids.add(entity.id())
+                    continue
+                if pooled == entity:
+                    continue
+                self.relink(entity, pooled)
+                duplicates.append(entity)
+        # the duplicates are not referenced anymore, batch removal skips the
+        # inverse updates
+        self.model.batch()
+        for entity in duplicates:
+            self.model.remove(entity)
+        self.model.unbatch()
+        return len(duplicates)
+
+    def relink(self, old, new) -> None:
+        """Replace all references to an entity.
+
+        Args:
+            old (entity_instance): referenced entity
+            new (entity_instance): replacement
+        """
+
+        def replace(value):
+            if isinstance(value, tuple):
+                return tuple(replace(v) for v in value)
+            return new if value == old else value
+
+        for inverse in self.model.get_inverse(old):
+            for i, value in enumerate(inverse):
+                replaced = replace(value)
+                if replaced != value:
+                    inverse[i] = replaced
+
+    def __str__(self) -> str:
+        """Print string
+
+        Returns:
+            string: String to be printed when print()
+        """
+        return f"{len(self.entities)} pooled entities for {self.num_requests} requests"
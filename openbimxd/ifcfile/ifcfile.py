@@ -22,8 +22,20 @@
 # This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
 # Dion Moult for his great work
 
+import bisect
+from contextlib import contextmanager
+
+import numpy as np
+
 import ifcopenshell
+import ifcopenshell.guid
 from ifcopenshell.api import run
+from ifcopenshell.util import placement, unit
+
+from openbimxd.ifcfile.entitypool import EntityPool
+from openbimxd.ifcfile.ifcwriter import StreamingIfcWriter
+from openbimxd.ifcfile.instancer import RepresentationInstancer
+from openbimxd.ifcupdate.relocation import BulkRelocation
 
 
 class IfcModelBuilder:
@@ -37,6 +49,13 @@ class IfcModelBuilder:
         building_name (str): optional, name of the IfcBuilding
         storey_name (str): optional, name of the IfcBuildingStorey
         schema (str): optional, identifies the IFC schema. Typically IFC2X3 or IFC4
+        stream (bool): optional, stream finished elements to disk, see flush()
+        instancing_tolerance (float): optional, share the geometry of elements with
+            the same dimensions, see body_representation()
+        deferred (bool): optional, emit containment and property sets once on
+            finalize(), see assign_container() and assign_pset()
+        dedupe (bool): optional, merge equal points, directions and axis
+            placements of the whole model on write(), see EntityPool.dedupe()
 
     """
 
@@ -48,6 +67,10 @@ class IfcModelBuilder:
         building_name="building A",
         storey_name="Level 0",
         schema="IFC4",
+        stream=False,
+        instancing_tolerance=None,
+        deferred=False,
+        dedupe=False,
     ) -> None:
         """
         Constructs an IfcModelBuilder object
@@ -59,6 +82,18 @@ class IfcModelBuilder:
             building_name (str): optional, name of the IfcBuilding
             storey_name (str): optional, name of the IfcBuildingStorey
             schema (str): optional, identifies the IFC schema. Typically IFC2X3 or IFC4
+            stream (bool): optional, stream finished elements to disk with flush().
+                Use a filename ending with .ifczip for a compressed file.
+            instancing_tolerance (float): optional, element dimensions are quantized
+                to this tolerance in m and elements with the same quantized
+                dimensions share their geometry through an IfcRepresentationMap.
+            deferred (bool): optional, elements register their containment and
+                property sets, which are emitted once per storey and once per
+                distinct property set on finalize() i.e., write().
+            dedupe (bool): optional, merge equal geometric primitives created by the
+                IfcOpenShell API on write(). Primitives created by the builder are
+                always reused from the entity pool. Not supported in stream mode, as
+                the streamed entities are already written.
 
         """
 
@@ -70,6 +105,14 @@ class IfcModelBuilder:
         self.schema = schema
 
         self.model = ifcopenshell.file(schema=self.schema)
+        # reuses points, directions and axis placements with equal values
+        self.pool = EntityPool(self.model)
+        self.dedupe = dedupe
+        self.writer = None
+        # gathers placement edits in relocate() mode
+        self.relocation = None
+        if stream:
+            self.writer = StreamingIfcWriter(self.filename, self.schema)
 
         self.project = run(
             "root.create_entity",
@@ -80,6 +123,7 @@ class IfcModelBuilder:
 
         # Specify units: millimeters, square meters, and cubic meters
         run("unit.assign_unit", self.model)
+        self.unit_scale = unit.calculate_unit_scale(self.model)
 
         # Let's create a modeling geometry context, so we can store 3D geometry
         self.context = run("context.add_context", self.model, context_type="Model")
@@ -94,6 +138,15 @@ class IfcModelBuilder:
             parent=self.context,
         )
 
+        self.deferred = deferred
+        # storey id -> (storey, products), emitted on finalize()
+        self.pending_containment = {}
+        # (pset name, properties) -> (pset name, properties dict, products)
+        self.pending_psets = {}
+        self.instancer = None
+        if instancing_tolerance is not None:
+            self.instancer = RepresentationInstancer(self, instancing_tolerance)
+
         # Create a site, building, and storey. Many hierarchies are possible.
         self.site = run(
             "root.create_entity", self.model, ifc_class="IfcSite", name=self.site_name
@@ -131,7 +184,319 @@ class IfcModelBuilder:
             relating_object=self.building,
             product=self.storey,
         )
+        # storeys sorted by elevation in m, the first storey is at 0.0
+        self.storey.Elevation = 0.0
+        self.storeys = [self.storey]
+        self.elevations = [0.0]
+
+    def add_storeys(self, elevations, names=None, tolerance=0.05) -> list:
+        """Create building storeys at elevations, elevations of existing storeys
+        within the tolerance are passed.
+
+        Args:
+            elevations (list): elevations of the storeys in m
+            names (list, optional): names of the storeys. Defaults to None,
+                "Level <elevation>".
+            tolerance (float, optional): in m. Defaults to 0.05.
+
+        Returns:
+            list: IfcBuildingStorey per elevation, existing ones included
+        """
+        storeys = []
+        for i, elevation in enumerate(elevations):
+            elevation = float(elevation)
+            index = bisect.bisect_left(self.elevations, elevation - tolerance)
+            if (
+                index < len(self.elevations)
+                and abs(self.elevations[index] - elevation) <= tolerance
+            ):
+                storeys.append(self.storeys[index])
+                continue
+            storey = run(
+                "root.create_entity",
+                self.model,
+                ifc_class="IfcBuildingStorey",
+                name=f"Level {elevation:g}" if names is None else names[i],
+            )
+            storey.Elevation = elevation / self.unit_scale
+            run(
+                "aggregate.assign_object",
+                self.model,
+                relating_object=self.building,
+                product=storey,
+            )
+            self.elevations.insert(index, elevation)
+            self.storeys.insert(index, storey)
+            storeys.append(storey)
+        return storeys
+
+    def storey_at(self, z_min: float, tolerance=0.05):
+        """Get the storey of an element by the bottom of its z-range, using binary
+        search on the sorted storey elevations.
+
+        Args:
+            z_min (float): lowest z coordinate of the element in m
+            tolerance (float, optional): elements starting up to this distance below
+                a storey elevation belong to that storey, in m. Defaults to 0.05.
+
+        Returns:
+            IfcBuildingStorey: the highest storey at or below the element
+        """
+        index = bisect.bisect_right(self.elevations, float(z_min) + tolerance) - 1
+        return self.storeys[max(index, 0)]
+
+    def assign_container(self, products, storey=None) -> None:
+        """Assign products to a building storey. In deferred mode, the products are
+        registered and assigned with one relationship per storey on finalize().
+
+        Args:
+            products (list): IFC products
+            storey (IfcBuildingStorey, optional): Defaults to None, the storey of
+                the builder.
+        """
+        if storey is None:
+            storey = self.storey
+        if not self.deferred:
+            for product in products:
+                run(
+                    "spatial.assign_container",
+                    self.model,
+                    relating_structure=storey,
+                    product=product,
+                )
+            return
+        _, pending = self.pending_containment.setdefault(storey.id(), (storey, []))
+        pending.extend(products)
+
+    def assign_pset(self, products, name: str, properties: dict) -> None:
+        """Assign a property set to products. In deferred mode, products with the
+        same property set name and values share one property set and relationship
+        created on finalize().
+
+        Args:
+            products (list): IFC products
+            name (str): name of the property set
+            properties (dict): property values e.g., {"LoadBearing": True}
+        """
+        if not self.deferred:
+            for product in products:
+                pset = run("pset.add_pset", self.model, product=product, name=name)
+                run("pset.edit_pset", self.model, pset=pset, properties=properties)
+            return
+        key = (name, tuple(sorted((k, repr(v)) for k, v in properties.items())))
+        _, _, pending = self.pending_psets.setdefault(key, (name, properties, []))
+        pending.extend(products)
+
+    def finalize(self) -> None:
+        """Emit the registered containment and property sets of deferred mode, one
+        IfcRelContainedInSpatialStructure per storey and one IfcPropertySet with
+        IfcRelDefinesByProperties per distinct property set."""
+        # a product registered twice with the same property set name keeps the
+        # last registered values
+        assigned = set()
+        for name, properties, products in reversed(self.pending_psets.values()):
+            products = [p for p in products if (p.id(), name) not in assigned]
+            assigned.update((p.id(), name) for p in products)
+            if len(products) == 0:
+                continue
+            # like the API, mandatory in IFC2X3
+            pset = self.model.createIfcPropertySet(
+                ifcopenshell.guid.new(),
+                run("owner.create_owner_history", self.model),
+                name,
+                None,
+                [],
+            )
+            run("pset.edit_pset", self.model, pset=pset, properties=properties)
+            self.model.createIfcRelDefinesByProperties(
+                ifcopenshell.guid.new(),
+                run("owner.create_owner_history", self.model),
+                None,
+                None,
+                products,
+                pset,
+            )
+        for storey, products in self.pending_containment.values():
+            if len(storey.ContainsElements) == 0:
+                run(
+                    "spatial.assign_container",
+                    self.model,
+                    relating_structure=storey,
+                    product=products[0],
+                )
+            rel = storey.ContainsElements[0]
+            contained = set(e.id() for e in rel.RelatedElements)
+            rel.RelatedElements = list(rel.RelatedElements) + [
+                p for p in products if p.id() not in contained
+            ]
+        if self.pending_psets or self.pending_containment:
+            print(
+                f"Emitted {len(self.pending_psets)} property sets and containment in "
+                f"{len(self.pending_containment)} storeys"
+            )
+        self.pending_psets = {}
+        self.pending_containment = {}
+
+    def body_representation(self, shape_type: str, dims, create_representation):
+        """Get the body representation of an element. With instancing, elements
+        with the same quantized dimensions share one mapped representation.
+
+        Args:
+            shape_type (str): kind of shape e.g., IfcWall or IfcColumn/round
+            dims (np.ndarray): dimensions in m e.g., length, width, height
+            create_representation (callable): creates the IfcShapeRepresentation
+                from dimensions
+
+        Returns:
+            IfcShapeRepresentation: body representation to assign to the element
+        """
+        if self.instancer is None:
+            return create_representation(dims)
+        return self.instancer.get_representation(
+            shape_type, dims, create_representation
+        )
+
+    @staticmethod
+    def placement_rel_to(product):
+        """Get the placement a new placement of a product is relative to, in the
+        order of the geometry.edit_object_placement API: aggregate or nest parent,
+        voided or filled element, then spatial container.
+
+        Args:
+            product (IfcProduct): product without placement
+
+        Returns:
+            IfcObjectPlacement: placement of the parent, None for absolute
+        """
+        for inverse, attribute in (
+            ("Decomposes", "RelatingObject"),
+            ("Nests", "RelatingObject"),
+            ("VoidsElements", "RelatingBuildingElement"),
+            ("FillsVoids", "RelatingOpeningElement"),
+            ("ProjectsElements", "RelatingElement"),
+            ("ContainedInStructure", "RelatingStructure"),
+        ):
+            rels = getattr(product, inverse, None)
+            if rels:
+                return getattr(getattr(rels[0], attribute), "ObjectPlacement", None)
+        return None
+
+    def edit_object_placement(self, product, matrix) -> None:
+        """Set the placement of a product. In relocate() mode, the edit is gathered
+        and computed on exit. New placements reuse the directions of the entity
+        pool.
+
+        Args:
+            product (IfcProduct): product to place
+            matrix (np.ndarray): world placement matrix in SI units, shape (4, 4)
+        """
+        if self.relocation is not None:
+            self.relocation.move(product, matrix)
+            return
+        if product.ObjectPlacement is None:
+            # relative to the same placement the API would use, e.g. the host wall
+            # of an opening, so the product moves with it
+            placement_rel_to = self.placement_rel_to(product)
+            matrix = np.asarray(matrix, dtype=float)
+            if placement_rel_to is not None:
+                rel_matrix = placement.get_local_placement(placement_rel_to)
+                rel_matrix[:3, 3] *= self.unit_scale
+                matrix = np.linalg.inv(rel_matrix) @ matrix
+            location = (matrix[:3, 3] / self.unit_scale).tolist()
+            product.ObjectPlacement = self.model.createIfcLocalPlacement(
+                placement_rel_to,
+                self.model.createIfcAxis2Placement3D(
+                    self.model.createIfcCartesianPoint(location),
+                    self.pool.direction(matrix[:3, 2]),
+                    self.pool.direction(matrix[:3, 0]),
+                ),
+            )
+            return
+        run(
+            "geometry.edit_object_placement",
+            self.model,
+            product=product,
+            matrix=matrix,
+            is_si=True,
+        )
+
+    @contextmanager
+    def relocate(self):
+        """Gather the placement edits of elements created or moved in the with
+        block, the relative placements are computed once on exit. Placements are
+        not available inside the block e.g., for get_verts().
+
+        Yields:
+            BulkRelocation: the gathered placement edits
+        """
+        self.relocation = BulkRelocation(self.model)
+        try:
+            with self.relocation:
+                yield self.relocation
+        finally:
+            self.relocation = None
+
+    def flush(self, products, release=True) -> None:
+        """Stream finished products to disk, only in stream mode. Writes the
+        products with placement and geometry. Relationships e.g., containment,
+        materials and property sets are written by write(), as they may still change.
+
+        Args:
+            products (list): finished IFC products e.g., IfcWall objects' wall
+            release (bool, optional): remove the written geometry representations
+                from the in-memory model, so memory depends on the working set. The
+                products cannot be tessellated anymore afterwards. Defaults to True.
+        """
+        if self.writer is None:
+            print("Not in stream mode, passing ...")
+            return
+        for product in products:
+            self.writer.write_entity(product)
+            if release and product.Representation is not None:
+                self.release(product)
+
+    def release(self, product) -> None:
+        """Remove the geometry representation of a written product from the model.
+        Entities shared with other products e.g., contexts, are kept.
+
+        Args:
+            product (IfcProduct): product whose representation is removed
+        """
+        subgraph = self.model.traverse(product.Representation)
+        removable = {product.id()}
+        # entities also referenced from outside the subgraph are kept, to be safe
+        # this includes entities whose referencing entity was not checked yet
+        for entity in subgraph:
+            # contexts and instanced shapes are only referenced by representations,
+            # but are shared
+            if entity.is_a("IfcRepresentationContext") or entity.is_a(
+                "IfcRepresentationMap"
+            ):
+                continue
+            # pooled entities are reused by later products
+            if entity.id() in self.pool.ids:
+                continue
+            inverses = self.model.get_inverse(entity)
+            if all(inverse.id() in removable for inverse in inverses):
+                removable.add(entity.id())
+        to_remove = [entity for entity in subgraph if entity.id() in removable]
+        product.Representation = None
+        for entity in to_remove:
+            self.model.remove(entity)
 
     def write(self):
-        """Write the IFC model to file."""
+        """Write the IFC model to file. In stream mode, writes all remaining
+        entities and moves the streamed file to filename. In deferred mode, the
+        registered relationships are emitted first. With dedupe, equal geometric
+        primitives are merged before writing."""
+        self.finalize()
+        if self.dedupe and self.writer is None:
+            num_removed = self.pool.dedupe()
+            print(f"Merged {num_removed} duplicate geometric entities, {self.pool}")
+        if self.writer is not None:
+            for entity in self.model:
+                self.writer.write_entity(entity)
+            self.writer.close()
+            self.writer = None
+            return
         self.model.write(self.filename)
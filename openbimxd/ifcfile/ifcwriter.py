@@ -0,0 +1,245 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+
+import io
+import os
+import re
+import tempfile
+import time
+import zipfile
+
+import ifcopenshell
+
+# splits a STEP line into string literals and the rest
+STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+# entity and type keywords are followed by an opening bracket
+KEYWORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?=\()")
+NON_ASCII = re.compile(r"[^\x20-\x7e]")
+
+
+def encode_char(match) -> str:
+    """Encode a non ASCII character as ISO 10303-21 control directive"""
+    code = ord(match.group(0))
+    if code > 0xFFFF:
+        return f"\\X4\\{code:08X}\\X0\\"
+    return f"\\X2\\{code:04X}\\X0\\"
+
+
+def to_spf(line: str) -> str:
+    """Convert the string representation of an entity into a valid STEP physical
+    file line: upper case keywords, escaped backslashes and encoded non ASCII
+    characters.
+
+    Args:
+        line (str): entity string e.g., "#1=IfcWall('3dX...',$,...)"
+
+    Returns:
+        str: STEP line without the terminating semicolon
+    """
+    parts = STRING_LITERAL.split(line)
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            parts[i] = KEYWORD.sub(lambda m: m.group(0).upper(), part)
+        else:
+            parts[i] = NON_ASCII.sub(encode_char, part.replace("\\", "\\\\"))
+    return "".join(parts)
+
+
+def entity_to_spf(entity) -> str:
+    """Serialize a model entity as valid STEP physical file line, strings are
+    quoted and encoded by IfcOpenShell the same way as when writing a file.
+
+    Args:
+        entity (ifcopenshell.entity_instance): entity of a model
+
+    Returns:
+        str: STEP line without the terminating semicolon
+    """
+    data = entity.wrapped_data
+    if hasattr(data, "to_string"):
+        return data.to_string(True)
+    # upper case keywords and encoded strings, as used by the file writer
+    return data.toString(True)
+
+
+class StreamingIfcWriter:
+    """
+    A class to write an IFC file entity by entity instead of serializing a complete
+    model at the end. Entities are written as soon as they are final, already
+    written entities are skipped. The file is written to a temporary file in the
+    target directory and renamed when closed, so the target is never incomplete.
+    Files ending with .ifczip are written as compressed ifcZIP archive.
+
+    Attributes:
+        filename (str): path of the target file
+        schema (str): IFC schema e.g., IFC2X3 or IFC4
+        next_id (int): id of the next entity created with write_new()
+    """
+
+    def __init__(self, filename, schema="IFC4", first_id=1) -> None:
+        """Initialize StreamingIfcWriter, opens the temporary file and writes the
+        header.
+
+        Args:
+            filename (str): path of the target file, .ifc or .ifczip
+            schema (str, optional): IFC schema. Defaults to "IFC4".
+            first_id (int, optional): id of the first entity created with
+                write_new(). Has to be larger than the ids of all written model
+                entities. Defaults to 1.
+        """
+        self.filename = filename
+        self.schema = schema
+        self.next_id = first_id
+        self.written = set()
+        self.num_written = 0
+
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, self.tmp_filename = tempfile.mkstemp(
+            dir=directory, prefix=".", suffix=".tmp"
+        )
+        self._file = os.fdopen(fd, "wb")
+        self._zip = None
+        if filename.lower().endswith(".ifczip"):
+            self._zip = zipfile.ZipFile(
+                self._file, "w", compression=zipfile.ZIP_DEFLATED
+            )
+            name = f"{os.path.splitext(os.path.basename(filename))[0]}.ifc"
+            raw = self._zip.open(name, "w", force_zip64=True)
+        else:
+            raw = self._file
+        self._out = io.TextIOWrapper(raw, encoding="ascii", newline="\n")
+        self.write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write_header(self) -> None:
+        """Write the ISO 10303-21 header"""
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+        name = to_spf(self.to_step_value(os.path.basename(self.filename)))
+        self._out.write(
+            "ISO-10303-21;\n"
+            "HEADER;\n"
+            "FILE_DESCRIPTION(('ViewDefinition [CoordinationView]'),'2;1');\n"
+            f"FILE_NAME({name},'{timestamp}',(''),(''),'openbimxd','openbimxd','');\n"
+            f"FILE_SCHEMA(('{self.schema}'));\n"
+            "ENDSEC;\n"
+            "DATA;\n"
+        )
+
+    def write_entity(self, entity) -> int:
+        """Write an entity and all entities it references that are not written yet.
+
+        Args:
+            entity (ifcopenshell.entity_instance): entity of a model
+
+        Returns:
+            int: id of the entity in the written file
+        """
+        stack = [entity]
+        while stack:
+            current = stack.pop()
+            if current.id() in self.written:
+                continue
+            self.written.add(current.id())
+            self._out.write(f"{entity_to_spf(current)};\n")
+            self.num_written += 1
+            values = list(current)
+            while values:
+                value = values.pop()
+                if isinstance(value, ifcopenshell.entity_instance):
+                    # inline typed values e.g., IfcReal(1.) have no id
+                    if value.id() != 0 and value.id() not in self.written:
+                        stack.append(value)
+                elif isinstance(value, (tuple, list)):
+                    values.extend(value)
+        return entity.id()
+
+    def write_new(self, ifc_class: str, *attributes) -> int:
+        """Write a new entity that does not exist in a model, typically a
+        relationship with a subset of the related objects of the original one.
+        Referenced entities are written if not written yet.
+
+        Args:
+            ifc_class (str): IFC class e.g., IfcRelAggregates
+            *attributes: attribute values in schema order. Entities, strings,
+                numbers, booleans, None and lists thereof are supported.
+
+        Returns:
+            int: id of the new entity
+        """
+        step_id = self.next_id
+        self.next_id += 1
+        values = ",".join(self.to_step_value(a) for a in attributes)
+        self._out.write(to_spf(f"#{step_id}={ifc_class}({values})") + ";\n")
+        self.num_written += 1
+        return step_id
+
+    def to_step_value(self, value) -> str:
+        """Convert an attribute value to its STEP representation"""
+        if value is None:
+            return "$"
+        if isinstance(value, ifcopenshell.entity_instance):
+            return f"#{self.write_entity(value)}"
+        if isinstance(value, bool):
+            return ".T." if value else ".F."
+        if isinstance(value, str):
+            return "'" + value.replace("'", "''") + "'"
+        if isinstance(value, float):
+            return repr(value)
+        if isinstance(value, (tuple, list)):
+            return "(" + ",".join(self.to_step_value(v) for v in value) + ")"
+        return str(value)
+
+    def close(self) -> None:
+        """Write the footer and atomically move the file to its target path"""
+        self._out.write("ENDSEC;\nEND-ISO-10303-21;\n")
+        self._out.close()
+        if self._zip is not None:
+            self._zip.close()
+            self._file.close()
+        # temporary files are private, use the permissions of a regular new file
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(self.tmp_filename, 0o666 & ~umask)
+        os.replace(self.tmp_filename, self.filename)
+        print(f"Streamed {self.num_written} entities to {self.filename}")
+
+    def abort(self) -> None:
+        """Close and delete the temporary file, the target file is not touched"""
+        try:
+            self._out.close()
+            if self._zip is not None:
+                self._zip.close()
+                self._file.close()
+        finally:
+            if os.path.exists(self.tmp_filename):
+                os.remove(self.tmp_filename)
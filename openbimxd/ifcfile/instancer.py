@@ -0,0 +1,108 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+import numpy as np
+
+
+class RepresentationInstancer:
+    """
+    A class to share the geometry of elements with the same dimensions. The
+    dimensions are quantized to a tolerance, each distinct shape is created once as
+    IfcRepresentationMap and referenced by the elements through an IfcMappedItem.
+
+    Attributes:
+        ifc_model : IfcModelBuilder object
+        tolerance (float): quantization step of the dimensions in m
+        maps (dict): shape key -> IfcRepresentationMap
+    """
+
+    def __init__(self, ifc_model, tolerance=0.005) -> None:
+        """Initialize RepresentationInstancer.
+
+        Args:
+            ifc_model (IfcModelBuilder): The IFC file the representations are added to
+            tolerance (float, optional): quantization step of the dimensions in m.
+                Defaults to 0.005.
+        """
+        self.ifc_model = ifc_model
+        self.tolerance = tolerance
+        self.maps = {}
+        self.num_instances = 0
+        model = ifc_model.model
+        # all instances are placed at the origin of their product
+        self.mapping_origin = ifc_model.pool.axis2placement3d((0.0, 0.0, 0.0))
+        self.transformation = model.createIfcCartesianTransformationOperator3D(
+            None, None, self.mapping_origin.Location, None, None
+        )
+
+    def quantize(self, dims) -> tuple:
+        """Quantize dimensions to the tolerance.
+
+        Args:
+            dims (np.ndarray): dimensions in m e.g., length, width, height
+
+        Returns:
+            tuple: integer multiples of the tolerance, used as key
+            np.ndarray: quantized dimensions in m
+        """
+        steps = np.round(np.asarray(dims, dtype=float) / self.tolerance).astype(int)
+        return tuple(steps.tolist()), steps * self.tolerance
+
+    def get_representation(self, shape_type: str, dims, create_representation):
+        """Get a mapped body representation of a shape, the shape is created once
+        per quantized dimensions.
+
+        Args:
+            shape_type (str): kind of shape e.g., IfcWall or IfcColumn/round
+            dims (np.ndarray): dimensions in m
+            create_representation (callable): creates the IfcShapeRepresentation
+                of the shape from the quantized dimensions, called once per shape
+
+        Returns:
+            IfcShapeRepresentation: mapped representation to assign to a product
+        """
+        steps, quantized = self.quantize(dims)
+        key = (shape_type, steps)
+        representation_map = self.maps.get(key)
+        if representation_map is None:
+            representation_map = self.ifc_model.model.createIfcRepresentationMap(
+                self.mapping_origin, create_representation(quantized)
+            )
+            self.maps[key] = representation_map
+        self.num_instances += 1
+        model = self.ifc_model.model
+        return model.createIfcShapeRepresentation(
+            self.ifc_model.body,
+            "Body",
+            "MappedRepresentation",
+            [model.createIfcMappedItem(representation_map, self.transformation)],
+        )
+
+    def __str__(self) -> str:
+        """Print string
+
+        Returns:
+            string: String to be printed when print()
+        """
+        return f"{self.num_instances} instances of {len(self.maps)} shapes"
@@ -0,0 +1,406 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+import contextlib
+import itertools
+import multiprocessing
+import os
+import re
+import time
+import uuid
+
+import numpy as np
+
+import ifcopenshell
+import ifcopenshell.guid
+
+from openbimxd.ifcfile.ifcfile import IfcModelBuilder
+from openbimxd.ifcfile.ifcwriter import STRING_LITERAL
+
+# namespace of the deterministic GlobalIds, combined with the file name
+NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, "openbimxd.sharding")
+# STEP physical file line patterns
+ENTITY_ID = re.compile(r"#(\d+)=")
+REFERENCE = re.compile(r"#(\d+)")
+MATERIAL = re.compile(r"#(\d+)=IFCMATERIAL\('((?:[^']|'')*)'")
+# relationships merged into the first one of the same relating entity
+MERGED_RELATIONSHIPS = {
+    "IfcRelContainedInSpatialStructure": ("RelatingStructure", "RelatedElements"),
+    "IfcRelAssociatesMaterial": ("RelatingMaterial", "RelatedObjects"),
+}
+
+
+def shard_guid(namespace: uuid.UUID, key: str) -> str:
+    """Create a GlobalId from a name based UUID, the same key always gives the same
+    GlobalId.
+
+    Args:
+        namespace (uuid.UUID): namespace of the model
+        key (str): e.g., "<shard key>/<entity id>"
+
+    Returns:
+        str: compressed IFC GlobalId
+    """
+    return ifcopenshell.guid.compress(uuid.uuid5(namespace, key).hex)
+
+
+@contextlib.contextmanager
+def shard_guids(namespace: uuid.UUID, prefix: str):
+    """Replace ifcopenshell.guid.new() with name based GlobalIds, the n-th new
+    GlobalId is derived from "<prefix>/<n>". GlobalIds given by the caller, e.g.,
+    uids according to reference data, are not touched.
+
+    Args:
+        namespace (uuid.UUID): namespace of the model
+        prefix (str): "skeleton" or the shard key
+    """
+    counter = itertools.count()
+    new = ifcopenshell.guid.new
+    ifcopenshell.guid.new = lambda: shard_guid(namespace, f"{prefix}/{next(counter)}")
+    try:
+        yield
+    finally:
+        ifcopenshell.guid.new = new
+
+
+def build_shard(task) -> tuple:
+    """Build the elements of one shard into their own in-memory model, run in a
+    worker process. Every shard starts with the same skeleton i.e., project, site,
+    building, storeys, units and contexts, so skeleton entities have the same ids
+    and GlobalIds in all shards. New GlobalIds of the shard entities are derived
+    from the shard key and the creation order, GlobalIds given by build_fn are kept.
+
+    Args:
+        task (tuple): shard key, items, build function, storey elevations,
+            IfcModelBuilder keyword arguments and namespace
+
+    Returns:
+        str: shard key
+        str: shard model as STEP physical file
+        int: number of skeleton entities
+        float: build time in s
+    """
+    key, items, build_fn, elevations, builder_kwargs, namespace = task
+    start = time.time()
+    with shard_guids(namespace, "skeleton"):
+        builder = IfcModelBuilder("", **builder_kwargs)
+        if elevations is not None:
+            builder.add_storeys(elevations)
+    skeleton_size = max(entity.id() for entity in builder.model)
+    # references of the skeleton are sets, sort them to get the same file each run
+    for entity in builder.model:
+        for i, value in enumerate(entity):
+            if isinstance(value, tuple) and all(
+                isinstance(v, ifcopenshell.entity_instance) for v in value
+            ):
+                entity[i] = sorted(value, key=lambda v: v.id())
+    with shard_guids(namespace, key):
+        build_fn(builder, items)
+        builder.finalize()
+    return key, builder.model.to_string(), skeleton_size, time.time() - start
+
+
+class ShardedModelBuilder:
+    """
+    A class to build an IFC model in parallel. The elements are split into shards
+    e.g., per storey or per tile, each shard is built by a worker process into its
+    own IfcModelBuilder with deterministic GlobalIds. The shards are merged into one
+    model in shard order, sharing the skeleton and materials.
+
+    Attributes:
+        filename (str): Path to write the file to
+        build_fn (callable): build_fn(builder, items) creates the elements of a
+            shard with an IfcModelBuilder, e.g. with a BulkElementBuilder. It must
+            be a module level function to be sent to the workers.
+        elevations (list): optional, storey elevations in m of all shards
+        workers (int): optional, number of processes, defaults to the CPU count
+        namespace (uuid.UUID): namespace of the GlobalIds, derived from filename
+        builder_kwargs (dict): keyword arguments of the IfcModelBuilder
+        model (ifcopenshell.file): merged model after build()
+    """
+
+    def __init__(
+        self,
+        filename,
+        build_fn,
+        elevations=None,
+        workers=None,
+        namespace=None,
+        **builder_kwargs,
+    ) -> None:
+        """Initialize ShardedModelBuilder.
+
+        Args:
+            filename (str): Path to write the file to
+            build_fn (callable): module level function building a shard
+            elevations (list, optional): storey elevations in m. Defaults to None,
+                only the storey at 0.0.
+            workers (int, optional): number of processes. Defaults to None, the CPU
+                count.
+            namespace (uuid.UUID, optional): namespace of the GlobalIds. Defaults to
+                None, derived from the file name.
+            builder_kwargs: IfcModelBuilder arguments e.g., schema or deferred,
+                shards are built in memory so stream is not supported
+
+        Raises:
+            ValueError: on stream mode
+        """
+        if builder_kwargs.get("stream", False):
+            raise ValueError("Shards are built in memory, stream is not supported")
+        self.filename = filename
+        self.build_fn = build_fn
+        self.elevations = elevations
+        self.workers = workers or os.cpu_count()
+        if namespace is None:
+            namespace = uuid.uuid5(NAMESPACE, os.path.basename(filename))
+        self.namespace = namespace
+        self.builder_kwargs = builder_kwargs
+        self.model = None
+
+    @staticmethod
+    def split_by_storey(z_min, elevations, tolerance=0.05) -> dict:
+        """Split elements into shards by storey, see IfcModelBuilder.storey_at().
+
+        Args:
+            z_min (np.ndarray): lowest z coordinate per element in m, shape (n, )
+            elevations (list): storey elevations in m
+            tolerance (float, optional): in m. Defaults to 0.05.
+
+        Returns:
+            dict: shard key "storey_<i>" -> element indices
+        """
+        elevations = np.sort(np.append(np.asarray(elevations, dtype=float), 0.0))
+        indices = np.searchsorted(elevations, np.asarray(z_min) + tolerance, "right")
+        indices = np.maximum(indices - 1, 0)
+        return {
+            f"storey_{index}": np.flatnonzero(indices == index)
+            for index in np.unique(indices).tolist()
+        }
+
+    @staticmethod
+    def split_by_tile(points, tile_size: float) -> dict:
+        """Split elements into shards by square tiles in plan.
+
+        Args:
+            points (np.ndarray): reference point per element in m e.g., the
+                origins, shape (n, 2) or (n, 3)
+            tile_size (float): edge length of the tiles in m
+
+        Returns:
+            dict: shard key "tile_<i>_<j>" -> element indices
+        """
+        tiles = np.floor(np.asarray(points)[:, :2] / tile_size).astype(int)
+        unique_tiles, inverse = np.unique(tiles, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        return {
+            f"tile_{i}_{j}": np.flatnonzero(inverse == index)
+            for index, (i, j) in enumerate(unique_tiles.tolist())
+        }
+
+    def build(self, shards: dict) -> ifcopenshell.file:
+        """Build the shards in parallel and merge them.
+
+        Args:
+            shards (dict): shard key -> items passed to build_fn, the items must
+                be picklable e.g., arrays of boxes
+
+        Returns:
+            ifcopenshell.file: merged model
+        """
+        start = time.time()
+        tasks = [
+            (
+                key,
+                items,
+                self.build_fn,
+                self.elevations,
+                self.builder_kwargs,
+                self.namespace,
+            )
+            for key, items in shards.items()
+        ]
+        if self.workers > 1 and len(tasks) > 1:
+            with multiprocessing.Pool(min(self.workers, len(tasks))) as pool:
+                # imap keeps the shard order, the merged model is deterministic
+                results = list(pool.imap(build_shard, tasks))
+        else:
+            results = [build_shard(task) for task in tasks]
+        for key, _, _, seconds in results:
+            print(f"Built shard {key} in {seconds:.2f}s")
+        print(f"Built {len(results)} shards in {time.time() - start:.2f}s")
+        start = time.time()
+        self.model = self.merge([(data, size) for _, data, size, _ in results])
+        print(f"Merged shards in {time.time() - start:.2f}s")
+        return self.model
+
+    @staticmethod
+    def merge(shards: list) -> ifcopenshell.file:
+        """Merge shard models into the first one on the STEP physical file lines.
+        Skeleton entities are shared by id, materials by name and all other entities
+        are renumbered after the entities of the previous shards. Containment and
+        material relationships are then merged per storey and material.
+
+        Args:
+            shards (list): (STEP physical file, number of skeleton entities) per
+                shard
+
+        Returns:
+            ifcopenshell.file: merged model
+        """
+        data, skeleton_size = shards[0]
+        header, lines, footer = split_spf(data)
+        materials = {}
+        for line in lines:
+            match = MATERIAL.match(line)
+            if match is not None:
+                materials[match.group(2)] = int(match.group(1))
+        next_id = max(int(ENTITY_ID.match(line).group(1)) for line in lines) + 1
+        for data, size in shards[1:]:
+            if size != skeleton_size:
+                raise ValueError("Shards were built with different skeletons")
+            _, shard_lines, _ = split_spf(data)
+            # first pass: new id of every shard entity
+            ids = {}
+            shared = set()
+            for line in shard_lines:
+                entity_id = int(ENTITY_ID.match(line).group(1))
+                match = MATERIAL.match(line)
+                if entity_id <= skeleton_size:
+                    ids[entity_id] = entity_id
+                    shared.add(entity_id)
+                elif match is not None and match.group(2) in materials:
+                    ids[entity_id] = materials[match.group(2)]
+                    shared.add(entity_id)
+                else:
+                    ids[entity_id] = next_id
+                    if match is not None:
+                        materials[match.group(2)] = next_id
+                    next_id += 1
+            # second pass: entities not shared with the previous shards
+            for line in shard_lines:
+                if int(ENTITY_ID.match(line).group(1)) not in shared:
+                    lines.append(renumber(line, ids))
+        model = ifcopenshell.file.from_string("".join([header, *lines, footer]))
+        for name, (relating_name, related_name) in MERGED_RELATIONSHIPS.items():
+            merge_relationships(model, name, relating_name, related_name)
+        return model
+
+    def write(self) -> None:
+        """Write the merged model to file"""
+        if self.model is None:
+            print("No model built yet, passing ...")
+            return
+        self.model.write(self.filename)
+
+
+def split_spf(data: str) -> tuple:
+    """Split a STEP physical file into header, entity lines and footer.
+
+    Args:
+        data (str): STEP physical file with one entity per line
+
+    Returns:
+        str: header up to and including the DATA section keyword
+        list: entity lines with line break
+        str: footer from the end of the DATA section
+    """
+    header, data = data.split("DATA;\n", 1)
+    data, footer = data.rsplit("ENDSEC;", 1)
+    return header + "DATA;\n", data.splitlines(keepends=True), "ENDSEC;" + footer
+
+
+def renumber(line: str, ids: dict) -> str:
+    """Renumber the entity id and the references of a STEP line, string literals
+    are kept as they are.
+
+    Args:
+        line (str): STEP line e.g., "#20=IFCWALL('3dX...',$,$,$,$,#18,#19,$,$);"
+        ids (dict): old id -> new id
+
+    Returns:
+        str: renumbered line
+    """
+    parts = STRING_LITERAL.split(line)
+    # string literals are at the odd indices
+    for i in range(0, len(parts), 2):
+        parts[i] = REFERENCE.sub(lambda m: f"#{ids[int(m.group(1))]}", parts[i])
+    return "".join(parts)
+
+
+def merge_relationships(model, name: str, relating_name: str, related_name: str):
+    """Merge relationships with the same relating entity into the first one.
+
+    Args:
+        model (ifcopenshell.file): merged model
+        name (str): relationship class e.g., IfcRelContainedInSpatialStructure
+        relating_name (str): relating attribute e.g., RelatingStructure
+        related_name (str): related attribute e.g., RelatedElements
+    """
+    first = {}
+    for rel in model.by_type(name):
+        relating = getattr(rel, relating_name)
+        existing = first.setdefault(relating.id(), rel)
+        if existing == rel:
+            continue
+        setattr(
+            existing,
+            related_name,
+            list(getattr(existing, related_name)) + list(getattr(rel, related_name)),
+        )
+        model.remove(rel)
+
+
+def build_demo_shard(builder, boxes) -> None:
+    """Build walls of a demo shard, see main()"""
+    from openbimxd.elements.bulkbuilder import BulkElementBuilder
+    from openbimxd.ifcmaterial.ifcmaterial import IfcMaterials
+
+    materials = IfcMaterials(builder.model)
+    bulk = BulkElementBuilder(builder, materials.concrete)
+    bulk.add_walls(origins=boxes[:, :3], dims=boxes[:, 3:6], angles=boxes[:, 6])
+
+
+def main():
+    # walls on 4 storeys: origin x, y, z, length, width, height and angle
+    rng = np.random.default_rng(0)
+    num_walls = 20000
+    boxes = np.column_stack(
+        (
+            rng.uniform(0, 100, (num_walls, 2)),
+            rng.integers(0, 4, num_walls) * 3.0,
+            rng.uniform(1, 5, num_walls),
+            np.full(num_walls, 0.2),
+            np.full(num_walls, 2.8),
+            rng.uniform(-180, 180, num_walls),
+        )
+    )
+    elevations = [3.0, 6.0, 9.0]
+    sharded = ShardedModelBuilder("sharded.ifc", build_demo_shard, elevations)
+    shards = sharded.split_by_storey(boxes[:, 2], elevations)
+    sharded.build({key: boxes[indices] for key, indices in shards.items()})
+    sharded.write()
+
+
+if __name__ == "__main__":
+    main()
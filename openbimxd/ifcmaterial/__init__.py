@@ -25,4 +25,12 @@
 
 """
 Create a set of IFC materials. Only generic implementation so far, more to come...
+
+CLASSES
+    MaterialRegistry
+        Looks up materials and material layer sets of a model by name, indexed once
+        per model. Creates missing materials and bulk loads definitions from JSON or
+        CSV files.
+    IfcMaterials
+        Generic concrete and CLT materials, reused if they exist
 """
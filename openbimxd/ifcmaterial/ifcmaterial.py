@@ -23,21 +23,258 @@
 # Dion Moult for his great work
 
 
+import csv
+import json
+import weakref
+
 import ifcopenshell
+import ifcopenshell.api
+
+# model -> registry, see MaterialRegistry.for_model(). Entries are dropped with
+# their model, the registries only hold a weak reference and entity ids, entity
+# instances would keep their model alive.
+_REGISTRY_CACHE = weakref.WeakKeyDictionary()
+
+
+class MaterialRegistry:
+    """
+    A class to look up and create the materials of a model by name. Existing
+    IfcMaterials and IfcMaterialLayerSets are indexed by name and category on first
+    use, afterwards lookups do not scan the model. Materials are only created if
+    no material with the name exists. Materials added or removed without the
+    registry are not seen, call refresh() after such edits.
+
+    Attributes:
+        model (ifcopenshell.file): IFC model the materials belong to, weakly
+            referenced
+        materials (dict): name -> IfcMaterial id
+        layer_sets (dict): name -> IfcMaterialLayerSet id
+        categories (dict): category -> list of IfcMaterial ids
+    """
+
+    def __init__(self, model: ifcopenshell.file) -> None:
+        """Initialize MaterialRegistry, use for_model() to share it.
+
+        Args:
+            model (ifcopenshell.file): IFC model
+        """
+        self._model = weakref.ref(model)
+        self.materials = None
+        self.layer_sets = None
+        self.categories = None
+
+    @property
+    def model(self) -> ifcopenshell.file:
+        """The IFC model the materials belong to"""
+        return self._model()
+
+    @classmethod
+    def for_model(cls, model: ifcopenshell.file):
+        """Get the registry of a model, creates it on first use.
+
+        Args:
+            model (ifcopenshell.file): IFC model
+
+        Returns:
+            MaterialRegistry: registry of the model
+        """
+        cached = _REGISTRY_CACHE.get(model)
+        if cached is None:
+            cached = cls(model)
+            _REGISTRY_CACHE[model] = cached
+        return cached
+
+    def refresh(self) -> None:
+        """Drop the index after materials were added or removed without the
+        registry, the next lookup indexes the model again."""
+        self.materials = None
+        self.layer_sets = None
+        self.categories = None
+
+    def index(self) -> None:
+        """Index the materials and layer sets of the model, only once"""
+        if self.materials is not None:
+            return
+        self.materials = {}
+        self.layer_sets = {}
+        self.categories = {}
+        for material in self.model.by_type("IfcMaterial"):
+            self.register(material)
+        for layer_set in self.model.by_type("IfcMaterialLayerSet"):
+            if layer_set.LayerSetName is not None:
+                self.layer_sets.setdefault(layer_set.LayerSetName, layer_set.id())
+
+    def lookup(self, ids: dict, name: str):
+        """Get an indexed entity by name, None if there is none. Entities removed
+        from the model meanwhile are dropped from the index.
+
+        Args:
+            ids (dict): materials or layer_sets
+            name (str): name of the material or layer set
+
+        Returns:
+            entity_instance: IfcMaterial or IfcMaterialLayerSet
+        """
+        entity_id = ids.get(name)
+        if entity_id is None:
+            return None
+        try:
+            return self.model.by_id(entity_id)
+        except RuntimeError:
+            del ids[name]
+            return None
+
+    def register(self, material) -> None:
+        """Add a material to the index, the first material of a name is kept"""
+        if material.Name in self.materials:
+            return
+        self.materials[material.Name] = material.id()
+        category = getattr(material, "Category", None)
+        self.categories.setdefault(category, []).append(material.id())
+
+    def get(self, name: str, category=None, description=None, create=True):
+        """Get a material by name.
+
+        Args:
+            name (str): name of the material e.g., "CON01"
+            category (str, optional): category of a new material e.g., "concrete".
+                Defaults to None.
+            description (str, optional): description of a new material.
+                Defaults to None.
+            create (bool, optional): create the material if it does not exist.
+                Defaults to True.
+
+        Raises:
+            KeyError: if the material does not exist and create is False
+
+        Returns:
+            IfcMaterial: material of the model
+        """
+        self.index()
+        material = self.lookup(self.materials, name)
+        if material is not None:
+            return material
+        if not create:
+            raise KeyError(f"IfcMaterial {name} not in model")
+        kwargs = {"name": name, "category": category}
+        if description is not None:
+            kwargs["description"] = description
+        material = ifcopenshell.api.run("material.add_material", self.model, **kwargs)
+        self.register(material)
+        return material
+
+    def get_layer_set(self, name: str, layers=None):
+        """Get a material layer set by name.
+
+        Args:
+            name (str): name of the layer set e.g., "CLT wall 200"
+            layers (list, optional): (material name, thickness in project units)
+                per layer of a new layer set, materials are looked up with get().
+                Defaults to None, raises KeyError if the layer set does not exist.
+
+        Raises:
+            KeyError: if the layer set does not exist and no layers are given
+
+        Returns:
+            IfcMaterialLayerSet: layer set of the model
+        """
+        self.index()
+        layer_set = self.lookup(self.layer_sets, name)
+        if layer_set is not None:
+            return layer_set
+        if layers is None:
+            raise KeyError(f"IfcMaterialLayerSet {name} not in model")
+        layer_set = ifcopenshell.api.run(
+            "material.add_material_set",
+            self.model,
+            name=name,
+            set_type="IfcMaterialLayerSet",
+        )
+        for material_name, thickness in layers:
+            layer = ifcopenshell.api.run(
+                "material.add_layer",
+                self.model,
+                layer_set=layer_set,
+                material=self.get(material_name),
+            )
+            layer.LayerThickness = float(thickness)
+        self.layer_sets[name] = layer_set.id()
+        return layer_set
+
+    def by_category(self, category: str) -> list:
+        """Get all materials of a category"""
+        self.index()
+        materials = []
+        for material_id in self.categories.get(category, []):
+            try:
+                materials.append(self.model.by_id(material_id))
+            except RuntimeError:
+                continue
+        return materials
+
+    def load(self, path: str) -> int:
+        """Bulk load material definitions, existing materials are kept. Either a
+        JSON file {"materials": [{"name": "CON01", "category": "concrete",
+        "description": "..."}], "layer_sets": [{"name": "...", "layers":
+        [{"material": "CLT", "thickness": 200.0}]}]} or a CSV file with the columns
+        name, category and optionally description.
+
+        Args:
+            path (str): path of the .json or .csv file
+
+        Returns:
+            int: number of material and layer set definitions
+        """
+        if path.endswith(".csv"):
+            with open(path, newline="") as in_file:
+                definitions = {"materials": list(csv.DictReader(in_file))}
+        else:
+            with open(path) as in_file:
+                definitions = json.load(in_file)
+        materials = definitions.get("materials", [])
+        layer_sets = definitions.get("layer_sets", [])
+        for definition in materials:
+            self.get(
+                definition["name"],
+                definition.get("category") or None,
+                definition.get("description") or None,
+            )
+        for definition in layer_sets:
+            self.get_layer_set(
+                definition["name"],
+                [
+                    (layer["material"], layer["thickness"])
+                    for layer in definition["layers"]
+                ],
+            )
+        print(f"Loaded {len(materials)} materials and {len(layer_sets)} layer sets")
+        return len(materials) + len(layer_sets)
+
+    def __contains__(self, name: str) -> bool:
+        self.index()
+        return self.lookup(self.materials, name) is not None
+
+    def __str__(self) -> str:
+        """Print string
+
+        Returns:
+            string: String to be printed when print()
+        """
+        self.index()
+        return f"{len(self.materials)} materials, {len(self.layer_sets)} layer sets"
 
 
 class IfcMaterials:
     """
-    A class to create and represent IFC materials.
+    A class to create and represent IFC materials. Existing materials of the model
+    are reused, see MaterialRegistry.
 
     Attributes:
         ifc_model : IfcModelBuilder object
+        registry : MaterialRegistry of the model
     """
 
     def __init__(self, ifc_model) -> None:
-        self.concrete = ifcopenshell.api.run(
-            "material.add_material", ifc_model, name="CON01", category="concrete"
-        )
-        self.clt = ifcopenshell.api.run(
-            "material.add_material", ifc_model, name="CLT", category="wood"
-        )
+        self.registry = MaterialRegistry.for_model(ifc_model)
+        self.concrete = self.registry.get("CON01", category="concrete")
+        self.clt = self.registry.get("CLT", category="wood")
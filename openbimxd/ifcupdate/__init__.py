@@ -28,16 +28,55 @@ Update an IFC object. Updates the location, material or properties.
 CLASSES
     UpdateIfcObject
         A class to update IFC objects. The updated objects are saved as a new file.
+    batchupdate / BatchUpdateIfcObjects
+        Updates many IFC objects at once, addressed by GlobalId. Placement matrices
+        are built vectorized and written in place.
+    journal / UpdateJournal
+        Records location, material and property updates as delta records in an
+        append-only JSON lines journal. Replays the journal onto the base file and
+        compacts it into a new base file.
+    service / UpdateService
+        Asyncio service accepting updates from an in-process queue or a local TCP
+        socket. Coalesces updates per GlobalId and flushes them periodically on a
+        background writer. Exposes backpressure and latency metrics.
+    poserecorder / PoseRecorder
+        Records timestamped poses per GlobalId in growable memory-mapped arrays.
+        Queries the pose at a time and the objects inside a region in an interval,
+        pushes only the latest poses into the model on flush.
+    transaction / UpdateTransaction
+        Applies location, material and property updates all or nothing. Records
+        inverse operations and rolls the in-memory model back on failure, without
+        reopening the file.
 
 FUNCTIONS
-    __init__(self, model, ifc_object) -> None
+    __init__(self, model, ifc_object, journal=None, recorder=None, relocation=None)
         Initializes an UpdateIfcObject object
     update_location(self, origin: np.ndarray, angle: float) -> None
         Update the location and angle of an the IfcLocalPlacement.
+    record_pose(self, origin: np.ndarray, angle: float, t=None) -> None
+        Record a pose of the object, written into the model on write().
     update_material(self, ifc_material) -> None
         Update the IfcMaterial.
     update_property(self, pset_name: str, pset_dict: dict) -> None
         Updates the property set of an object. Either adds a new property
         set or updates the existing one, if one with same name as existing
-        is given.
+        is given. Uses the cached property set handles of BatchUpdateIfcObjects.
+    write(self) -> None
+        Writes the updated model. With a journal, flushes the journal and compacts
+        it when due. With a recorder, writes the latest recorded poses first.
+    BatchUpdateIfcObjects.update_locations(self, guids, origins, angles) -> None
+        Update the location and angle of many objects in one pass.
+    BatchUpdateIfcObjects.update_properties(self, guids, pset_name, pset_dicts) -> int
+        Update a property set of many objects. Property set handles are cached,
+        only changed values are edited in place.
+    UpdateTransaction.commit(self) -> None / rollback(self) -> None
+        Keep or revert all edits of the transaction, called by the context manager.
+    BulkRelocation.move(self, product, matrix, is_si=True) -> None
+        Gather a placement edit of a product.
+    BulkRelocation.commit(self) -> int
+        Write the gathered placements in topological order of the placement tree.
+    PoseRecorder.pose_at(self, guid, t) -> tuple
+        Pose of an object at a time, interpolated between the recorded poses.
+    PoseRecorder.objects_in_region(self, min_pt, max_pt, t0, t1) -> list
+        GlobalIds of the objects with a pose inside a box in the interval [t0, t1].
 """
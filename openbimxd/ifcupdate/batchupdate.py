@@ -0,0 +1,312 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+import numpy as np
+
+import ifcopenshell
+from ifcopenshell.util import placement, unit, element
+from ifcopenshell.api import run
+
+
+class BatchUpdateIfcObjects:
+    """
+    A class to update many IFC objects of a model at once, e.g., tracked robots and
+    material pallets of a digital twin. Objects are addressed by their GlobalId.
+
+    Attributes:
+        model: IFC model, open it using ifcopenshell.open()
+    """
+
+    def __init__(self, model: ifcopenshell.file) -> None:
+        """Initialize BatchUpdateIfcObjects object
+
+        Args:
+            model (ifcopenshell.file): IFC model
+        """
+        self.model = model
+        # project length unit in m, placements are given in SI units
+        self.unit_scale = unit.calculate_unit_scale(model)
+        self.guid_map = None
+        # object id -> exclusive (point, axis, ref direction) of its placement
+        self.handles = {}
+        # (object id, pset name) -> (pset, {property name: IfcPropertySingleValue})
+        self.psets = {}
+
+    def get_objects(self, guids) -> list:
+        """Get objects by GlobalId from a map built once for all products.
+
+        Args:
+            guids (list): GlobalIds
+
+        Raises:
+            KeyError: if a GlobalId is not in the model
+
+        Returns:
+            list: IFC products
+        """
+        if self.guid_map is None:
+            self.guid_map = {p.GlobalId: p for p in self.model.by_type("IfcProduct")}
+        try:
+            return [self.guid_map[guid] for guid in guids]
+        except KeyError as e:
+            raise KeyError(f"GlobalId {e.args[0]} not in model") from None
+
+    @staticmethod
+    def placement_matrices(origins: np.ndarray, angles: np.ndarray) -> np.ndarray:
+        """Build placement matrices rotated around the Z axis.
+
+        Args:
+            origins (np.ndarray): origins, shape (n, 3)
+            angles (np.ndarray): angles in degrees, counter-clockwise is positive,
+                shape (n, )
+
+        Returns:
+            np.ndarray: placement matrices, shape (n, 4, 4)
+        """
+        origins = np.asarray(origins, dtype=float).reshape((-1, 3))
+        angles = np.deg2rad(np.asarray(angles, dtype=float).reshape(-1))
+        matrices = np.tile(np.eye(4), (origins.shape[0], 1, 1))
+        cos = np.cos(angles)
+        sin = np.sin(angles)
+        matrices[:, 0, 0] = cos
+        matrices[:, 0, 1] = -sin
+        matrices[:, 1, 0] = sin
+        matrices[:, 1, 1] = cos
+        matrices[:, :3, 3] = origins
+        return matrices
+
+    def update_locations(self, guids, origins: np.ndarray, angles: np.ndarray) -> None:
+        """Update the location and angle of many objects. Children of the objects
+        keep their relative placement i.e., they move with their parent.
+
+        Args:
+            guids (list): GlobalIds of the objects, length n
+            origins (np.ndarray): new origins in world coordinates in m, shape (n, 3)
+            angles (np.ndarray): angles for rotation in degrees, counter-clockwise
+                is positive, shape (n, )
+        """
+        objects = self.get_objects(guids)
+        matrices = self.placement_matrices(origins, angles)
+        # SI units to project units
+        matrices[:, :3, 3] /= self.unit_scale
+
+        # world matrices of the parent placements, computed once per parent
+        parents = {}
+        parent_matrices = np.empty_like(matrices)
+        for i, obj in enumerate(objects):
+            relative_to = None
+            if obj.ObjectPlacement is not None:
+                relative_to = obj.ObjectPlacement.PlacementRelTo
+            if relative_to is None:
+                parent_matrices[i] = np.eye(4)
+                continue
+            if relative_to.id() not in parents:
+                parents[relative_to.id()] = placement.get_local_placement(relative_to)
+            parent_matrices[i] = parents[relative_to.id()]
+        relative = np.linalg.inv(parent_matrices) @ matrices
+
+        for obj, matrix, world in zip(objects, relative, matrices):
+            if obj.ObjectPlacement is None:
+                run(
+                    "geometry.edit_object_placement",
+                    self.model,
+                    product=obj,
+                    matrix=world,
+                    is_si=False,
+                )
+                continue
+            self.set_relative_placement(obj, matrix)
+
+    def get_handles(self, obj) -> tuple:
+        """Get the point and directions of the object placement for editing in place.
+        Entities shared with other objects are replaced by new ones once.
+
+        Args:
+            obj (IfcProduct): object with IfcLocalPlacement
+
+        Returns:
+            tuple: IfcCartesianPoint, IfcDirection axis, IfcDirection ref direction
+        """
+        handles = self.handles.get(obj.id())
+        if handles is not None:
+            return handles
+        model = self.model
+        local_placement = obj.ObjectPlacement
+        # child placements reference it as well, only products count as sharing
+        if len(local_placement.PlacesObject) > 1:
+            local_placement = model.createIfcLocalPlacement(
+                local_placement.PlacementRelTo, local_placement.RelativePlacement
+            )
+            obj.ObjectPlacement = local_placement
+        relative = local_placement.RelativePlacement
+        if relative is None or model.get_total_inverses(relative) > 1:
+            relative = model.createIfcAxis2Placement3D(
+                model.createIfcCartesianPoint((0.0, 0.0, 0.0))
+            )
+            local_placement.RelativePlacement = relative
+
+        def exclusive(entity, ifc_class, value):
+            if entity is None or model.get_total_inverses(entity) > 1:
+                return model.create_entity(ifc_class, value)
+            return entity
+
+        relative.Location = exclusive(
+            relative.Location, "IfcCartesianPoint", (0.0, 0.0, 0.0)
+        )
+        relative.Axis = exclusive(relative.Axis, "IfcDirection", (0.0, 0.0, 1.0))
+        relative.RefDirection = exclusive(
+            relative.RefDirection, "IfcDirection", (1.0, 0.0, 0.0)
+        )
+        handles = (relative.Location, relative.Axis, relative.RefDirection)
+        self.handles[obj.id()] = handles
+        return handles
+
+    def set_relative_placement(self, obj, matrix: np.ndarray) -> None:
+        """Write a placement matrix relative to the parent placement in place.
+
+        Args:
+            obj (IfcProduct): object with IfcLocalPlacement
+            matrix (np.ndarray): relative placement matrix in project units,
+                shape (4, 4)
+        """
+        point, axis, ref_direction = self.get_handles(obj)
+        point.Coordinates = matrix[:3, 3].tolist()
+        axis.DirectionRatios = matrix[:3, 2].tolist()
+        ref_direction.DirectionRatios = matrix[:3, 0].tolist()
+
+    def get_pset_handle(self, obj, pset_name: str) -> tuple:
+        """Get the property set of an object for editing in place, adds it if the
+        object has none with this name. A property set shared with other objects
+        is replaced by an own copy once, so editing it does not change the others.
+
+        Args:
+            obj (IfcObject): object
+            pset_name (str): name of the property set
+
+        Returns:
+            tuple: IfcPropertySet and dict of its single value properties by name
+        """
+        handle = self.psets.get((obj.id(), pset_name))
+        if handle is not None:
+            return handle
+        rel, pset = self.find_pset(obj, pset_name)
+        properties = None
+        if pset is not None and len(rel.RelatedObjects) > 1:
+            properties = element.get_property_definition(pset)
+            properties.pop("id", None)
+            rel.RelatedObjects = [o for o in rel.RelatedObjects if o != obj]
+            pset = None
+        if pset is None:
+            pset = run("pset.add_pset", self.model, product=obj, name=pset_name)
+            if properties:
+                run("pset.edit_pset", self.model, pset=pset, properties=properties)
+        handle = (pset, self.single_values(pset))
+        self.psets[(obj.id(), pset_name)] = handle
+        return handle
+
+    @staticmethod
+    def find_pset(obj, pset_name: str) -> tuple:
+        """Find a property set of an object by name.
+
+        Args:
+            obj (IfcObject): object
+            pset_name (str): name of the property set
+
+        Returns:
+            tuple: IfcRelDefinesByProperties and IfcPropertySet, None if not found
+        """
+        for rel in obj.IsDefinedBy:
+            if not rel.is_a("IfcRelDefinesByProperties"):
+                continue
+            definition = rel.RelatingPropertyDefinition
+            if definition.is_a("IfcPropertySet") and definition.Name == pset_name:
+                return rel, definition
+        return None, None
+
+    @staticmethod
+    def single_values(pset) -> dict:
+        """Get the single value properties of a property set by name"""
+        return {
+            p.Name: p
+            for p in (pset.HasProperties or [])
+            if p.is_a("IfcPropertySingleValue")
+        }
+
+    def update_properties(self, guids, pset_name: str, pset_dicts) -> int:
+        """Update a property set of many objects, see update_object_properties().
+
+        Args:
+            guids (list): GlobalIds of the objects, length n
+            pset_name (str): name of the property set
+            pset_dicts (list): dict of new property values per object, length n
+
+        Returns:
+            int: number of changed properties
+        """
+        return self.update_object_properties(
+            self.get_objects(guids), pset_name, pset_dicts
+        )
+
+    def update_object_properties(self, objects, pset_name: str, pset_dicts) -> int:
+        """Update a property set of many objects. Uses cached property set handles,
+        only properties whose values changed are touched. Values of existing
+        properties are replaced in place, new properties are added with the
+        IfcOpenShell API.
+
+        Args:
+            objects (list): IFC objects, length n
+            pset_name (str): name of the property set
+            pset_dicts (list): dict of new property values per object, length n
+
+        Returns:
+            int: number of changed properties
+        """
+        num_changed = 0
+        for obj, pset_dict in zip(objects, pset_dicts):
+            pset, properties = self.get_pset_handle(obj, pset_name)
+            added = {}
+            for name, value in pset_dict.items():
+                prop = properties.get(name)
+                if prop is not None and prop.NominalValue is None and value is None:
+                    continue
+                if prop is None or prop.NominalValue is None or value is None:
+                    added[name] = value
+                    continue
+                current = prop.NominalValue.wrappedValue
+                if isinstance(current, float) and type(value) is int:
+                    value = float(value)
+                if type(current) is not type(value):
+                    # let the API choose the IFC data type for the new value
+                    added[name] = value
+                    continue
+                if current != value:
+                    prop.NominalValue = self.model.create_entity(
+                        prop.NominalValue.is_a(), value
+                    )
+                    num_changed += 1
+            if len(added) > 0:
+                run("pset.edit_pset", self.model, pset=pset, properties=added)
+                properties.update(self.single_values(pset))
+                num_changed += len(added)
+        return num_changed
@@ -22,13 +22,18 @@
 # This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
 # Dion Moult for his great work
 
+import time
+
 import numpy as np
 
 import ifcopenshell
-from ifcopenshell.util import placement, element
+from ifcopenshell.util import placement
 from ifcopenshell.api import run
 
 from openbimxd.ifcmaterial import ifcmaterial
+from openbimxd.ifcupdate.batchupdate import BatchUpdateIfcObjects
+from openbimxd.ifcupdate.journal import UpdateJournal
+from openbimxd.ifcupdate.poserecorder import PoseRecorder
 
 
 class UpdateIfcObject:
@@ -38,22 +43,40 @@ class UpdateIfcObject:
     Attributes:
         model: IFC model, open it using ifcopenshell.open()
         ifc_object: specific IFC object. Use IfcOpenShell to select an object.
+        journal: optional, UpdateJournal to record the updates as deltas instead of
+            rewriting the whole file on write()
+        recorder: optional, PoseRecorder to record the trajectory of the object
+        relocation: optional, BulkRelocation gathering location updates of many
+            objects, applied on its commit()
     """
 
     def __init__(
         self,
         model: ifcopenshell.file,
         ifc_object: ifcopenshell.main.ifcopenshell_wrapper.Element,
+        journal=None,
+        recorder=None,
+        relocation=None,
     ) -> None:
         """Initialize UpdateIfcObject object
 
         Args:
-            model (ifcopenshell.file): IFC model
+            model (ifcopenshell.file): IFC model. With a journal, open it using
+                journal.open_model()
             ifc_object (ifcopenshell.main.ifcopenshell_wrapper.Element): subclass of IfcElement
+            journal (UpdateJournal, optional): records updates as delta records.
+                Defaults to None.
+            recorder (PoseRecorder, optional): records poses with record_pose(),
+                the latest pose is written into the model on write(). Defaults to None.
+            relocation (BulkRelocation, optional): gathers location updates, the
+                placements are computed on its commit(). Defaults to None.
         """
         self.model = model
         self.ifc_object = ifc_object
-        pass
+        self.journal = journal
+        self.recorder = recorder
+        self.relocation = relocation
+        self.updater = BatchUpdateIfcObjects(model)
 
     def __str__(self) -> str:
         """Print string
@@ -77,20 +100,48 @@ class UpdateIfcObject:
         matrix = placement.rotation(angle, "Z") @ matrix
         matrix[:, 3][0:3] = origin
 
-        run(
-            "geometry.edit_object_placement",
-            self.model,
-            product=self.ifc_object,
-            matrix=matrix,
-            is_si=True,
-        )
+        if self.relocation is not None:
+            self.relocation.move(self.ifc_object, matrix)
+        else:
+            run(
+                "geometry.edit_object_placement",
+                self.model,
+                product=self.ifc_object,
+                matrix=matrix,
+                is_si=True,
+            )
+        # the placement was replaced, the cached handles of the updater are stale
+        self.updater.handles.pop(self.ifc_object.id(), None)
+        if self.journal is not None:
+            self.journal.record_location(self.ifc_object.GlobalId, origin, angle)
+
+    def record_pose(self, origin: np.ndarray, angle: float, t=None) -> None:
+        """Record a pose of the object without updating the model. The latest
+        recorded pose is written into the model on write().
+
+        Args:
+            origin (np.ndarray): New origin, shape (3,)
+            angle (float): Angle for rotation in degrees. Counter-clockwise
+                            is positive
+            t (float, optional): timestamp in s. Defaults to None, the current time.
+        """
+        if t is None:
+            t = time.time()
+        self.recorder.record(self.ifc_object.GlobalId, t, origin, angle)
 
     def update_material(self, ifc_material) -> None:
         """Update the IfcMaterial.
 
         Args:
-            ifc_material (IfcMaterial): Ifc Material
+            ifc_material (IfcMaterial | str): Ifc Material or its name, looked up
+                in the MaterialRegistry of the model
+
+        Raises:
+            KeyError: if there is no material with the name
         """
+        if isinstance(ifc_material, str):
+            registry = ifcmaterial.MaterialRegistry.for_model(self.model)
+            ifc_material = registry.get(ifc_material, create=False)
         run(
             "material.assign_material",
             self.model,
@@ -98,11 +149,14 @@ class UpdateIfcObject:
             type="IfcMaterial",
             material=ifc_material,
         )
+        if self.journal is not None:
+            self.journal.record_material(self.ifc_object.GlobalId, ifc_material.Name)
 
     def update_property(self, pset_name: str, pset_dict: dict) -> None:
         """Updates the property set of an object. Either adds a new property
         set or updates the existing one, if one with same name as existing
-        is given.
+        is given. The property set handle is cached, so repeated updates only
+        touch the properties whose values changed.
 
         Args:
             pset_name (str): Name of the property set. Note, that Pset_ is reserved for
@@ -111,37 +165,43 @@ class UpdateIfcObject:
             property, value is value of property. Note, that python data types
             are transferred into IFC data types, but this could be ambiguous.
         """
-        psets = element.get_psets(self.ifc_object)
-        print(f"Ifc Class of element: {self.ifc_object.get_info().get('type')}")
-        print(f"Type of property sets: {list(psets.keys())}")
-        # manage update depending on property set
-        if len(list(psets.keys())) == 0 or len(list(psets.keys())) == 1:
-            pset = run(
-                "pset.add_pset",
-                self.model,
-                product=self.ifc_object,
-                name=pset_name,
-            )
-            run("pset.edit_pset", self.model, pset=pset, properties=pset_dict)
-        else:
-            print(
-                f"Object of class {self.ifc_object.get_info().get('type')} has more than one PSet, check manually"
-            )
+        self.updater.update_object_properties([self.ifc_object], pset_name, [pset_dict])
+        if self.journal is not None:
+            self.journal.record_property(self.ifc_object.GlobalId, pset_name, pset_dict)
 
     def write(self) -> None:
-        """Write the updated model"""
+        """Write the updated model. With a journal, only the journal is flushed and
+        the model is written as new base file when compaction is due. With a
+        recorder, the latest recorded poses of all its objects are written into the
+        model and the journal first."""
+        if self.recorder is not None:
+            guids = self.recorder.flush(self.updater)
+            if self.journal is not None:
+                for guid in guids:
+                    _, x, y, z, angle = self.recorder.latest(guid)
+                    self.journal.record_location(guid, [x, y, z], angle)
+        if self.journal is not None:
+            self.journal.flush()
+            if self.journal.needs_compaction():
+                self.journal.compact(self.model)
+            return
         self.model.write("baubot_demo_update.ifc")
 
 
 def main():
-    ifc_mdl = ifcopenshell.open("baubot_demo.ifc")
+    journal = UpdateJournal("baubot_demo.ifc", compact_every=100)
+    ifc_mdl = journal.open_model()
     # get the first wall in the model
     ifc_robot = ifc_mdl.by_guid("34tooC1TvAbQnDhok8tUWM")
     ifc_mats = ifcmaterial.IfcMaterials(ifc_mdl)
 
-    update = UpdateIfcObject(ifc_mdl, ifc_robot)
+    recorder = PoseRecorder("baubot_demo_poses")
+    update = UpdateIfcObject(ifc_mdl, ifc_robot, journal=journal, recorder=recorder)
     update.update_location(np.asarray([5.0, 2.0, 0.0]), 90.0)
-    # update.update_material(ifc_mats.clt)
+    # record a trajectory, only the last pose is written into the model
+    for step in range(10):
+        update.record_pose(np.asarray([5.0, 2.0 + 0.1 * step, 0.0]), 90.0)
+    # update.update_material("CLT")
     update.update_property(
         "PSet_Robot",
         {
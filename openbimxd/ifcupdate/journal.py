@@ -0,0 +1,242 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+import json
+import os
+import time
+
+import numpy as np
+
+import ifcopenshell
+from ifcopenshell.api import run
+
+from openbimxd.ifcupdate.batchupdate import BatchUpdateIfcObjects
+
+
+def numpy_to_python(value):
+    """Convert numpy scalars and arrays e.g., property values, for json.dumps()"""
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class UpdateJournal:
+    """
+    A class to record updates of IFC objects as compact delta records in an
+    append-only JSON lines file, instead of rewriting the whole IFC file on every
+    update. The journal is replayed onto the base IFC file and compacted into a new
+    base file from time to time.
+
+    Attributes:
+        base_path (str): path to the base IFC file
+        journal_path (str): path to the journal, next to the base file by default
+        compact_every (int): number of records after which compaction is due
+    """
+
+    def __init__(self, base_path: str, journal_path=None, compact_every=1000) -> None:
+        """Initialize UpdateJournal, opens the journal for appending.
+
+        Args:
+            base_path (str): path to the base IFC file
+            journal_path (str, optional): path to the journal. Defaults to None,
+                which uses base_path with .journal.jsonl extension.
+            compact_every (int, optional): number of records after which
+                needs_compaction() is True. Defaults to 1000.
+        """
+        self.base_path = base_path
+        if journal_path is None:
+            journal_path = f"{os.path.splitext(base_path)[0]}.journal.jsonl"
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self.truncate_partial_record()
+        self.num_records = sum(1 for _ in self.records())
+        self._journal = open(self.journal_path, "a")
+
+    def append(self, record: dict) -> None:
+        """Append a record to the journal.
+
+        Args:
+            record (dict): delta record, needs to be JSON serializable
+        """
+        record["t"] = time.time()
+        line = json.dumps(record, separators=(",", ":"), default=numpy_to_python)
+        self._journal.write(line + "\n")
+        self.num_records += 1
+
+    def record_location(self, guid: str, origin: np.ndarray, angle: float) -> None:
+        """Record a location update, see UpdateIfcObject.update_location()"""
+        self.append(
+            {
+                "op": "location",
+                "guid": guid,
+                "origin": np.asarray(origin, dtype=float).tolist(),
+                "angle": float(angle),
+            }
+        )
+
+    def record_material(self, guid: str, material_name: str) -> None:
+        """Record a material update by material name"""
+        self.append({"op": "material", "guid": guid, "material": material_name})
+
+    def record_property(self, guid: str, pset_name: str, pset_dict: dict) -> None:
+        """Record a property set update"""
+        self.append(
+            {"op": "property", "guid": guid, "pset": pset_name, "properties": pset_dict}
+        )
+
+    def flush(self) -> None:
+        """Flush the journal to disk"""
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def truncate_partial_record(self) -> None:
+        """Remove a partially written last line, e.g., after a crash, so the next
+        record is not appended onto it.
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "rb+") as journal:
+            size = journal.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                start = max(end - 4096, 0)
+                journal.seek(start)
+                last_newline = journal.read(end - start).rfind(b"\n")
+                if last_newline >= 0:
+                    end = start + last_newline + 1
+                    break
+                end = start
+            if end < size:
+                print(f"Truncating {size - end} bytes of a partial journal record")
+                journal.truncate(end)
+
+    def records(self):
+        """Read the records of the journal.
+
+        Yields:
+            dict: delta record
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path) as journal:
+            for line in journal:
+                # skip a partially written last line after a crash
+                if not line.endswith("\n"):
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping corrupt journal record {line[:80]!r}")
+
+    def needs_compaction(self) -> bool:
+        """Check whether the journal has grown beyond compact_every records"""
+        return self.num_records >= self.compact_every
+
+    def replay(self, model: ifcopenshell.file) -> ifcopenshell.file:
+        """Apply the journal onto a model. Updates are coalesced, only the last
+        location and material of an object are applied.
+
+        Args:
+            model (ifcopenshell.file): IFC model, typically the base file
+
+        Returns:
+            ifcopenshell.file: the updated model
+        """
+        self._journal.flush()
+        locations = {}
+        materials = {}
+        properties = {}
+        for record in self.records():
+            op = record.get("op")
+            guid = record.get("guid")
+            if op == "location":
+                locations[guid] = (record.get("origin"), record.get("angle"))
+            elif op == "material":
+                materials[guid] = record.get("material")
+            elif op == "property":
+                pset = properties.setdefault((guid, record.get("pset")), {})
+                pset.update(record.get("properties"))
+
+        update = BatchUpdateIfcObjects(model)
+        if len(locations) > 0:
+            update.update_locations(
+                list(locations.keys()),
+                np.asarray([origin for origin, _ in locations.values()]),
+                np.asarray([angle for _, angle in locations.values()]),
+            )
+        ifc_materials = {m.Name: m for m in model.by_type("IfcMaterial")}
+        for guid, material_name in materials.items():
+            if material_name not in ifc_materials:
+                print(f"IfcMaterial {material_name} of {guid} not in model, passing")
+                continue
+            run(
+                "material.assign_material",
+                model,
+                product=update.get_objects([guid])[0],
+                type="IfcMaterial",
+                material=ifc_materials[material_name],
+            )
+        for (guid, pset_name), pset_dict in properties.items():
+            update.update_properties([guid], pset_name, [pset_dict])
+        print(
+            f"Replayed {len(locations)} locations, {len(materials)} materials and "
+            f"{len(properties)} property sets"
+        )
+        return model
+
+    def open_model(self) -> ifcopenshell.file:
+        """Open the base file and replay the journal onto it.
+
+        Returns:
+            ifcopenshell.file: the up to date model
+        """
+        return self.replay(ifcopenshell.open(self.base_path))
+
+    def compact(self, model=None) -> None:
+        """Write the up to date model as new base file and truncate the journal.
+        The base file is replaced atomically.
+
+        Args:
+            model (ifcopenshell.file, optional): model with all journal records
+                applied, e.g., the model the recorded updates were made on.
+                Defaults to None, which opens the base file and replays the journal.
+        """
+        if model is None:
+            model = self.open_model()
+        root, ext = os.path.splitext(self.base_path)
+        tmp_path = f"{root}.tmp{ext}"
+        try:
+            model.write(tmp_path)
+            os.replace(tmp_path, self.base_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._journal.close()
+        self._journal = open(self.journal_path, "w")
+        print(f"Compacted {self.num_records} records into {self.base_path}")
+        self.num_records = 0
+
+    def close(self) -> None:
+        """Close the journal"""
+        self._journal.close()
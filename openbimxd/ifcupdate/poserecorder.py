@@ -0,0 +1,237 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+import json
+import os
+
+import numpy as np
+
+# columns of a pose record
+T, X, Y, Z, ANGLE = range(5)
+NUM_FIELDS = 5
+
+
+class PoseRecorder:
+    """
+    A class to record the trajectories of tracked IFC objects e.g., robots. Poses
+    are stored per GlobalId in growable arrays memory-mapped to disk, one file per
+    object. Only the latest pose is pushed into the IFC model on flush.
+
+    A pose record is (t, x, y, z, angle): time in s, origin in m and angle in
+    degrees around the Z axis, counter-clockwise is positive.
+
+    Attributes:
+        directory (str): directory of the pose files and their index
+        initial_capacity (int): number of poses allocated for a new object
+    """
+
+    def __init__(self, directory: str, initial_capacity=1024) -> None:
+        """Initialize PoseRecorder, opens the poses recorded before in directory.
+
+        Args:
+            directory (str): directory of the pose files and their index
+            initial_capacity (int, optional): number of poses allocated for a new
+                object, doubled when full. Defaults to 1024.
+        """
+        self.directory = directory
+        self.initial_capacity = initial_capacity
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "index.json")
+        # GlobalId -> {"file": name, "count": number of poses, "capacity": rows}
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as index_file:
+                self.index = json.load(index_file)
+        self.tracks = {}
+        for guid in self.index:
+            self.tracks[guid] = self.open_track(guid)
+
+    def open_track(self, guid: str) -> np.memmap:
+        """Memory-map the pose file of an object with its current capacity"""
+        entry = self.index.get(guid)
+        path = os.path.join(self.directory, entry.get("file"))
+        mode = "r+" if os.path.exists(path) else "w+"
+        return np.memmap(
+            path, dtype=np.float64, mode=mode, shape=(entry.get("capacity"), NUM_FIELDS)
+        )
+
+    def grow(self, guid: str, min_capacity: int) -> None:
+        """Double the capacity of a pose file until min_capacity rows fit"""
+        entry = self.index.get(guid)
+        capacity = entry.get("capacity")
+        while capacity < min_capacity:
+            capacity *= 2
+        track = self.tracks.get(guid)
+        track.flush()
+        del track
+        entry["capacity"] = capacity
+        path = os.path.join(self.directory, entry.get("file"))
+        with open(path, "r+b") as pose_file:
+            pose_file.truncate(capacity * NUM_FIELDS * 8)
+        self.tracks[guid] = self.open_track(guid)
+
+    def record(self, guid: str, t: float, origin: np.ndarray, angle: float) -> None:
+        """Record one pose of an object, see record_many()"""
+        self.record_many(
+            guid, np.asarray([t]), np.asarray([origin]), np.asarray([angle])
+        )
+
+    def record_many(
+        self, guid: str, ts: np.ndarray, origins: np.ndarray, angles: np.ndarray
+    ) -> None:
+        """Record poses of one object.
+
+        Args:
+            guid (str): GlobalId of the object
+            ts (np.ndarray): timestamps in s, non-decreasing, shape (n, )
+            origins (np.ndarray): origins in m, shape (n, 3)
+            angles (np.ndarray): angles in degrees, shape (n, )
+
+        Raises:
+            ValueError: if timestamps are earlier than the recorded ones
+        """
+        ts = np.asarray(ts, dtype=float).reshape(-1)
+        if ts.shape[0] == 0:
+            return
+        poses = np.column_stack(
+            (ts, np.asarray(origins, dtype=float).reshape((-1, 3)), angles)
+        )
+        if guid not in self.index:
+            self.index[guid] = {
+                "file": f"track_{len(self.index):06d}.pose",
+                "count": 0,
+                "capacity": self.initial_capacity,
+            }
+            self.tracks[guid] = self.open_track(guid)
+        entry = self.index.get(guid)
+        count = entry.get("count")
+        last_t = self.tracks[guid][count - 1, T] if count > 0 else -np.inf
+        if ts[0] < last_t or np.any(np.diff(ts) < 0):
+            raise ValueError(f"Timestamps of {guid} have to be non-decreasing")
+        if count + poses.shape[0] > entry.get("capacity"):
+            self.grow(guid, count + poses.shape[0])
+        self.tracks[guid][count : count + poses.shape[0]] = poses
+        entry["count"] = count + poses.shape[0]
+
+    def poses(self, guid: str) -> np.ndarray:
+        """Get the recorded poses of an object.
+
+        Args:
+            guid (str): GlobalId of the object
+
+        Returns:
+            np.ndarray: poses (t, x, y, z, angle), shape (n, 5)
+        """
+        return self.tracks[guid][: self.index[guid].get("count")]
+
+    def latest(self, guid: str) -> np.ndarray:
+        """Get the latest pose (t, x, y, z, angle) of an object"""
+        return self.poses(guid)[-1]
+
+    def pose_at(self, guid: str, t: float) -> tuple[np.ndarray, float]:
+        """Get the pose of an object at a time, interpolated linearly between the
+        recorded poses. Before the first or after the last pose, the first or last
+        pose is returned.
+
+        Args:
+            guid (str): GlobalId of the object
+            t (float): time in s
+
+        Returns:
+            np.ndarray: origin in m, shape (3,)
+            float: angle in degrees
+        """
+        poses = self.poses(guid)
+        i = np.searchsorted(poses[:, T], t, side="right")
+        if i == 0:
+            return poses[0, X : Z + 1].copy(), float(poses[0, ANGLE])
+        if i == poses.shape[0]:
+            return poses[-1, X : Z + 1].copy(), float(poses[-1, ANGLE])
+        before = poses[i - 1]
+        after = poses[i]
+        span = after[T] - before[T]
+        w = 0.0 if span == 0 else (t - before[T]) / span
+        origin = (1 - w) * before[X : Z + 1] + w * after[X : Z + 1]
+        # interpolate along the shorter arc
+        delta = (after[ANGLE] - before[ANGLE] + 180.0) % 360.0 - 180.0
+        return origin, float(before[ANGLE] + w * delta)
+
+    def objects_in_region(
+        self, min_pt: np.ndarray, max_pt: np.ndarray, t0: float, t1: float
+    ) -> list:
+        """Get all objects with a recorded pose inside a box in the interval [t0, t1].
+
+        Args:
+            min_pt (np.ndarray): minimum corner of the box in m, shape (3,)
+            max_pt (np.ndarray): maximum corner of the box in m, shape (3,)
+            t0 (float): start of the interval in s
+            t1 (float): end of the interval in s
+
+        Returns:
+            list: GlobalIds of the objects
+        """
+        guids = []
+        for guid in self.index:
+            poses = self.poses(guid)
+            start = np.searchsorted(poses[:, T], t0, side="left")
+            end = np.searchsorted(poses[:, T], t1, side="right")
+            origins = poses[start:end, X : Z + 1]
+            if np.any(np.all((origins >= min_pt) & (origins <= max_pt), axis=1)):
+                guids.append(guid)
+        return guids
+
+    def flush(self, updater=None) -> list:
+        """Flush the pose files and the index to disk. With an updater, the latest
+        pose of every object is pushed into its IFC model, objects that are not in
+        the model are skipped.
+
+        Args:
+            updater (BatchUpdateIfcObjects, optional): updater of the IFC model.
+                Defaults to None.
+
+        Returns:
+            list: GlobalIds whose latest pose was pushed into the model
+        """
+        for track in self.tracks.values():
+            track.flush()
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as index_file:
+            json.dump(self.index, index_file)
+        os.replace(tmp_path, self.index_path)
+        if updater is None:
+            return []
+        guids = []
+        for guid, entry in self.index.items():
+            if entry.get("count") == 0:
+                continue
+            try:
+                updater.get_objects([guid])
+            except KeyError:
+                print(f"GlobalId {guid} not in model, passing")
+                continue
+            guids.append(guid)
+        if len(guids) > 0:
+            latest = np.asarray([self.latest(guid) for guid in guids])
+            updater.update_locations(guids, latest[:, X : Z + 1], latest[:, ANGLE])
+        return guids
@@ -0,0 +1,195 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+import numpy as np
+
+import ifcopenshell
+from ifcopenshell.util import placement
+
+from openbimxd.ifcupdate.batchupdate import BatchUpdateIfcObjects
+
+
+class BulkRelocation:
+    """
+    A class to relocate many IFC products at once. The placement edits are
+    gathered and the relative placements are recomputed once on commit, parents
+    before children. Like geometry.edit_object_placement, children of a moved
+    product that are not moved themselves keep their world position, openings
+    move with their host element.
+
+    Use it as context manager, it commits on exit:
+        with BulkRelocation(model) as relocation:
+            relocation.move(wall, matrix)
+            relocation.move(door, door_matrix)
+
+    Attributes:
+        model: IFC model
+        targets (dict): product id -> (product, world matrix in project units)
+    """
+
+    def __init__(self, model: ifcopenshell.file, updater=None) -> None:
+        """Initialize BulkRelocation.
+
+        Args:
+            model (ifcopenshell.file): IFC model
+            updater (BatchUpdateIfcObjects, optional): updater of the model, reuse
+                it to keep its cached placement handles. Defaults to None, a new one.
+        """
+        self.model = model
+        if updater is None:
+            updater = BatchUpdateIfcObjects(model)
+        self.updater = updater
+        self.targets = {}
+        # placement id -> world matrix before the relocation
+        self.worlds = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.targets = {}
+
+    def move(self, product, matrix: np.ndarray, is_si=True) -> None:
+        """Gather a placement edit, a later edit of the same product replaces it.
+
+        Args:
+            product (IfcProduct): product to relocate
+            matrix (np.ndarray): new world placement matrix, shape (4, 4)
+            is_si (bool, optional): translation in m instead of project units.
+                Defaults to True.
+        """
+        matrix = np.array(matrix, dtype=float)
+        if is_si:
+            matrix[:3, 3] /= self.updater.unit_scale
+        self.targets[product.id()] = (product, matrix)
+
+    def world_matrix(self, local_placement) -> np.ndarray:
+        """World matrix of a placement before the relocation, computed once per
+        placement."""
+        if local_placement is None:
+            return np.eye(4)
+        matrix = self.worlds.get(local_placement.id())
+        if matrix is None:
+            matrix = self.world_matrix(local_placement.PlacementRelTo) @ (
+                placement.get_axis2placement(local_placement.RelativePlacement)
+            )
+            self.worlds[local_placement.id()] = matrix
+        return matrix
+
+    @staticmethod
+    def children(local_placement):
+        """Products placed relative to a placement. Openings move with their host,
+        the products placed relative to the openings are returned instead."""
+        if local_placement is None:
+            return
+        for referencing in local_placement.ReferencedByPlacements:
+            for product in referencing.PlacesObject:
+                if product.is_a("IfcDistributionPort"):
+                    continue
+                if product.is_a("IfcFeatureElement"):
+                    yield from BulkRelocation.children(product.ObjectPlacement)
+                    continue
+                yield product
+
+    @staticmethod
+    def placement_rel_to(product):
+        """Placement a new placement of a product is relative to, the placement of
+        its host or container. See geometry.edit_object_placement."""
+        relating = None
+        if getattr(product, "Decomposes", None):
+            relating = product.Decomposes[0].RelatingObject
+        elif getattr(product, "Nests", None):
+            relating = product.Nests[0].RelatingObject
+        elif getattr(product, "VoidsElements", None):
+            relating = product.VoidsElements[0].RelatingBuildingElement
+        elif getattr(product, "FillsVoids", None):
+            relating = product.FillsVoids[0].RelatingOpeningElement
+        elif getattr(product, "ContainedInStructure", None):
+            relating = product.ContainedInStructure[0].RelatingStructure
+        if relating is None:
+            return None
+        return relating.ObjectPlacement
+
+    def commit(self) -> int:
+        """Recompute the relative placements of the moved products and their
+        children once, in topological order of the placement tree.
+
+        Returns:
+            int: number of products whose placement was written
+        """
+        model = self.model
+        worlds = {}
+        # children of moved products keep their world position
+        for product, _ in self.targets.values():
+            for child in self.children(product.ObjectPlacement):
+                if child.id() not in self.targets and child.id() not in worlds:
+                    world = self.world_matrix(child.ObjectPlacement)
+                    worlds[child.id()] = (child, world)
+        worlds.update(self.targets)
+
+        for product, _ in self.targets.values():
+            if product.ObjectPlacement is None:
+                product.ObjectPlacement = model.createIfcLocalPlacement(
+                    self.placement_rel_to(product),
+                    model.createIfcAxis2Placement3D(
+                        model.createIfcCartesianPoint((0.0, 0.0, 0.0))
+                    ),
+                )
+
+        def depth(product):
+            local_placement = product.ObjectPlacement
+            num = 0
+            while local_placement.PlacementRelTo is not None:
+                local_placement = local_placement.PlacementRelTo
+                num += 1
+            return num
+
+        # parents before children, placements are written once
+        new_worlds = {}
+        for product, matrix in sorted(worlds.values(), key=lambda p: depth(p[0])):
+            parent = product.ObjectPlacement.PlacementRelTo
+            if parent is None:
+                parent_matrix = np.eye(4)
+            elif parent.id() in new_worlds:
+                parent_matrix = new_worlds[parent.id()]
+            else:
+                parent_matrix = self.world_matrix(parent)
+            self.updater.set_relative_placement(
+                product, np.linalg.inv(parent_matrix) @ matrix
+            )
+            new_worlds[product.ObjectPlacement.id()] = matrix
+            # openings keep their placement relative to the moved host
+            for referencing in product.ObjectPlacement.ReferencedByPlacements:
+                for feature in referencing.PlacesObject:
+                    if feature.is_a("IfcFeatureElement") and feature.id() not in worlds:
+                        new_worlds[referencing.id()] = matrix @ (
+                            placement.get_axis2placement(referencing.RelativePlacement)
+                        )
+        num_written = len(worlds)
+        self.targets = {}
+        self.worlds = {}
+        return num_written
@@ -0,0 +1,429 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+import asyncio
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+import ifcopenshell
+from openbimxd.ifcupdate.batchupdate import BatchUpdateIfcObjects
+from openbimxd.ifcupdate.journal import UpdateJournal
+from openbimxd.ifcupdate.transaction import UpdateTransaction
+
+
+class UpdateService:
+    """
+    An asyncio service that accepts pose and status updates of IFC objects from an
+    in-process queue or a local TCP socket. Updates to the same GlobalId between
+    two flushes are coalesced, a background writer applies them to the model and
+    persists them at a fixed rate.
+
+    An update is a dict, all keys except guid are optional:
+        {"guid": "34tooC1TvAbQnDhok8tUWM", "origin": [5.0, 2.0, 0.0], "angle": 90.0,
+        "material": "CLT", "properties": {"PSet_Robot": {"battery": 0.82}}}
+
+    Attributes:
+        model: IFC model the updates are applied to
+        journal: optional, UpdateJournal the flushed updates are recorded to
+        output_path (str): optional, without journal the model is written to this path
+        flush_interval (float): seconds between two flushes
+    """
+
+    def __init__(
+        self,
+        model: ifcopenshell.file,
+        journal=None,
+        output_path=None,
+        flush_interval=1.0,
+        max_queue=10000,
+    ) -> None:
+        """Initialize UpdateService.
+
+        Args:
+            model (ifcopenshell.file): IFC model. With a journal, open it using
+                journal.open_model()
+            journal (UpdateJournal, optional): records flushed updates as deltas.
+                Defaults to None.
+            output_path (str, optional): without journal, the model is written to
+                this path on every flush. Defaults to None, not persisted.
+            flush_interval (float, optional): seconds between two flushes.
+                Defaults to 1.0.
+            max_queue (int, optional): queue size, submit() waits when the queue is
+                full. Defaults to 10000.
+        """
+        self.model = model
+        self.journal = journal
+        self.output_path = output_path
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.updater = BatchUpdateIfcObjects(model)
+        # GlobalId -> coalesced update, applied on the next flush
+        self.pending = {}
+        self.tasks = []
+        self.server = None
+        self.stopping = asyncio.Event()
+
+        self.received = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.applied = 0
+        self.flushes = 0
+        self.failed = 0
+        self.last_flush_s = 0.0
+        # seconds from submit to persisted, of the most recent updates
+        self.latencies = deque(maxlen=10000)
+
+    async def start(self, host="127.0.0.1", port=None) -> None:
+        """Start the consumer and the background writer, optionally a TCP server
+        accepting one JSON update per line.
+
+        Args:
+            host (str, optional): host of the socket. Defaults to "127.0.0.1".
+            port (int, optional): port of the socket. Defaults to None, no socket.
+        """
+        self.stopping.clear()
+        self.tasks.append(asyncio.create_task(self.consume()))
+        self.tasks.append(asyncio.create_task(self.flush_periodically()))
+        if port is not None:
+            self.server = await asyncio.start_server(self.handle_client, host, port)
+            print(f"Update service listening on {host}:{port}")
+
+    async def stop(self) -> None:
+        """Process the queued updates, flush them and stop the service"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.queue.join()
+        # let a running flush finish instead of cancelling it
+        self.stopping.set()
+        consumer, writer = self.tasks
+        await writer
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        self.tasks = []
+        await self.flush()
+
+    @staticmethod
+    def is_number(value) -> bool:
+        """Check whether a decoded JSON value is a finite number"""
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        return bool(np.isfinite(value))
+
+    @staticmethod
+    def validate(update) -> str:
+        """Check the shape of an update before it is queued.
+
+        Args:
+            update: decoded update
+
+        Returns:
+            str: reason the update is invalid, None if it is valid
+        """
+        if not isinstance(update, dict):
+            return "update is not an object"
+        if not isinstance(update.get("guid"), str):
+            return "guid is missing or not a string"
+        if "origin" in update:
+            origin = update.get("origin")
+            if not isinstance(origin, (list, tuple)) or len(origin) != 3:
+                return "origin is not a list of 3 numbers"
+            if not all(UpdateService.is_number(value) for value in origin):
+                return "origin is not a list of 3 numbers"
+        if "angle" in update and not UpdateService.is_number(update.get("angle")):
+            return "angle is not a number"
+        if "material" in update and not isinstance(update.get("material"), str):
+            return "material is not a string"
+        properties = update.get("properties", {})
+        if not isinstance(properties, dict) or not all(
+            isinstance(pset_dict, dict) for pset_dict in properties.values()
+        ):
+            return "properties is not an object of property set objects"
+        return None
+
+    async def submit(self, update: dict) -> None:
+        """Submit an update, waits while the queue is full.
+
+        Args:
+            update (dict): update of one object, see class description
+
+        Raises:
+            ValueError: if the update is invalid
+        """
+        reason = self.validate(update)
+        if reason is not None:
+            raise ValueError(f"Invalid update, {reason}")
+        await self.queue.put((time.perf_counter(), update))
+
+    def submit_nowait(self, update: dict) -> bool:
+        """Submit an update without waiting, drops it if the queue is full.
+
+        Args:
+            update (dict): update of one object, see class description
+
+        Returns:
+            bool: False if the update was dropped
+
+        Raises:
+            ValueError: if the update is invalid
+        """
+        reason = self.validate(update)
+        if reason is not None:
+            raise ValueError(f"Invalid update, {reason}")
+        try:
+            self.queue.put_nowait((time.perf_counter(), update))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    async def handle_client(self, reader, writer) -> None:
+        """Read JSON lines updates from a socket client"""
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                update = json.loads(line)
+            except json.JSONDecodeError:
+                self.rejected += 1
+                print(f"Invalid update, passing: {line[:80]}")
+                continue
+            reason = self.validate(update)
+            if reason is not None:
+                self.rejected += 1
+                print(f"Invalid update, {reason}, passing: {line[:80]}")
+                continue
+            await self.submit(update)
+        writer.close()
+
+    async def consume(self) -> None:
+        """Coalesce queued updates into the pending updates"""
+        while True:
+            submitted, update = await self.queue.get()
+            self.received += 1
+            # a failing update must not stop the consumer, stop() waits on join()
+            try:
+                self.coalesce(submitted, update)
+            except Exception as e:
+                self.rejected += 1
+                print(f"Invalid update, passing: {e}")
+            finally:
+                self.queue.task_done()
+
+    def coalesce(self, submitted: float, update: dict) -> None:
+        """Merge an update into the pending update of the same GlobalId. Location
+        and material are overwritten, properties are merged per property set."""
+        guid = update.get("guid")
+        pending = self.pending.get(guid)
+        if pending is None:
+            pending = {"guid": guid, "submitted": submitted, "properties": {}}
+            self.pending[guid] = pending
+        else:
+            self.coalesced += 1
+        if "origin" in update:
+            pending["origin"] = update.get("origin")
+            pending["angle"] = update.get("angle", 0.0)
+        if "material" in update:
+            pending["material"] = update.get("material")
+        for pset_name, pset_dict in update.get("properties", {}).items():
+            pending["properties"].setdefault(pset_name, {}).update(pset_dict)
+
+    async def flush_periodically(self) -> None:
+        """Flush the pending updates every flush_interval seconds"""
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Apply and persist the pending updates in a worker thread, so the event
+        loop keeps accepting updates meanwhile."""
+        if len(self.pending) == 0:
+            return
+        pending = self.pending
+        self.pending = {}
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            applied = await loop.run_in_executor(
+                None, self.apply, list(pending.values())
+            )
+        except Exception as e:
+            self.failed += len(pending)
+            print(f"Flush of {len(pending)} updates failed: {e}")
+            return
+        now = time.perf_counter()
+        self.last_flush_s = now - start
+        self.flushes += 1
+        self.applied += len(applied)
+        self.failed += len(pending) - len(applied)
+        self.latencies.extend(now - u.get("submitted") for u in applied)
+
+    def apply(self, updates: list) -> list:
+        """Apply coalesced updates to the model and persist them. Updates of
+        GlobalIds not in the model are skipped. The updates are applied in one
+        transaction, if it fails they are retried one by one in own transactions,
+        so a failing update does not discard the others.
+
+        Args:
+            updates (list): coalesced updates
+
+        Returns:
+            list: applied updates
+        """
+        known = []
+        for update in updates:
+            try:
+                self.updater.get_objects([update.get("guid")])
+            except KeyError as e:
+                print(f"Update failed, passing: {e.args[0]}")
+                continue
+            known.append(update)
+        try:
+            self.apply_transaction(known)
+            applied = known
+        except Exception as e:
+            print(f"Flush of {len(known)} updates failed, retrying one by one: {e}")
+            applied = []
+            for update in known:
+                try:
+                    self.apply_transaction([update])
+                except Exception as e:
+                    print(f"Update of {update.get('guid')} failed, passing: {e}")
+                    continue
+                applied.append(update)
+        if len(applied) > 0:
+            self.persist(applied)
+        return applied
+
+    def apply_transaction(self, updates: list) -> None:
+        """Apply updates to the model in one transaction. If an update fails, all
+        updates of the transaction are rolled back.
+
+        Args:
+            updates (list): coalesced updates
+        """
+        with UpdateTransaction(self.model, self.updater) as transaction:
+            moved = [u for u in updates if "origin" in u]
+            if len(moved) > 0:
+                transaction.update_locations(
+                    [u.get("guid") for u in moved],
+                    np.asarray([u.get("origin") for u in moved], dtype=float),
+                    np.asarray([u.get("angle") for u in moved], dtype=float),
+                )
+            for update in updates:
+                guid = update.get("guid")
+                if "material" in update:
+                    transaction.assign_material(guid, update.get("material"))
+                for pset_name, pset_dict in update.get("properties").items():
+                    transaction.update_properties([guid], pset_name, [pset_dict])
+
+    def persist(self, updates: list) -> None:
+        """Record applied updates to the journal or write the model.
+
+        Args:
+            updates (list): applied updates
+        """
+        if self.journal is not None:
+            for update in updates:
+                guid = update.get("guid")
+                if "origin" in update:
+                    self.journal.record_location(
+                        guid, update.get("origin"), update.get("angle")
+                    )
+                if "material" in update:
+                    self.journal.record_material(guid, update.get("material"))
+                for pset_name, pset_dict in update.get("properties").items():
+                    self.journal.record_property(guid, pset_name, pset_dict)
+            self.journal.flush()
+            if self.journal.needs_compaction():
+                self.journal.compact(self.model)
+        elif self.output_path is not None:
+            self.model.write(self.output_path)
+
+    def metrics(self) -> dict:
+        """Get backpressure and latency metrics.
+
+        Returns:
+            dict: counters, queue depth and submit to persisted latencies in ms
+        """
+        latencies = np.asarray(self.latencies) * 1000
+        metrics = {
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "applied": self.applied,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "pending": len(self.pending),
+            "last_flush_ms": 1000 * self.last_flush_s,
+            "latency_p50_ms": None,
+            "latency_p95_ms": None,
+            "latency_max_ms": None,
+        }
+        if latencies.shape[0] > 0:
+            metrics["latency_p50_ms"] = float(np.percentile(latencies, 50))
+            metrics["latency_p95_ms"] = float(np.percentile(latencies, 95))
+            metrics["latency_max_ms"] = float(latencies.max())
+        return metrics
+
+
+async def run_service(model_path: str, port: int, flush_interval=1.0) -> None:
+    """Run an update service with a journal for a model until cancelled.
+
+    Args:
+        model_path (str): path to the base IFC file
+        port (int): port of the local TCP socket
+        flush_interval (float, optional): seconds between two flushes. Defaults to 1.0.
+    """
+    journal = UpdateJournal(model_path)
+    service = UpdateService(
+        journal.open_model(), journal=journal, flush_interval=flush_interval
+    )
+    await service.start(port=port)
+    try:
+        while True:
+            await asyncio.sleep(10.0)
+            print(service.metrics())
+    finally:
+        await service.stop()
+        journal.close()
+
+
+def main():
+    asyncio.run(run_service("baubot_demo.ifc", 8765))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+import numpy as np
+
+import ifcopenshell
+from ifcopenshell.util import element
+from ifcopenshell.api import run
+
+from openbimxd.ifcmaterial.ifcmaterial import MaterialRegistry
+from openbimxd.ifcupdate.batchupdate import BatchUpdateIfcObjects
+
+
+class UpdateTransaction:
+    """
+    A class to update many IFC objects all or nothing. Every edit records its
+    inverse operation, on failure the inverse operations are applied in reverse
+    order, so the in-memory model is restored without reopening the file.
+
+    Use it as context manager, it commits on success and rolls back on an
+    exception:
+        with UpdateTransaction(model) as transaction:
+            transaction.update_locations(guids, origins, angles)
+            transaction.assign_material(guid, "CLT")
+
+    Attributes:
+        model: IFC model, open it using ifcopenshell.open()
+        updater: BatchUpdateIfcObjects applying the edits
+    """
+
+    def __init__(self, model: ifcopenshell.file, updater=None) -> None:
+        """Initialize UpdateTransaction.
+
+        Args:
+            model (ifcopenshell.file): IFC model
+            updater (BatchUpdateIfcObjects, optional): updater of the model, reuse
+                it to keep its cached handles. Defaults to None, a new one.
+        """
+        self.model = model
+        if updater is None:
+            updater = BatchUpdateIfcObjects(model)
+        self.updater = updater
+        # inverse operations, applied in reverse order on rollback
+        self.undo = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def commit(self) -> None:
+        """Keep all edits of the transaction"""
+        self.undo = []
+
+    def rollback(self) -> None:
+        """Revert all edits of the transaction"""
+        num_ops = len(self.undo)
+        while self.undo:
+            self.undo.pop()()
+        print(f"Rolled back {num_ops} edits")
+
+    def update_locations(self, guids, origins: np.ndarray, angles: np.ndarray) -> None:
+        """Update the location and angle of many objects, see
+        BatchUpdateIfcObjects.update_locations().
+
+        Args:
+            guids (list): GlobalIds of the objects, length n
+            origins (np.ndarray): new origins in world coordinates in m, shape (n, 3)
+            angles (np.ndarray): angles for rotation in degrees, shape (n, )
+        """
+        for obj in self.updater.get_objects(guids):
+            if obj.ObjectPlacement is None:
+                self.undo.append(lambda obj=obj: setattr(obj, "ObjectPlacement", None))
+                continue
+            point, axis, ref_direction = self.updater.get_handles(obj)
+            old = (
+                point.Coordinates,
+                axis.DirectionRatios,
+                ref_direction.DirectionRatios,
+            )
+
+            def restore(point=point, axis=axis, ref_direction=ref_direction, old=old):
+                point.Coordinates = old[0]
+                axis.DirectionRatios = old[1]
+                ref_direction.DirectionRatios = old[2]
+
+            self.undo.append(restore)
+        self.updater.update_locations(guids, origins, angles)
+
+    def get_material(self, material):
+        """Get an IfcMaterial by name from the MaterialRegistry of the model"""
+        if not isinstance(material, str):
+            return material
+        registry = MaterialRegistry.for_model(self.model)
+        return registry.get(material, create=False)
+
+    def assign_material(self, guid: str, material) -> None:
+        """Assign an IfcMaterial to an object, replacing its material.
+
+        Args:
+            guid (str): GlobalId of the object
+            material (IfcMaterial | str): material or its name
+        """
+        obj = self.updater.get_objects([guid])[0]
+        material = self.get_material(material)
+        old = element.get_material(obj, should_inherit=False)
+        if old is None:
+            self.undo.append(
+                lambda: run("material.unassign_material", self.model, product=obj)
+            )
+        else:
+            if old.is_a("IfcMaterialLayerSetUsage"):
+                old_material = old.ForLayerSet
+            elif old.is_a("IfcMaterialProfileSetUsage"):
+                old_material = old.ForProfileSet
+            else:
+                old_material = old
+            # usage attributes e.g., LayerSetDirection or CardinalPoint
+            usage = {}
+            if old_material != old:
+                usage = old.get_info(recursive=False)
+                for name in ("id", "type", "ForLayerSet", "ForProfileSet"):
+                    usage.pop(name, None)
+
+            def restore(old_type=old.is_a(), old_material=old_material, usage=usage):
+                run(
+                    "material.assign_material",
+                    self.model,
+                    product=obj,
+                    type=old_type,
+                    material=old_material,
+                )
+                new_usage = element.get_material(obj, should_inherit=False)
+                for name, value in usage.items():
+                    setattr(new_usage, name, value)
+
+            self.undo.append(restore)
+        run(
+            "material.assign_material",
+            self.model,
+            product=obj,
+            type="IfcMaterial",
+            material=material,
+        )
+
+    def update_properties(self, guids, pset_name: str, pset_dicts) -> int:
+        """Update a property set of many objects, see
+        BatchUpdateIfcObjects.update_properties().
+
+        Args:
+            guids (list): GlobalIds of the objects, length n
+            pset_name (str): name of the property set
+            pset_dicts (list): dict of new property values per object, length n
+
+        Returns:
+            int: number of changed properties
+        """
+        objects = self.updater.get_objects(guids)
+        for obj, pset_dict in zip(objects, pset_dicts):
+            self.record_pset(obj, pset_name, pset_dict)
+        return self.updater.update_object_properties(objects, pset_name, pset_dicts)
+
+    def record_pset(self, obj, pset_name: str, pset_dict: dict) -> None:
+        """Record the inverse operations of a property set update of an object"""
+        key = (obj.id(), pset_name)
+        if key not in self.updater.psets:
+            rel, shared = self.updater.find_pset(obj, pset_name)
+            if shared is None or len(rel.RelatedObjects) > 1:
+                # the object gets a new property set, remove it and reattach the
+                # shared one
+                pset, _ = self.updater.get_pset_handle(obj, pset_name)
+
+                def remove(obj=obj, pset=pset, rel=rel):
+                    self.updater.psets.pop(key, None)
+                    run("pset.remove_pset", self.model, product=obj, pset=pset)
+                    if rel is not None:
+                        rel.RelatedObjects = list(rel.RelatedObjects) + [obj]
+
+                self.undo.append(remove)
+                return
+        pset, properties = self.updater.get_pset_handle(obj, pset_name)
+        for name in pset_dict:
+            prop = properties.get(name)
+            if prop is None:
+                self.undo.append(
+                    lambda pset=pset, name=name, properties=properties: (
+                        self.remove_property(pset, properties, name)
+                    )
+                )
+                continue
+            old = prop.NominalValue
+            if old is not None:
+                old = (old.is_a(), old.wrappedValue)
+
+            def restore(prop=prop, old=old):
+                if old is None:
+                    prop.NominalValue = None
+                else:
+                    prop.NominalValue = self.model.create_entity(*old)
+
+            self.undo.append(restore)
+
+    def remove_property(self, pset, properties: dict, name: str) -> None:
+        """Remove a property added to a property set in the transaction"""
+        prop = properties.pop(name, None)
+        if prop is None:
+            prop = self.updater.single_values(pset).get(name)
+        if prop is None:
+            return
+        pset.HasProperties = [p for p in pset.HasProperties if p != prop]
+        self.model.remove(prop)
@@ -1,9 +1,12 @@
 import json
+import multiprocessing
+
 import numpy as np
 
 import ifcopenshell
 import ifcopenshell.geom
 import ifcopenshell.util.placement
+import ifcopenshell.util.unit
 import ifcopenshell.util as util
 
 from pystruct3d.bbox import bbox
@@ -14,14 +17,20 @@ class IfcConvertOpening:
         self.ifc_file = ifc_file
         self.ifc = ifcopenshell.open(ifc_file)
         self.ifc_walls = self.ifc.by_type("IfcWall")
-        self.ifc_wall = self.ifc_walls[1]
-        self.data_dict = {
-            "IFC file": self.ifc_file,
-            "Wall name": self.ifc_wall.Name,
-            "Wall ID": self.ifc_wall.GlobalId,
-        }
+        self.data_dict = {"IFC file": self.ifc_file}
+        self.unit_scale = ifcopenshell.util.unit.calculate_unit_scale(self.ifc)
+        # wall id -> wall location, computed once per wall
+        self.wall_placements = {}
+
+    @property
+    def ifc_wall(self):
+        """The wall of get_parameters(), only batch extraction works without it"""
+        return self.ifc_walls[1]
 
     def get_parameters(self):
+        self.data_dict.update(
+            {"Wall name": self.ifc_wall.Name, "Wall ID": self.ifc_wall.GlobalId}
+        )
         wall_placement = ifcopenshell.util.placement.get_local_placement(
             self.ifc_wall.ObjectPlacement
         )[:, 3][:3]
@@ -58,6 +67,246 @@ class IfcConvertOpening:
         print(self.data_dict)
         return self
 
+    def opening_index(self) -> dict:
+        """Index the openings of all walls in one pass over IfcRelVoidsElement.
+
+        Returns:
+            dict: opening id -> host IfcWall
+        """
+        hosts = {}
+        for rel in self.ifc.by_type("IfcRelVoidsElement"):
+            if rel.RelatingBuildingElement.is_a("IfcWall"):
+                hosts[rel.RelatedOpeningElement.id()] = rel.RelatingBuildingElement
+        return hosts
+
+    @staticmethod
+    def profile_corners(profile) -> np.ndarray:
+        """Get the corner points of a rectangle or polygon profile in its own frame.
+
+        Args:
+            profile (IfcProfileDef): swept area of an extrusion
+
+        Returns:
+            np.ndarray: corner points in project units, shape (n, 2), None if the
+                profile is neither a rectangle nor a polygon
+        """
+        if profile.is_a("IfcRectangleProfileDef"):
+            corners = np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5]])
+            corners = corners * (profile.XDim, profile.YDim)
+            position = profile.Position
+            if position is None:
+                return corners
+            x_axis = np.array([1.0, 0.0])
+            if position.RefDirection is not None:
+                x_axis = np.asarray(position.RefDirection.DirectionRatios[:2])
+                x_axis = x_axis / np.linalg.norm(x_axis)
+            rotation = np.array([x_axis, (-x_axis[1], x_axis[0])]).T
+            return corners @ rotation.T + position.Location.Coordinates[:2]
+        if not profile.is_a("IfcArbitraryClosedProfileDef"):
+            return None
+        curve = profile.OuterCurve
+        if curve.is_a("IfcPolyline"):
+            return np.asarray([p.Coordinates[:2] for p in curve.Points])
+        # arcs bulge beyond their points, only straight segments are supported
+        if curve.is_a("IfcIndexedPolyCurve") and all(
+            segment.is_a("IfcLineIndex") for segment in curve.Segments or []
+        ):
+            return np.asarray(curve.Points.CoordList)[:, :2]
+        return None
+
+    def solid_corners(self, item, matrix: np.ndarray) -> np.ndarray:
+        """Get the corner points of an extruded solid without tessellation.
+
+        Args:
+            item (IfcRepresentationItem): item of a body representation
+            matrix (np.ndarray): placement of the item in the product frame
+
+        Returns:
+            np.ndarray: corner points in the product frame in project units,
+                shape (2n, 3), None if the item is not supported
+        """
+        if item.is_a("IfcMappedItem"):
+            target = item.MappingTarget
+            source = item.MappingSource
+            if (
+                target.Axis1 or target.Axis2 or target.Scale not in (None, 1.0)
+            ) or not source.MappingOrigin.is_a("IfcAxis2Placement3D"):
+                return None
+            if target.is_a("IfcCartesianTransformationOperator3D") and target.Axis3:
+                return None
+            translation = np.eye(4)
+            translation[: len(target.LocalOrigin.Coordinates), 3] = (
+                target.LocalOrigin.Coordinates
+            )
+            matrix = (
+                matrix
+                @ translation
+                @ ifcopenshell.util.placement.get_axis2placement(source.MappingOrigin)
+            )
+            corners = [
+                self.solid_corners(mapped, matrix)
+                for mapped in source.MappedRepresentation.Items
+            ]
+            if any(c is None for c in corners):
+                return None
+            return np.concatenate(corners)
+        if not item.is_a("IfcExtrudedAreaSolid"):
+            return None
+        profile = self.profile_corners(item.SweptArea)
+        if profile is None:
+            return None
+        if item.Position is not None:
+            matrix = matrix @ ifcopenshell.util.placement.get_axis2placement(
+                item.Position
+            )
+        direction = np.asarray(item.ExtrudedDirection.DirectionRatios, dtype=float)
+        direction = direction / np.linalg.norm(direction) * item.Depth
+        bottom = np.column_stack((profile, np.zeros(len(profile))))
+        corners = np.concatenate((bottom, bottom + direction))
+        return corners @ matrix[:3, :3].T + matrix[:3, 3]
+
+    def extrusion_parameters(self, opening):
+        """Compute the size and yaw of an opening from the parameters of its
+        extruded solids, without tessellation. The size is the extent of the solids
+        in the frame of the opening placement, the yaw the direction of its X axis.
+
+        Args:
+            opening (IfcOpeningElement): opening with body representation
+
+        Returns:
+            dict: yaw in degrees and length, width and height in m, None if the
+                body is not made of extrusions of rectangles or polygons
+        """
+        if opening.Representation is None:
+            return None
+        items = [
+            item
+            for representation in opening.Representation.Representations
+            if representation.RepresentationIdentifier in ("Body", None)
+            for item in representation.Items
+        ]
+        if len(items) == 0:
+            return None
+        corners = [self.solid_corners(item, np.eye(4)) for item in items]
+        if any(c is None for c in corners):
+            return None
+        extent = np.ptp(np.concatenate(corners), axis=0) * self.unit_scale
+        return self.local_parameters(opening, extent)
+
+    @staticmethod
+    def local_parameters(opening, extent: np.ndarray) -> dict:
+        """Build the parameters of an opening from its extent in the frame of the
+        opening placement, the yaw is the direction of the placement X axis.
+
+        Args:
+            opening (IfcOpeningElement): opening
+            extent (np.ndarray): extent along the placement axes in m, shape (3, )
+
+        Returns:
+            dict: yaw in degrees and length, width and height in m
+        """
+        x_axis = ifcopenshell.util.placement.get_local_placement(
+            opening.ObjectPlacement
+        )[:3, 0]
+        return {
+            "Yaw orientation": float(np.degrees(np.arctan2(x_axis[1], x_axis[0]))),
+            "Length": float(extent[0]),
+            "Width": float(extent[1]),
+            "Height": float(extent[2]),
+        }
+
+    def opening_record(self, wall, opening, parameters: dict, method: str) -> dict:
+        """Build the record of an opening, distances are between the placements
+        of opening and wall.
+
+        Args:
+            wall (IfcWall): host wall
+            opening (IfcOpeningElement): opening
+            parameters (dict): yaw, length, width and height of the opening
+            method (str): "extrusion" or "tessellation"
+
+        Returns:
+            dict: record like get_parameters()
+        """
+        wall_placement = self.wall_placements.get(wall.id())
+        if wall_placement is None:
+            wall_placement = ifcopenshell.util.placement.get_local_placement(
+                wall.ObjectPlacement
+            )[:, 3][:3]
+            self.wall_placements[wall.id()] = wall_placement
+        child_placement = ifcopenshell.util.placement.get_local_placement(
+            opening.ObjectPlacement
+        )[:, 3][:3]
+        orig_distances = (child_placement - wall_placement) * self.unit_scale
+        return {
+            "IFC file": self.ifc_file,
+            "Wall name": wall.Name,
+            "Wall ID": wall.GlobalId,
+            "Opening": {
+                "ID": opening.GlobalId,
+                "X distance": float(orig_distances[0]),
+                "Y distance": float(orig_distances[1]),
+                "Z distance": float(orig_distances[2]),
+                **parameters,
+                "Method": method,
+            },
+        }
+
+    def iter_parameters(self):
+        """Extract the parameters of every opening of every wall. Sizes and yaw are
+        computed from the extrusion parameters, openings with other geometry are
+        tessellated by the multi-threaded geometry iterator afterwards, in the frame
+        of the opening placement. All values are in m.
+
+        Yields:
+            dict: record of one opening with its wall, like get_parameters()
+        """
+        hosts = self.opening_index()
+        remaining = []
+        for opening_id, wall in hosts.items():
+            opening = self.ifc.by_id(opening_id)
+            parameters = self.extrusion_parameters(opening)
+            if parameters is None:
+                remaining.append(opening)
+                continue
+            yield self.opening_record(wall, opening, parameters, "extrusion")
+        if len(remaining) == 0:
+            return
+        # vertices in the frame of the opening placement, in m
+        settings = ifcopenshell.geom.settings()
+        iterator = ifcopenshell.geom.iterator(
+            settings, self.ifc, multiprocessing.cpu_count(), include=remaining
+        )
+        if not iterator.initialize():
+            return
+        while True:
+            shape = iterator.get()
+            opening = self.ifc.by_id(shape.id)
+            verts = np.asarray(shape.geometry.verts).reshape(-1, 3)
+            parameters = self.local_parameters(opening, np.ptp(verts, axis=0))
+            yield self.opening_record(
+                hosts[shape.id], opening, parameters, "tessellation"
+            )
+            if not iterator.next():
+                break
+
+    def to_jsonl(self, path=None):
+        """Stream the parameters of all openings of all walls to a JSON lines
+        file, one opening per line.
+
+        Args:
+            path (str, optional): Defaults to None, <ifc file>_openings.jsonl.
+        """
+        if path is None:
+            path = f"{self.ifc_file[:-4]}_openings.jsonl"
+        num_openings = 0
+        with open(path, "w") as json_file:
+            for record in self.iter_parameters():
+                json_file.write(json.dumps(record) + "\n")
+                num_openings += 1
+        print(f"Wrote {num_openings} openings to {path}")
+        return self
+
     def to_json(self):
         json_data = json.dumps(self.data_dict)
 
@@ -67,8 +316,244 @@ class IfcConvertOpening:
         return self
 
 
+class DemolitionExporter(IfcConvertOpening):
+    """Export the demolition inventory of a whole model: every element with its
+    storey, materials, quantities, property sets and openings. Relationships are
+    indexed once, materials and property sets shared by many elements are
+    converted once and cached, records are written one per line as they are built.
+    """
+
+    # openings are reported with their host element
+    SKIPPED_CLASSES = ("IfcFeatureElementSubtraction",)
+    # quantities converted to SI units, others are kept in project units
+    QUANTITY_UNITS = {
+        "IfcQuantityLength": "LENGTHUNIT",
+        "IfcQuantityArea": "AREAUNIT",
+        "IfcQuantityVolume": "VOLUMEUNIT",
+    }
+
+    def __init__(self, ifc_file) -> None:
+        super().__init__(ifc_file)
+        # quantity class -> scale of its project unit to m, m2 or m3
+        self.quantity_scales = {
+            ifc_class: ifcopenshell.util.unit.calculate_unit_scale(self.ifc, unit_type)
+            for ifc_class, unit_type in self.QUANTITY_UNITS.items()
+        }
+        # relating entity id -> converted record, shared by many elements
+        self.material_cache = {}
+        self.definition_cache = {}
+        self.index()
+
+    def index(self) -> None:
+        """Map element ids to their relationships in one pass per relationship
+        class, instead of walking the inverses of every element.
+        """
+        self.materials = {}
+        for rel in self.ifc.by_type("IfcRelAssociatesMaterial"):
+            for obj in rel.RelatedObjects:
+                self.materials[obj.id()] = rel.RelatingMaterial
+        self.definitions = {}
+        for rel in self.ifc.by_type("IfcRelDefinesByProperties"):
+            for obj in rel.RelatedObjects:
+                self.definitions.setdefault(obj.id(), []).append(
+                    rel.RelatingPropertyDefinition
+                )
+        self.types = {}
+        for rel in self.ifc.by_type("IfcRelDefinesByType"):
+            for obj in rel.RelatedObjects:
+                self.types[obj.id()] = rel.RelatingType
+        self.storeys = {}
+        for rel in self.ifc.by_type("IfcRelContainedInSpatialStructure"):
+            for obj in rel.RelatedElements:
+                self.storeys[obj.id()] = rel.RelatingStructure.Name
+        self.openings = {}
+        for rel in self.ifc.by_type("IfcRelVoidsElement"):
+            self.openings.setdefault(rel.RelatingBuildingElement.id(), []).append(
+                rel.RelatedOpeningElement
+            )
+
+    def material_record(self, material) -> list:
+        """Convert a material definition to a list of materials, layer thicknesses
+        in m. Cached per material definition.
+
+        Args:
+            material (IfcMaterialSelect): relating material of an association
+
+        Returns:
+            list: dicts with name, category and thickness of each material
+        """
+        record = self.material_cache.get(material.id())
+        if record is not None:
+            return record
+        if material.is_a("IfcMaterialLayerSetUsage"):
+            record = self.material_record(material.ForLayerSet)
+        elif material.is_a("IfcMaterialProfileSetUsage"):
+            record = self.material_record(material.ForProfileSet)
+        elif material.is_a("IfcMaterialLayerSet"):
+            record = [
+                {
+                    **self.material_record(layer.Material)[0],
+                    "Thickness": float(layer.LayerThickness * self.unit_scale),
+                }
+                for layer in material.MaterialLayers
+                if layer.Material is not None
+            ]
+        elif material.is_a("IfcMaterialProfileSet"):
+            record = [
+                self.material_record(profile.Material)[0]
+                for profile in material.MaterialProfiles
+                if profile.Material is not None
+            ]
+        elif material.is_a("IfcMaterialConstituentSet"):
+            record = [
+                self.material_record(constituent.Material)[0]
+                for constituent in material.MaterialConstituents or []
+                if constituent.Material is not None
+            ]
+        elif material.is_a("IfcMaterialList"):
+            record = [self.material_record(m)[0] for m in material.Materials]
+        elif material.is_a("IfcMaterial"):
+            record = [
+                {"Name": material.Name, "Category": getattr(material, "Category", None)}
+            ]
+        else:
+            record = []
+        self.material_cache[material.id()] = record
+        return record
+
+    def definition_record(self, definition) -> tuple:
+        """Convert a property set or element quantity to a dict of values. Cached
+        per definition, lengths, areas and volumes are in m, m2 and m3.
+
+        Args:
+            definition (IfcPropertySetDefinition): definition of an element or type
+
+        Returns:
+            str: "Property sets" or "Quantities"
+            str: name of the definition
+            dict: property name -> value
+        """
+        record = self.definition_cache.get(definition.id())
+        if record is not None:
+            return record
+        values = {}
+        if definition.is_a("IfcElementQuantity"):
+            kind = "Quantities"
+            for quantity in definition.Quantities:
+                if quantity.is_a("IfcPhysicalSimpleQuantity"):
+                    scale = self.quantity_scales.get(quantity.is_a(), 1.0)
+                    values[quantity.Name] = quantity[3] * scale
+        else:
+            kind = "Property sets"
+            for prop in getattr(definition, "HasProperties", None) or []:
+                if prop.is_a("IfcPropertySingleValue"):
+                    value = prop.NominalValue
+                    values[prop.Name] = None if value is None else value.wrappedValue
+        record = (kind, definition.Name, values)
+        self.definition_cache[definition.id()] = record
+        return record
+
+    def element_record(self, element) -> dict:
+        """Build the inventory record of an element. Materials and property sets
+        of its type are used where the element has none of its own.
+
+        Args:
+            element (IfcElement): element to export
+
+        Returns:
+            dict: record of the element, its materials, quantities, property sets
+                and openings
+        """
+        element_type = self.types.get(element.id())
+        material = self.materials.get(element.id())
+        if material is None and element_type is not None:
+            material = self.materials.get(element_type.id())
+        record = {
+            "IFC file": self.ifc_file,
+            "ID": element.GlobalId,
+            "Class": element.is_a(),
+            "Name": element.Name,
+            "Type": None if element_type is None else element_type.Name,
+            "Storey": self.storeys.get(element.id()),
+            "Materials": [] if material is None else self.material_record(material),
+            "Quantities": {},
+            "Property sets": {},
+            "Openings": [],
+        }
+        definitions = self.definitions.get(element.id(), [])
+        if element_type is not None:
+            definitions = list(element_type.HasPropertySets or []) + definitions
+        # element definitions come last and override the ones of its type
+        for definition in definitions:
+            kind, name, values = self.definition_record(definition)
+            record[kind].setdefault(name, {}).update(values)
+        for opening in self.openings.get(element.id(), []):
+            parameters = self.extrusion_parameters(opening)
+            if parameters is None:
+                # rare, tessellate the opening on its own
+                parameters = self.tessellated_parameters(opening)
+            record["Openings"].append({"ID": opening.GlobalId, **parameters})
+        return record
+
+    def tessellated_parameters(self, opening) -> dict:
+        """Compute the size and yaw of an opening from its geometry tessellated in
+        the frame of the opening placement.
+
+        Args:
+            opening (IfcOpeningElement): opening with any representation
+
+        Returns:
+            dict: yaw in degrees and length, width and height in m
+        """
+        settings = ifcopenshell.geom.settings()
+        shape = ifcopenshell.geom.create_shape(settings, opening)
+        verts = np.asarray(shape.geometry.verts).reshape(-1, 3)
+        return {
+            **self.local_parameters(opening, np.ptp(verts, axis=0)),
+            "Method": "tessellation",
+        }
+
+    def iter_records(self):
+        """Walk all elements of the model in a single pass.
+
+        Yields:
+            dict: record of one element, see element_record()
+        """
+        for element in self.ifc.by_type("IfcElement"):
+            if any(element.is_a(c) for c in self.SKIPPED_CLASSES):
+                continue
+            yield self.element_record(element)
+
+    def write(self, path=None) -> int:
+        """Stream the inventory to a JSON lines file, one element per line, so
+        memory stays flat on large models.
+
+        Args:
+            path (str, optional): Defaults to None, <ifc file>_inventory.jsonl.
+
+        Returns:
+            int: number of exported elements
+        """
+        if path is None:
+            path = f"{self.ifc_file[:-4]}_inventory.jsonl"
+        num_elements = 0
+        with open(path, "w") as json_file:
+            for record in self.iter_records():
+                # values of other IFC types e.g., IfcLogical are written as strings
+                json_file.write(json.dumps(record, default=str) + "\n")
+                num_elements += 1
+        print(
+            f"Wrote {num_elements} elements to {path}, "
+            f"{len(self.material_cache)} materials and "
+            f"{len(self.definition_cache)} property sets converted"
+        )
+        return num_elements
+
+
 def main():
     IfcConvertOpening("AC20-FZK-Haus.ifc").get_parameters().to_json()
+    IfcConvertOpening("AC20-FZK-Haus.ifc").to_jsonl()
+    DemolitionExporter("AC20-FZK-Haus.ifc").write()
 
 
 if __name__ == "__main__":
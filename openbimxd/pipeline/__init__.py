@@ -0,0 +1,42 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+"""
+Turn reconstruction output into IFC files.
+
+MODULES / CLASSES
+    ingest / IngestPipeline
+        Streams element records (class, corner points, optional GUID, material and
+        property sets) from JSON lines or .npz files, validates and orders the boxes
+        in vectorized batches and feeds them to the BulkElementBuilder. Reports
+        elements per second and memory use.
+
+FUNCTIONS
+    read_jsonl / read_npz
+        Read element records in batches of arrays
+    order_boxes
+        Validate and order the corner points of many boxes at once
+    main
+        Command line interface, installed as openbimxd-ingest
+"""
@@ -0,0 +1,453 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import ifcopenshell
+import ifcopenshell.guid
+
+from openbimxd.elements.bulkbuilder import BulkElementBuilder
+from openbimxd.ifcfile.ifcfile import IfcModelBuilder
+from openbimxd.ifcmaterial.ifcmaterial import MaterialRegistry
+from openbimxd.telemetry.telemetry import Telemetry
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, memory use is not reported
+    resource = None
+
+ELEMENT_CLASSES = ("IfcWall", "IfcColumn", "IfcDoor")
+
+
+def read_jsonl(path: str, batch_size=10000):
+    """Read element records from a JSON lines file, one element per line e.g.,
+    {"class": "IfcWall", "corners": [[x, y, z], ...], "guid": "...",
+    "material": "CON01", "psets": {"Pset_WallCommon": {"FireRating": "F90"}}}.
+    guid, material and psets are optional. Malformed lines are kept as empty
+    records, so they are rejected with their record index.
+
+    Args:
+        path (str): path of the JSON lines file
+        batch_size (int, optional): records per batch. Defaults to 10000.
+
+    Yields:
+        dict: batch of classes, corners (n, 8, 3), guids, materials and psets
+    """
+    records = []
+    with open(path) as in_file:
+        for line_number, line in enumerate(in_file, 1):
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    record = None
+                if not isinstance(record, dict):
+                    print(f"Invalid record in line {line_number}: {line[:80]}")
+                    record = {}
+                records.append(record)
+            if len(records) == batch_size:
+                yield records_to_batch(records)
+                records = []
+    if len(records) > 0:
+        yield records_to_batch(records)
+
+
+def records_to_batch(records: list) -> dict:
+    """Convert element records to a batch of arrays, see read_jsonl()"""
+    corners = np.full((len(records), 8, 3), np.nan)
+    psets = [record.get("psets") for record in records]
+    for i, record in enumerate(records):
+        try:
+            points = np.asarray(record.get("corners", []), dtype=float)
+        except (TypeError, ValueError):
+            continue
+        # malformed boxes stay NaN and are rejected by order_boxes()
+        if points.shape == (8, 3) and isinstance(psets[i] or {}, dict):
+            corners[i] = points
+    return {
+        "classes": [record.get("class") for record in records],
+        "corners": corners,
+        "guids": [record.get("guid") for record in records],
+        "materials": [record.get("material") for record in records],
+        "psets": [p if isinstance(p, dict) else None for p in psets],
+    }
+
+
+def read_npz(path: str, batch_size=10000):
+    """Read element records from a .npz file with the arrays classes (n, ),
+    corners (n, 8, 3) and optionally guids (n, ), materials (n, ) and psets (n, )
+    as JSON strings. Empty strings are missing values.
+
+    Args:
+        path (str): path of the .npz file
+        batch_size (int, optional): records per batch. Defaults to 10000.
+
+    Yields:
+        dict: batch of classes, corners (n, 8, 3), guids, materials and psets
+    """
+    with np.load(path) as data:
+        corners = data["corners"]
+        num_records = corners.shape[0]
+        columns = {
+            name: data[name] if name in data.files else np.full(num_records, "")
+            for name in ("classes", "guids", "materials", "psets")
+        }
+    for start in range(0, num_records, batch_size):
+        stop = start + batch_size
+        batch = {
+            name: [str(value) or None for value in values[start:stop].tolist()]
+            for name, values in columns.items()
+        }
+        batch["psets"] = [json.loads(p) if p else None for p in batch["psets"]]
+        batch["corners"] = np.asarray(corners[start:stop], dtype=float)
+        yield batch
+
+
+def order_boxes(corners, min_size=0.01, tolerance=0.05) -> tuple:
+    """Validate and order the corner points of boxes like pystruct3d bbox
+    order_points(): corners 0, 1, 2, 3 are the bottom face counter-clockwise with
+    the longer edge from 0 to 1, corner 4 to 7 are above 0 to 3.
+
+    Args:
+        corners (np.ndarray): corner points in any order in m, shape (n, 8, 3)
+        min_size (float, optional): minimum length, width and height in m.
+            Defaults to 0.01.
+        tolerance (float, optional): maximum cosine between the bottom edges and
+            maximum height difference within a face in m. Defaults to 0.05.
+
+    Returns:
+        np.ndarray: ordered corner points, shape (n, 8, 3)
+        np.ndarray: valid boxes, shape (n, )
+    """
+    corners = np.asarray(corners, dtype=float).reshape((-1, 8, 3))
+    num_boxes = corners.shape[0]
+    valid = np.isfinite(corners).all(axis=(1, 2))
+    corners = np.where(valid[:, np.newaxis, np.newaxis], corners, 0.0)
+    # bottom and top face by height
+    by_height = np.argsort(corners[:, :, 2], axis=1, kind="stable")
+    corners = np.take_along_axis(corners, by_height[:, :, np.newaxis], axis=1)
+    bottom = corners[:, :4]
+    top = corners[:, 4:]
+    # bottom face counter-clockwise around its center
+    center = bottom.mean(axis=1, keepdims=True)
+    offsets = bottom - center
+    angles = np.arctan2(offsets[:, :, 1], offsets[:, :, 0])
+    bottom = np.take_along_axis(
+        bottom, np.argsort(angles, axis=1)[:, :, np.newaxis], axis=1
+    )
+    # start at the corner of a longer edge pointing in positive x direction
+    edges = np.roll(bottom, -1, axis=1) - bottom
+    lengths = np.linalg.norm(edges[:, :, :2], axis=2)
+    start = (lengths[:, 0] + lengths[:, 2] < lengths[:, 1] + lengths[:, 3]).astype(int)
+    direction = edges[np.arange(num_boxes), start]
+    backwards = (direction[:, 0] < 0) | ((direction[:, 0] == 0) & (direction[:, 1] < 0))
+    start += 2 * backwards
+    order = (start[:, np.newaxis] + np.arange(4)) % 4
+    bottom = np.take_along_axis(bottom, order[:, :, np.newaxis], axis=1)
+    # top corner above each bottom corner
+    distances = np.linalg.norm(
+        bottom[:, :, np.newaxis, :2] - top[:, np.newaxis, :, :2], axis=3
+    )
+    above = np.argmin(distances, axis=2)
+    valid &= (np.sort(above, axis=1) == np.arange(4)).all(axis=1)
+    top = np.take_along_axis(top, above[:, :, np.newaxis], axis=1)
+    ordered = np.concatenate((bottom, top), axis=1)
+
+    length_vectors = ordered[:, 1] - ordered[:, 0]
+    width_vectors = ordered[:, 3] - ordered[:, 0]
+    length = np.linalg.norm(length_vectors, axis=1)
+    width = np.linalg.norm(width_vectors, axis=1)
+    height = ordered[:, 4:, 2].mean(axis=1) - ordered[:, :4, 2].mean(axis=1)
+    valid &= (length >= min_size) & (width >= min_size) & (height >= min_size)
+    cosine = np.abs(np.sum(length_vectors * width_vectors, axis=1)) / np.maximum(
+        length * width, 1e-12
+    )
+    valid &= cosine <= tolerance
+    valid &= np.ptp(ordered[:, :4, 2], axis=1) <= tolerance
+    valid &= np.ptp(ordered[:, 4:, 2], axis=1) <= tolerance
+    return ordered, valid
+
+
+def max_memory_mb() -> float:
+    """Peak resident memory of the process in MB, None if not available"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class IngestPipeline:
+    """
+    A class to create IFC elements from batches of element records. Walls and
+    columns are created per batch, doors are created at the end, so that their host
+    walls can be found in all walls, see BulkElementBuilder.insert_doors(). If the
+    model streams, created elements are written to disk per batch with their
+    geometry released, see IfcModelBuilder.flush().
+
+    Attributes:
+        ifc_model : IfcModelBuilder object
+        bulk : BulkElementBuilder creating the elements
+        telemetry : Telemetry with the read, order, build and write stages
+        registry : MaterialRegistry of the model, materials by name
+        rejected (list): indices of the invalid records
+        unmatched (list): indices of the doors without host wall
+    """
+
+    def __init__(self, ifc_model, telemetry=None, min_size=0.01) -> None:
+        """Initialize IngestPipeline.
+
+        Args:
+            ifc_model (IfcModelBuilder): The IFC file the elements are added to
+            telemetry (Telemetry, optional): Defaults to None, a new Telemetry.
+            min_size (float, optional): minimum box dimension in m, see
+                order_boxes(). Defaults to 0.01.
+        """
+        self.ifc_model = ifc_model
+        self.bulk = BulkElementBuilder(ifc_model)
+        if telemetry is None:
+            telemetry = Telemetry("ingest", throughput_counter="elements")
+        self.telemetry = telemetry
+        self.min_size = min_size
+        self.registry = MaterialRegistry.for_model(ifc_model.model)
+        self.rejected = []
+        self.unmatched = []
+        self.num_records = 0
+        # door records wait for all walls, (record indices, batch)
+        self.pending_doors = []
+
+    def get_material(self, name: str):
+        """Get the IfcMaterial of a name, created on first use"""
+        if name is None:
+            return None
+        return self.registry.get(name)
+
+    def add_batch(self, batch: dict) -> None:
+        """Validate, order and create the elements of a batch.
+
+        Args:
+            batch (dict): classes, corners, guids, materials and psets, see
+                read_jsonl()
+        """
+        offset = self.num_records
+        self.num_records += len(batch["classes"])
+        with self.telemetry.stage("order"):
+            corners, valid = order_boxes(batch["corners"], self.min_size)
+            classes = np.asarray(batch["classes"], dtype=object)
+            valid &= np.isin(classes, ELEMENT_CLASSES)
+        self.rejected.extend((offset + np.flatnonzero(~valid)).tolist())
+        batch = dict(batch, corners=corners)
+        for ifc_class in ELEMENT_CLASSES:
+            indices = np.flatnonzero(valid & (classes == ifc_class))
+            if len(indices) == 0:
+                continue
+            if ifc_class == "IfcDoor":
+                self.pending_doors.append((offset + indices, take(batch, indices)))
+                continue
+            with self.telemetry.stage("build"):
+                self.create(ifc_class, take(batch, indices))
+        self.report()
+
+    def finish(self) -> None:
+        """Create the pending doors in their host walls"""
+        for indices, batch in self.pending_doors:
+            with self.telemetry.stage("build"):
+                _, unmatched = self.create("IfcDoor", batch)
+            self.unmatched.extend(indices[unmatched].tolist())
+        self.pending_doors = []
+        self.report()
+        if len(self.rejected) > 0:
+            print(f"Rejected {len(self.rejected)} invalid records: {self.rejected}")
+
+    def create(self, ifc_class: str, batch: dict) -> tuple:
+        """Create the elements of one class, grouped by material.
+
+        Args:
+            ifc_class (str): IfcWall, IfcColumn or IfcDoor
+            batch (dict): ordered and valid records of the class
+
+        Returns:
+            list: created elements in batch order
+            list: batch indices of the doors without host wall
+        """
+        products = [None] * len(batch["classes"])
+        unmatched = []
+        uids = [guid or ifcopenshell.guid.new() for guid in batch["guids"]]
+        groups = {}
+        for i, name in enumerate(batch["materials"]):
+            groups.setdefault(name, []).append(i)
+        for name, indices in groups.items():
+            self.bulk.ifc_material = self.get_material(name)
+            corners = batch["corners"][indices]
+            group_uids = [uids[i] for i in indices]
+            if ifc_class == "IfcWall":
+                created = self.bulk.add_walls(corners, uids=group_uids)
+            elif ifc_class == "IfcColumn":
+                created = self.bulk.add_columns(corners, uids=group_uids)
+            else:
+                created, group_unmatched = self.bulk.insert_doors(
+                    corners, uids=group_uids
+                )
+                self.bulk.assign_material(created)
+                unmatched.extend(indices[i] for i in group_unmatched)
+            for i, product in zip(indices, created):
+                products[i] = product
+        self.bulk.ifc_material = None
+        self.assign_psets(products, batch["psets"])
+        self.telemetry.count("elements", len(products))
+        if self.ifc_model.writer is not None:
+            # host lookup of doors uses the stored wall boxes, not the geometry
+            self.ifc_model.flush([p for p in products if p is not None])
+        return products, sorted(unmatched)
+
+    def assign_psets(self, products: list, psets: list) -> None:
+        """Assign the property sets of the records, products with the same property
+        set values share one property set.
+
+        Args:
+            products (list): IFC products
+            psets (list): property sets per product, name -> properties dict
+        """
+        groups = {}
+        for product, product_psets in zip(products, psets):
+            for name, properties in (product_psets or {}).items():
+                key = (name, json.dumps(properties, sort_keys=True))
+                groups.setdefault(key, (properties, []))[1].append(product)
+        for (name, _), (properties, group) in groups.items():
+            self.bulk.assign_pset(group, name, properties)
+
+    def report(self) -> dict:
+        """Emit and print a progress record with elements per second and memory"""
+        record = self.telemetry.emit(
+            "progress",
+            records=self.num_records,
+            elements=self.telemetry.counters.get("elements", 0),
+            per_second=round(self.telemetry.throughput(), 3),
+            max_memory_mb=max_memory_mb(),
+        )
+        memory = ""
+        if record["max_memory_mb"] is not None:
+            memory = f", {record['max_memory_mb']:.0f} MB peak memory"
+        print(
+            f"{record['records']} records, {record['elements']} elements, "
+            f"{record['per_second']:.0f} elements/s{memory}"
+        )
+        return record
+
+    def run(self, batches) -> None:
+        """Create the elements of all batches.
+
+        Args:
+            batches (iterable): batches of records, see read_jsonl() and read_npz()
+        """
+        batches = iter(batches)
+        while True:
+            with self.telemetry.stage("read"):
+                batch = next(batches, None)
+            if batch is None:
+                break
+            self.add_batch(batch)
+        self.finish()
+
+
+def take(batch: dict, indices) -> dict:
+    """Select records of a batch by index"""
+    return {
+        name: values[indices]
+        if isinstance(values, np.ndarray)
+        else [values[i] for i in indices]
+        for name, values in batch.items()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="openbimxd-ingest",
+        description="Create an IFC file from reconstructed element boxes.",
+    )
+    parser.add_argument("input", help="element records, .jsonl or .npz")
+    parser.add_argument("output", help="IFC file to write, .ifc or .ifczip")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--schema", default="IFC4")
+    parser.add_argument(
+        "--storeys", type=float, nargs="*", default=[], help="elevations in m"
+    )
+    parser.add_argument(
+        "--instancing-tolerance",
+        type=float,
+        default=None,
+        help="share the geometry of elements with the same dimensions, in m",
+    )
+    parser.add_argument(
+        "--deferred",
+        action="store_true",
+        help="emit containment and property sets once on write",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="write elements to disk per batch, so memory depends on the batch size",
+    )
+    parser.add_argument(
+        "--materials", help="material definitions to load first, .json or .csv"
+    )
+    parser.add_argument("--telemetry", help="JSON lines file for the telemetry")
+    parser.add_argument("--min-size", type=float, default=0.01, help="in m")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    telemetry = Telemetry(
+        "ingest", output=args.telemetry, throughput_counter="elements"
+    )
+    ifc_model = IfcModelBuilder(
+        args.output,
+        schema=args.schema,
+        stream=args.stream,
+        instancing_tolerance=args.instancing_tolerance,
+        deferred=args.deferred,
+    )
+    ifc_model.add_storeys(args.storeys)
+    if args.input.endswith(".npz"):
+        batches = read_npz(args.input, args.batch_size)
+    else:
+        batches = read_jsonl(args.input, args.batch_size)
+    pipeline = IngestPipeline(ifc_model, telemetry, args.min_size)
+    if args.materials is not None:
+        pipeline.registry.load(args.materials)
+    pipeline.run(batches)
+    with telemetry.stage("write"):
+        ifc_model.write()
+    telemetry.summary()
+    print(
+        f"Wrote {args.output} in {time.perf_counter() - start:.2f}s, "
+        f"{len(pipeline.rejected)} rejected records, "
+        f"{len(pipeline.unmatched)} doors without host wall"
+    )
+
+
+if __name__ == "__main__":
+    main()
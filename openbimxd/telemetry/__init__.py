@@ -0,0 +1,45 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+
+"""
+Measure where the time goes in long running batch jobs.
+
+CLASSES
+    Telemetry
+        Collects per-stage timers and counters, emits them as JSON lines records and
+        optionally profiles each stage with cProfile.
+
+FUNCTIONS
+    stage(self, name: str)
+        Context manager, times a stage and optionally profiles it
+    count(self, name: str, n=1) -> None
+        Increments a counter
+    progress(self, done: int, total: int) -> dict
+        Emits a progress record with the current items per second
+    emit(self, record_type: str, **fields) -> dict
+        Writes a structured record as a JSON line
+    summary(self) -> dict
+        Returns and emits the stage and throughput summary
+"""
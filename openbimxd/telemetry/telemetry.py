@@ -0,0 +1,186 @@
+# openbimxd - open source tools to interact with IFC files
+# Copyright (C) 2024, 2024 the HumanTech project
+# Main contributors: Fabian Kaufmann fabian.kaufmann@rptu.de
+#           Marius Schellen marius.schellen@rptu.de
+#           Mahdi Chamseddine mahdi.chamseddine@dfki.de
+#
+# This file is part of openbimxd
+#
+# openbimxd is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# openbimxd is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with openbimxd.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This project uses IfcOpenShell <https://blenderbim.org/>, all credits to
+# Dion Moult for his great work
+
+
+import cProfile
+import json
+import os
+import time
+from contextlib import contextmanager
+
+
+class Telemetry:
+    """
+    A class to collect per-stage timers, counters and throughput of a batch job.
+    Records are emitted as JSON lines, one JSON object per line.
+
+    Attributes:
+        run_name (str): name of the job, added to every record
+        output (str or file): optional, path or open file to append the records to
+        profile_dir (str): optional, directory to write one cProfile file per stage
+        throughput_counter (str): counter used for the items per second
+    """
+
+    def __init__(
+        self, run_name, output=None, profile_dir=None, throughput_counter="objects"
+    ) -> None:
+        """Initialize Telemetry.
+
+        Args:
+            run_name (str): name of the job, added to every record
+            output (str or file, optional): path or open file for the JSON lines
+                records. Defaults to None, records are only kept in memory.
+            profile_dir (str, optional): directory to write one cProfile stats file
+                per stage to. Defaults to None, no profiling.
+            throughput_counter (str, optional): counter to compute items per second
+                from. Defaults to "objects".
+        """
+        self.run_name = run_name
+        self.output = output
+        self.profile_dir = profile_dir
+        self.throughput_counter = throughput_counter
+        self.start = time.perf_counter()
+        self.timers = {}
+        self.calls = {}
+        self.counters = {}
+        self.profiles = {}
+        self.records = []
+        # cProfile does not support nested profilers, only the outer stage is profiled
+        self._profiling = False
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage. Repeated stages with the same name are accumulated.
+
+        Args:
+            name (str): name of the stage e.g., "assign_psets"
+        """
+        profile = None
+        if self.profile_dir is not None and not self._profiling:
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+            self._profiling = True
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] = self.timers.get(name, 0.0) + time.perf_counter() - start
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+
+    def count(self, name: str, n=1) -> None:
+        """Increment a counter.
+
+        Args:
+            name (str): name of the counter e.g., "objects"
+            n (int, optional): increment. Defaults to 1.
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def elapsed(self) -> float:
+        """Seconds since the telemetry was created"""
+        return time.perf_counter() - self.start
+
+    def throughput(self) -> float:
+        """Items of the throughput counter per second"""
+        elapsed = self.elapsed()
+        if elapsed == 0:
+            return 0.0
+        return self.counters.get(self.throughput_counter, 0) / elapsed
+
+    def emit(self, record_type: str, **fields) -> dict:
+        """Emit a structured record as JSON line.
+
+        Args:
+            record_type (str): type of the record e.g., "stage", "progress", "summary"
+            **fields: content of the record, needs to be JSON serializable
+
+        Returns:
+            dict: the record
+        """
+        record = {
+            "type": record_type,
+            "run": self.run_name,
+            "time": time.time(),
+            "elapsed_s": round(self.elapsed(), 6),
+        }
+        record.update(fields)
+        self.records.append(record)
+        if self.output is None:
+            return record
+        line = json.dumps(record) + "\n"
+        if isinstance(self.output, str):
+            with open(self.output, "a") as out_file:
+                out_file.write(line)
+        else:
+            self.output.write(line)
+            self.output.flush()
+        return record
+
+    def progress(self, done: int, total: int) -> dict:
+        """Emit a progress record with the current throughput.
+
+        Args:
+            done (int): processed items
+            total (int): total items
+
+        Returns:
+            dict: the record
+        """
+        return self.emit(
+            "progress",
+            done=done,
+            total=total,
+            per_second=round(self.throughput(), 3),
+        )
+
+    def summary(self) -> dict:
+        """Emit one record per stage and a summary record. Writes the cProfile stats
+        of each stage to profile_dir if profiling is enabled.
+
+        Returns:
+            dict: the summary record
+        """
+        for name, seconds in self.timers.items():
+            self.emit(
+                "stage",
+                stage=name,
+                calls=self.calls[name],
+                seconds=round(seconds, 6),
+                mean_ms=round(1000 * seconds / self.calls[name], 6),
+            )
+        if self.profile_dir is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            for name, profile in self.profiles.items():
+                profile.dump_stats(
+                    os.path.join(self.profile_dir, f"{self.run_name}_{name}.prof")
+                )
+        return self.emit(
+            "summary",
+            counters=self.counters,
+            stages={name: round(seconds, 6) for name, seconds in self.timers.items()},
+            per_second=round(self.throughput(), 3),
+        )
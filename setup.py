@@ -52,9 +52,9 @@ setup(
     # install_requires=install_requires,
     # dependency_links=dependency_links,
     ext_modules=ext_modules,
-    # entry_points={
-    #     "console_scripts": [
-    #         "datapipefs = datapipefs.cli.__main__:main",
-    #     ]
-    # },
+    entry_points={
+        "console_scripts": [
+            "openbimxd-ingest = openbimxd.pipeline.ingest:main",
+        ]
+    },
 )